@@ -0,0 +1,324 @@
+"""
+Checks run against a response once it arrives.
+
+Assertions are stored as (check, expected, description) rows, like params:
+
+    status              200, 2xx or a comma separated list of either
+    header <name>       the header's value, or empty to only require it
+    jsonpath <expr>     the first match, or empty to require any match
+    xpath <expr>        as jsonpath, for xml and html bodies
+    body                text the body must contain
+    latency             the most milliseconds the response may take
+    script              python code, failing when it raises
+
+Expected values starting with ~ are regular expressions searched for instead.
+
+They are evaluated in a pool of worker processes, so checks on large bodies
+don't hold the GIL of the ui. Scripts run in those workers with restricted
+builtins, no access to names starting with _, and only the json and re
+functions listed in SCRIPT_JSON and SCRIPT_RE. Workers that take longer than
+the pool's deadline, e.g. stuck in a regular expression that SIGALRM can't
+interrupt, are killed and replaced. That guards against mistakes, it is not
+a security boundary for untrusted code.
+"""
+import builtins
+import functools
+import json
+import logging
+import multiprocessing
+import re
+import threading
+import weakref
+from collections import namedtuple
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from types import CodeType, SimpleNamespace
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import filters
+from utils import get_content_type
+
+if TYPE_CHECKING:
+    import requests
+
+log = logging.getLogger(__name__)
+
+# Seconds a script may run before it fails
+SCRIPT_TIMEOUT = 2.0
+
+# Seconds a worker may take over the assertions of one response before it is killed
+DEADLINE = 10.0
+
+# Address space limit of each worker process, where supported
+WORKER_MEMORY_LIMIT = 2 * 1024 * 1024 * 1024
+
+SAFE_BUILTINS = {
+    name: getattr(builtins, name)
+    for name in (
+        'abs', 'all', 'any', 'bool', 'dict', 'enumerate', 'filter', 'float', 'int', 'isinstance', 'len',
+        'list', 'map', 'max', 'min', 'print', 'range', 'reversed', 'round', 'set', 'sorted', 'str', 'sum',
+        'tuple', 'zip', 'AssertionError', 'Exception', 'KeyError', 'ValueError', 'TypeError',
+    )
+}
+
+# The functions scripts get as json and re, rather than the modules, whose attributes reach everything else
+SCRIPT_JSON = SimpleNamespace(loads=json.loads, dumps=json.dumps)
+SCRIPT_RE = SimpleNamespace(search=re.search, match=re.match, fullmatch=re.fullmatch, findall=re.findall,
+                            sub=re.sub, split=re.split, IGNORECASE=re.IGNORECASE, MULTILINE=re.MULTILINE,
+                            DOTALL=re.DOTALL)
+
+ResponseSnapshot = namedtuple('ResponseSnapshot', ['status', 'reason', 'headers', 'content_type', 'text',
+                                                   'elapsed_ms'])
+
+AssertionResult = namedtuple('AssertionResult', ['check', 'expected', 'passed', 'message'])
+
+
+class ScriptTimeout(Exception):
+    pass
+
+
+def snapshot(response: 'requests.Response') -> ResponseSnapshot:
+    """The parts of a response checked by assertions, cheap to send to a worker."""
+    return ResponseSnapshot(response.status_code, response.reason, list(response.headers.items()),
+                            get_content_type(response), response.text,
+                            response.elapsed.total_seconds() * 1000)
+
+
+def parse_check(check: str) -> Tuple[str, str]:
+    kind, _, expression = check.strip().partition(' ')
+    return kind.lower(), expression.strip()
+
+
+def _matches(actual: Optional[str], expected: str) -> bool:
+    if actual is None:
+        return False
+    if expected.startswith('~'):
+        return re.search(expected[1:], actual) is not None
+    return actual == expected
+
+
+def _check_status(resp: ResponseSnapshot, expected: str) -> Tuple[bool, str]:
+    status = str(resp.status)
+    for option in (o.strip() for o in expected.split(',')):
+        if option.lower().endswith('xx') and status[0] == option[0]:
+            return True, ''
+        if _matches(status, option):
+            return True, ''
+    return False, f'Expected status {expected}, got {resp.status}'
+
+
+def _check_header(resp: ResponseSnapshot, name: str, expected: str) -> Tuple[bool, str]:
+    value = next((v for k, v in resp.headers if k.lower() == name.lower()), None)
+    if value is None:
+        return False, f'Missing header {name}'
+    if expected and not _matches(value, expected):
+        return False, f'Expected header {name} to be {expected}, got {value}'
+    return True, ''
+
+
+def _check_query(resp: ResponseSnapshot, kind: str, expr: str, expected: str) -> Tuple[bool, str]:
+    content_type = resp.content_type
+    if kind == 'jsonpath':
+        content_type = 'application/json'
+    elif content_type not in filters.XML_TYPES | filters.HTML_TYPES:
+        content_type = 'application/xml'
+
+    matches = filters.query(content_type, resp.text, expr)
+    if not matches:
+        return False, f'No match for {expr}'
+    if not expected:
+        return True, ''
+
+    actual = filters.match_text(matches[0])
+    if _matches(actual, expected):
+        return True, ''
+    return False, f'Expected {expr} to be {expected}, got {actual}'
+
+
+def _check_body(resp: ResponseSnapshot, expected: str) -> Tuple[bool, str]:
+    found = re.search(expected[1:], resp.text) if expected.startswith('~') else expected in resp.text
+    return (True, '') if found else (False, f'Body does not contain {expected}')
+
+
+def _check_latency(resp: ResponseSnapshot, expected: str) -> Tuple[bool, str]:
+    limit = float(expected)
+    if resp.elapsed_ms <= limit:
+        return True, ''
+    return False, f'Took {resp.elapsed_ms:.0f} ms, over the {limit:.0f} ms limit'
+
+
+def _raise_timeout(signum, frame):
+    raise ScriptTimeout()
+
+
+def _private_names(code: CodeType) -> List[str]:
+    """Names starting with _ used by the code, as globals or attributes, e.g. __globals__ or __class__."""
+    names = [name for name in code.co_names if name.startswith('_')]
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names += _private_names(const)
+    return names
+
+
+def _run_script(resp: ResponseSnapshot, source: str, timeout: float) -> Tuple[bool, str]:
+    try:
+        code = compile(source, '<assertion>', 'exec')
+    except SyntaxError as e:
+        return False, f'Script failed: SyntaxError: {e}'
+    private = _private_names(code)
+    if private:
+        return False, f'Script may not use {", ".join(sorted(set(private)))}'
+
+    text = resp.text
+    env = {
+        '__builtins__': SAFE_BUILTINS,
+        'json': SCRIPT_JSON,
+        're': SCRIPT_RE,
+        'status': resp.status,
+        'headers': {k.lower(): v for k, v in resp.headers},
+        'text': text,
+        'elapsed_ms': resp.elapsed_ms,
+        'body': functools.partial(json.loads, text),
+    }
+
+    import signal
+    timed = hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+    if timed:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        exec(code, env)
+    except ScriptTimeout:
+        return False, f'Script took longer than {timeout} s'
+    except AssertionError as e:
+        return False, str(e) or 'Script assertion failed'
+    except Exception as e:
+        return False, f'Script failed: {type(e).__name__}: {e}'
+    finally:
+        if timed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    return True, ''
+
+
+def evaluate_one(resp: ResponseSnapshot, check: str, expected: str,
+                 script_timeout: float = SCRIPT_TIMEOUT) -> AssertionResult:
+    kind, expression = parse_check(check)
+    try:
+        if kind == 'status':
+            passed, message = _check_status(resp, expected)
+        elif kind == 'header':
+            passed, message = _check_header(resp, expression, expected)
+        elif kind in {'jsonpath', 'xpath'}:
+            passed, message = _check_query(resp, kind, expression, expected)
+        elif kind == 'body':
+            passed, message = _check_body(resp, expected)
+        elif kind == 'latency':
+            passed, message = _check_latency(resp, expected)
+        elif kind == 'script':
+            passed, message = _run_script(resp, expected, script_timeout)
+        else:
+            passed, message = False, f'Unknown check {kind}'
+    except (filters.FilterError, ValueError, re.error) as e:
+        passed, message = False, str(e)
+
+    return AssertionResult(check, expected, passed, message)
+
+
+def evaluate(assertions: List[Tuple[str, str, str]], resp: ResponseSnapshot,
+             script_timeout: float = SCRIPT_TIMEOUT) -> List[AssertionResult]:
+    return [evaluate_one(resp, check, expected, script_timeout)
+            for check, expected, *_ in assertions if check.strip()]
+
+
+def _initialize_worker():
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (WORKER_MEMORY_LIMIT, WORKER_MEMORY_LIMIT))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+class AssertionPool:
+    """Evaluates assertions in worker processes, started on first use."""
+
+    def __init__(self, max_workers: int = None, script_timeout: float = SCRIPT_TIMEOUT, deadline: float = DEADLINE):
+        self.max_workers = max_workers or min(4, multiprocessing.cpu_count())
+        self.script_timeout = script_timeout
+        self.deadline = deadline
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # The executor of every future still referenced, and those killed for missing the deadline
+        self._executors: 'weakref.WeakKeyDictionary[Future, ProcessPoolExecutor]' = weakref.WeakKeyDictionary()
+        self._expired: 'weakref.WeakSet[Future]' = weakref.WeakSet()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Workers are spawned rather than forked from a process running gtk
+                self._executor = ProcessPoolExecutor(self.max_workers,
+                                                     mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_initialize_worker)
+            return self._executor
+
+    def submit(self, assertions: List[Tuple[str, str, str]], response: 'requests.Response') -> Future:
+        """
+        Starts evaluating the assertions. The future fails with BrokenProcessPool
+        if its worker crashes or misses the deadline, which `result` turns into
+        failed assertions.
+        """
+        executor = self._get_executor()
+        future = executor.submit(evaluate, list(assertions), snapshot(response), self.script_timeout)
+        self._executors[future] = executor
+        timer = threading.Timer(self.deadline, self._expire, (future, executor))
+        timer.daemon = True
+        timer.start()
+        future.add_done_callback(lambda _: timer.cancel())
+        return future
+
+    def _discard(self, executor: Optional[ProcessPoolExecutor]):
+        """Stops handing out the executor, so the next submit starts new workers."""
+        with self._lock:
+            if executor is not None and self._executor is executor:
+                self._executor = None
+
+    def _expire(self, future: Future, executor: ProcessPoolExecutor):
+        if future.done():
+            return
+        log.error('Assertions took longer than %s s, killing their workers', self.deadline)
+        self._expired.add(future)
+        self._discard(executor)
+        # Killing the workers fails every future of this executor with BrokenProcessPool
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, assertions: List[Tuple[str, str, str]], response: 'requests.Response') -> List[AssertionResult]:
+        """Evaluates the assertions, blocking until they are done."""
+        return self.result(self.submit(assertions, response), assertions)
+
+    def result(self, future: Future, assertions: List[Tuple[str, str, str]]) -> List[AssertionResult]:
+        """The results of a future from submit, or failures for every assertion when its worker crashed."""
+        executor = self._executors.get(future)
+        try:
+            return future.result(timeout=self.deadline)
+        except TimeoutError:
+            self._expire(future, executor)
+        except BrokenProcessPool as e:
+            # A worker died, e.g. over its memory limit. Start afresh next time.
+            log.error('Assertion worker failed %s', e)
+            self._discard(executor)
+
+        message = f'Assertions took longer than {self.deadline} s' if future in self._expired \
+            else 'Assertion worker crashed'
+        return [AssertionResult(check, expected, False, message)
+                for check, expected, *_ in assertions if check.strip()]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor:
+                self._executor.shutdown()
+            self._executor = None
+
+
+ASSERTION_POOL = AssertionPool()
@@ -0,0 +1,92 @@
+"""
+Compares the legacy json storage of requests with the binary encoding.
+
+    python -m benchmarks.serialization_bench [number of requests]
+"""
+import json
+import sqlite3
+import sys
+import time
+
+import serialization
+from db import RequestDAO, get_connection
+from models import RequestRecord, RequestTreeNode
+
+
+def make_records(n: int):
+    return [
+        RequestRecord(url=f'http://foo.com/items/{i}',
+                      method='POST',
+                      name=f'Request {i}',
+                      params=[('page', str(i), ''), ('size', '100', 'Page size')],
+                      headers=[('Content-Type', 'application/json', ''), ('X-Request-Id', str(i), '')],
+                      content_type='application/json',
+                      body_text=json.dumps({'id': i, 'tags': ['a', 'b', 'c'], 'payload': 'x' * (i % 2000)}))
+        for i in range(n)
+    ]
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def legacy_dump(record: RequestRecord) -> str:
+    return json.dumps(record.to_dict())
+
+
+def legacy_load(data: str) -> RequestRecord:
+    return RequestRecord.from_dict(json.loads(data))
+
+
+def bench_codec(records):
+    legacy = [legacy_dump(r) for r in records]
+    binary = [serialization.dump_request(r) for r in records]
+
+    results = {
+        'legacy json': (
+            timed(lambda: [legacy_dump(r) for r in records]),
+            timed(lambda: [legacy_load(d) for d in legacy]),
+            sum(len(d.encode('utf-8')) for d in legacy),
+        ),
+        'binary': (
+            timed(lambda: [serialization.dump_request(r) for r in records]),
+            timed(lambda: [serialization.load(d) for d in binary]),
+            sum(len(d) for d in binary),
+        ),
+    }
+
+    print(f'{"format":<12} {"save":>9} {"load":>9} {"size":>12}')
+    for name, (save, load, size) in results.items():
+        print(f'{name:<12} {save:>8.3f}s {load:>8.3f}s {size:>11,}B')
+
+
+def bench_dao(records):
+    db = get_connection(':memory:')
+    dao = RequestDAO(db)
+
+    nodes = [RequestTreeNode(None, 'col', record=r) for r in records]
+    with db:
+        db.executemany('insert into requests (id, collection_id, request_json) values (?, ?, ?)',
+                       ((f'legacy-{n.pk}', 'legacy', legacy_dump(n.record)) for n in nodes))
+    save = timed(lambda: dao.save_requests(nodes))
+
+    legacy_load_time = timed(lambda: dao.get_requests(collection_pk='legacy'))
+    load_time = timed(lambda: dao.get_requests(collection_pk='col'))
+    print(f'dao save_requests: {save:.3f}s, get_requests legacy rows: {legacy_load_time:.3f}s, '
+          f'binary rows: {load_time:.3f}s')
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    codec = 'msgpack' if serialization.msgpack else 'orjson' if serialization.orjson else 'json'
+    print(f'{n:,} requests, codec {codec}, sqlite {sqlite3.sqlite_version}')
+
+    records = make_records(n)
+    bench_codec(records)
+    bench_dao(records)
+
+
+if __name__ == '__main__':
+    main()
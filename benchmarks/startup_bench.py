@@ -0,0 +1,56 @@
+"""
+Compares the time taken to import every widget, parsing its template, when the
+ui is loaded from the compiled GResource bundle and from the loose files.
+
+    python -m benchmarks.startup_bench [number of runs]
+
+Each run is a fresh interpreter. For cold cache numbers drop the page cache
+between runs, e.g. `sync; echo 3 | sudo tee /proc/sys/vm/drop_caches`.
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+import gresources
+
+SCRIPT = '''
+import time
+start = time.perf_counter()
+import gi
+gi.require_version("Gtk", "3.0")
+gi.require_version("GtkSource", "4")
+from gi.repository import GObject, GtkSource
+GObject.type_ensure(GtkSource.View)
+import gresources
+gresources.register()
+import widgets.loading_window, widgets.main_window
+print(time.perf_counter() - start)
+'''
+
+
+def run(no_gresource: bool) -> float:
+    env = dict(os.environ)
+    env.pop(gresources.ENV_VAR, None)
+    if no_gresource:
+        env[gresources.ENV_VAR] = '1'
+    out = subprocess.run([sys.executable, '-c', SCRIPT], cwd=gresources.ROOT, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    if gresources.is_stale() and not gresources.compile_bundle():
+        sys.exit('The resource bundle could not be built, is glib-compile-resources installed?')
+
+    print(f'{"loaded from":<12} {"median":>9} {"min":>9} {"max":>9}')
+    for name, no_gresource in (('files', True), ('gresource', False)):
+        times = [run(no_gresource) for _ in range(runs)]
+        print(f'{name:<12} {statistics.median(times) * 1000:7.1f}ms {min(times) * 1000:7.1f}ms '
+              f'{max(times) * 1000:7.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
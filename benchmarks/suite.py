@@ -0,0 +1,312 @@
+"""
+Benchmarks of the hot paths on fixed synthetic datasets, compared against a
+stored baseline.
+
+    python -m benchmarks.suite [--out results.json] [--filter NAME] [--large]
+    python -m benchmarks.suite --save-baseline
+
+Each metric is the median of --repeat runs, in seconds. The suite exits with
+1 when a metric is slower than its baseline by more than the threshold, 25%
+unless the baseline sets its own. Baselines are machine specific, so none is
+committed: record one on the machine the suite runs on, e.g. the CI runner,
+with the default --repeat. Without one the suite only prints its results.
+
+Send latency needs the echo server. Set REPOSE_ECHO_URL to use a running
+one, otherwise the suite starts its own and skips the metric when that fails.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import filters
+import serialization
+from db import CollectionDAO, NodeRecord, RequestDAO, get_connection, map_records
+from models import CollectionModel, FolderModel, RequestRecord, RequestTreeNode
+from utils import has_long_line
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+DEFAULT_THRESHOLD = 0.25
+# Slowdowns smaller than this many seconds are noise, whatever their ratio
+MIN_REGRESSION = 0.002
+
+ROW_COUNTS = (1_000, 10_000, 100_000)
+BODY_SIZES = (1, 10)  # MB
+LARGE_BODY_SIZES = (100,)
+
+MB = 1024 * 1024
+
+Benchmark = Tuple[str, Callable[[], object]]
+
+BENCHMARKS: List[Callable[[argparse.Namespace], Iterator[Benchmark]]] = []
+
+
+def benchmark(fn):
+    BENCHMARKS.append(fn)
+    return fn
+
+
+def wanted(opts, *names: str) -> bool:
+    """Whether any of the metrics passes --filter, checked before building their data."""
+    return not opts.filter or any(opts.filter in name for name in names)
+
+
+def make_nodes(n: int, seed: int = 42) -> List[RequestTreeNode]:
+    """A collection of n nodes, one in ten a folder, nested up to three deep."""
+    rnd = random.Random(seed)
+    nodes, folders = [], []
+    for i in range(n):
+        parent = rnd.choice(folders) if folders and rnd.random() < 0.7 else None
+        if i % 10 == 0 and (parent is None or parent.parent is None):
+            node = RequestTreeNode(parent.pk if parent else None, 'col', folder=FolderModel(f'Folder {i}'))
+            folders.append(node)
+        else:
+            node = RequestTreeNode(parent.pk if parent else None, 'col', record=RequestRecord(
+                url=f'http://api.foo.com/items/{i}', method=rnd.choice(['GET', 'POST']), name=f'Request {i}',
+                params=[('page', str(i % 10), '')], headers=[('Accept', 'application/json', '')],
+                content_type='application/json', body_text=json.dumps({'id': i, 'pad': 'x' * rnd.randrange(500)})))
+        if parent:
+            node.parent = parent
+        nodes.append(node)
+    return nodes
+
+
+def make_json_body(size_mb: int, seed: int = 42) -> str:
+    rnd = random.Random(seed)
+    items, size = [], 0
+    while size < size_mb * MB:
+        item = {'id': len(items), 'name': f'item {len(items)}', 'score': rnd.random(),
+                'tags': [rnd.choice('abcdef') for _ in range(4)], 'active': rnd.random() < 0.5}
+        items.append(item)
+        size += 100
+    return json.dumps({'items': items})
+
+
+def make_xml_body(size_mb: int, seed: int = 42) -> str:
+    rnd = random.Random(seed)
+    count = size_mb * MB // 80
+    rows = ''.join(f'<item id="{i}"><name>item {i}</name><score>{rnd.random():.6f}</score></item>'
+                   for i in range(count))
+    return f'<?xml version="1.0"?><items>{rows}</items>'
+
+
+@benchmark
+def bench_map_records(opts) -> Iterator[Benchmark]:
+    for n in opts.rows:
+        if not wanted(opts, f'map_records[{n}]'):
+            continue
+        records = [NodeRecord(pk, col, parent, None, None, data, position)
+                   for pk, col, parent, data, position in map(RequestDAO._to_row, make_nodes(n))]
+        yield f'map_records[{n}]', lambda records=records: map_records(records)
+
+
+@benchmark
+def bench_get_collections(opts) -> Iterator[Benchmark]:
+    for n in opts.rows:
+        if not wanted(opts, f'get_collections[{n}]'):
+            continue
+        db = get_connection(os.path.join(opts.tmp_dir, f'collections_{n}.db'))
+        CollectionDAO(db).save_collection(CollectionModel('col', pk='col'))
+        RequestDAO(db).save_requests(make_nodes(n))
+        yield f'get_collections[{n}]', lambda db=db: CollectionDAO(db).get_collections()
+        db.close()
+
+
+@benchmark
+def bench_save_request(opts) -> Iterator[Benchmark]:
+    n = 1_000
+    if not wanted(opts, f'save_request[{n}]', f'save_request_update[{n}]'):
+        return
+    db = get_connection(os.path.join(opts.tmp_dir, 'save.db'))
+    dao = RequestDAO(db)
+    nodes = make_nodes(n, seed=7)
+
+    def save_all():
+        for node in nodes:
+            dao.save_request(node)
+
+    def insert_all():
+        # Emptied first, so every run inserts rather than updating the last run's rows
+        with db:
+            db.execute('delete from requests')
+        save_all()
+
+    yield f'save_request[{n}]', insert_all
+    yield f'save_request_update[{n}]', save_all
+    db.close()
+
+
+@benchmark
+def bench_bodies(opts) -> Iterator[Benchmark]:
+    for size in opts.body_sizes:
+        json_names = [f'{m}[{size}MB]' for m in ('pretty_json', 'jsonpath', 'long_line_scan',
+                                                 'long_line_scan_minified')]
+        if wanted(opts, *json_names):
+            json_body = make_json_body(size)
+            yield json_names[0], lambda: filters.pretty_text('application/json', json_body)
+            yield json_names[1], lambda: filters.query('application/json', json_body, '$.items[*].score')
+            if wanted(opts, json_names[2]):
+                pretty_json = filters.pretty_text('application/json', json_body)
+                yield json_names[2], lambda: has_long_line(pretty_json)
+            yield json_names[3], lambda: has_long_line(json_body)
+
+        xml_names = [f'{m}[{size}MB]' for m in ('pretty_xml', 'xpath')]
+        if wanted(opts, *xml_names):
+            xml_body = make_xml_body(size)
+            yield xml_names[0], lambda: filters.pretty_text('application/xml', xml_body)
+            yield xml_names[1], lambda: filters.query('application/xml', xml_body, '//item[@id > 10]/name/text()')
+
+
+@benchmark
+def bench_serialization(opts) -> Iterator[Benchmark]:
+    if not wanted(opts, 'dump_request[10000]', 'load_request[10000]'):
+        return
+    records = [n.record for n in make_nodes(10_000) if not n.is_folder()]
+    blobs = [serialization.dump_request(r) for r in records]
+    yield 'dump_request[10000]', lambda: [serialization.dump_request(r) for r in records]
+    yield 'load_request[10000]', lambda: [serialization.load(b) for b in blobs]
+
+
+def _start_echo_server() -> Tuple[str, subprocess.Popen]:
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    proc = subprocess.Popen([sys.executable, '-m', 'echo_server.server', '--port', str(port)], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/'
+    deadline = time.time() + 10
+    while time.time() < deadline and proc.poll() is None:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.1).close()
+            return url, proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('The echo server did not start')
+
+
+@benchmark
+def bench_send_latency(opts) -> Iterator[Benchmark]:
+    import requests
+
+    n = 200
+    if not wanted(opts, f'send_latency[{n}]'):
+        return
+    url, proc = os.environ.get('REPOSE_ECHO_URL'), None
+    if not url:
+        try:
+            url, proc = _start_echo_server()
+        except RuntimeError as e:
+            print(f'Skipping send latency: {e}', file=sys.stderr)
+            return
+
+    session = requests.Session()
+    body = json.dumps({'id': 1, 'pad': 'x' * 1000})
+    try:
+        session.post(url, data=body).raise_for_status()  # Warm up the connection
+        yield f'send_latency[{n}]', lambda: [session.post(url, data=body, headers={'Content-Type': 'application/json'})
+                                             for _ in range(n)]
+    finally:
+        session.close()
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {'median': statistics.median(times), 'min': min(times), 'runs': repeat}
+
+
+def compare(results: Dict[str, dict], baseline: dict, threshold: float) -> List[str]:
+    """Messages for every metric slower than its baseline by more than its threshold."""
+    regressions = []
+    thresholds = baseline.get('thresholds', {})
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        allowed = thresholds.get(name, threshold)
+        change = result['median'] / base['median'] - 1
+        if change > allowed and result['median'] - base['median'] > MIN_REGRESSION:
+            regressions.append(f'{name}: {result["median"] * 1000:.1f} ms vs {base["median"] * 1000:.1f} ms '
+                               f'baseline, {change:+.0%} over the {allowed:.0%} threshold')
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Run the benchmark suite and compare it to a baseline.')
+    parser.add_argument('--out', help='Write the results as json')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed slowdown, as a fraction of the baseline')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per metric')
+    parser.add_argument('--filter', help='Only run metrics whose name contains this')
+    parser.add_argument('--large', action='store_true', help='Include 100 MB bodies')
+    opts = parser.parse_args(argv)
+    opts.rows = ROW_COUNTS
+    opts.body_sizes = BODY_SIZES + (LARGE_BODY_SIZES if opts.large else ())
+
+    results = {}
+    with tempfile.TemporaryDirectory() as opts.tmp_dir:
+        for bench in BENCHMARKS:
+            for name, fn in bench(opts):
+                if opts.filter and opts.filter not in name:
+                    continue
+                results[name] = measure(fn, opts.repeat)
+                print(f'{name:<36} {results[name]["median"] * 1000:10.1f} ms')
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sqlite': sqlite3.sqlite_version,
+            'codec': 'msgpack' if serialization.msgpack else 'json',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if opts.out:
+        with open(opts.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if opts.save_baseline:
+        thresholds = {}
+        if os.path.exists(opts.baseline):
+            with open(opts.baseline) as f:
+                thresholds = json.load(f).get('thresholds', {})
+        with open(opts.baseline, 'w') as f:
+            json.dump({**report, 'thresholds': thresholds}, f, indent=2)
+        print(f'Saved baseline to {opts.baseline}')
+        return 0
+
+    if not os.path.exists(opts.baseline):
+        print(f'No baseline at {opts.baseline}, run with --save-baseline to record one')
+        return 0
+
+    with open(opts.baseline) as f:
+        regressions = compare(results, json.load(f), opts.threshold)
+    for message in regressions:
+        print(f'REGRESSION {message}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Request bodies streamed from disk, so files of any size are sent in
+constant memory.
+
+Both kinds are iterables of byte chunks with a length, which requests sends
+as they are read with a Content-Length. Each iteration reopens the files, so
+a body can be sent again, e.g. after a redirect.
+
+Multipart form data rows are explicitly marked as files, whose values are
+then paths of files to upload. Values of other rows are always sent as text.
+"""
+import mimetypes
+import os
+import uuid
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+from content_coding import CompressedBody
+
+CHUNK_SIZE = 256 * 1024
+
+Progress = Callable[[int], None]
+
+
+def _read_file(path: str, size: int, chunk_size: int) -> Iterator[bytes]:
+    """The first `size` bytes of a file, failing if it got shorter since it was measured."""
+    left = size
+    with open(path, 'rb') as f:
+        while left:
+            chunk = f.read(min(chunk_size, left))
+            if not chunk:
+                raise IOError(f'{path} changed while it was being sent')
+            left -= len(chunk)
+            yield chunk
+
+
+class FileBody:
+    """The contents of a file."""
+
+    def __init__(self, path: str, progress: Progress = None, chunk_size: int = CHUNK_SIZE):
+        self.path = os.path.expanduser(path)
+        self.size = os.path.getsize(self.path)
+        self.progress = progress
+        self.chunk_size = chunk_size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in _read_file(self.path, self.size, self.chunk_size):
+            yield chunk
+            if self.progress:
+                self.progress(len(chunk))
+
+
+def _quote(value: str) -> str:
+    # As browsers do for the names in Content-Disposition
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class MultipartBody:
+    """multipart/form-data of text fields and files, whose contents are only read while sending."""
+
+    def __init__(self, fields: List[Tuple[str, str, bool]], progress: Progress = None, chunk_size: int = CHUNK_SIZE,
+                 boundary: str = None):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.progress = progress
+        self.chunk_size = chunk_size
+
+        # Either bytes to send as they are, or a (path, size) of a file to stream
+        self.parts: List[Union[bytes, Tuple[str, int]]] = []
+        for name, value, is_file in fields:
+            head = f'--{self.boundary}\r\nContent-Disposition: form-data; name="{_quote(name)}"'
+            if not is_file:
+                self.parts.append(f'{head}\r\n\r\n'.encode('utf-8') + value.encode('utf-8') + b'\r\n')
+                continue
+
+            path = os.path.expanduser(value)
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            self.parts.append(f'{head}; filename="{_quote(os.path.basename(path))}"\r\n'
+                              f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8'))
+            self.parts.append((path, os.path.getsize(path)))
+            self.parts.append(b'\r\n')
+        self.parts.append(f'--{self.boundary}--\r\n'.encode('utf-8'))
+
+        self.size = sum(len(p) if isinstance(p, bytes) else p[1] for p in self.parts)
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[bytes]:
+        for part in self.parts:
+            chunks = [part] if isinstance(part, bytes) else _read_file(*part, self.chunk_size)
+            for chunk in chunks:
+                yield chunk
+                if self.progress:
+                    self.progress(len(chunk))
+
+
+def streamed_size(body) -> Optional[int]:
+    """Bytes read from files while sending a streamed body, None for bodies held in memory."""
+    if isinstance(body, CompressedBody):
+        body = body.body
+    return len(body) if isinstance(body, (FileBody, MultipartBody)) else None
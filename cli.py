@@ -0,0 +1,183 @@
+"""
+Headless entry point for running collections, e.g. in CI. Only uses the
+model and db layers, so it doesn't need gtk.
+
+    python cli.py run <collection> [--env NAME] [--concurrency N] [--transport asyncio] [--junit PATH] [--jsonl PATH]
+
+Exits with 1 when any request fails, either by not getting a response or by
+failing one of its assertions.
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Set, Tuple
+from xml.etree import ElementTree
+
+from db import CollectionDAO, EnvironmentDAO, get_connection
+from metrics import METRICS
+from models import RequestTreeNode
+from runner import Runner, RunResult
+from transport import THREADS, TRANSPORTS, create_transport
+
+log = logging.getLogger(__name__)
+
+CaseResult = namedtuple('CaseResult', ['path', 'name', 'method', 'url', 'result'])
+
+
+def iter_requests(nodes: List[RequestTreeNode], path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], RequestTreeNode]]:
+    """Requests in tree order, along with the names of their folders."""
+    for node in nodes:
+        if node.is_folder():
+            yield from iter_requests(node.children, path + (node.name,))
+        else:
+            yield path, node
+
+
+def is_failure(result: RunResult) -> bool:
+    return bool(result.error or result.failures)
+
+
+def run_collection(nodes: List[RequestTreeNode], variables: Dict[str, str], concurrency: int = 1,
+                   timeout: float = 30.0, transport: str = THREADS) -> List[CaseResult]:
+    """Sends the requests with at most `concurrency` in flight, returning their results in tree order."""
+    shared = create_transport(transport, max(1, concurrency))
+    cases: List[Tuple[Tuple[str, ...], RequestTreeNode, str, Future]] = []
+    in_flight: Set[Future] = set()
+    try:
+        for i, (path, node) in enumerate(iter_requests(nodes)):
+            if len(in_flight) >= max(1, concurrency):
+                _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+
+            runner = Runner(node.record, variables=variables, timeout=timeout, source='cli', transport=shared)
+            future = runner.submit(i, {})
+            in_flight.add(future)
+            cases.append((path, node, runner.plan.url_for(variables), future))
+        wait(in_flight)
+    finally:
+        shared.close()
+
+    return [CaseResult(path, node.name, node.record.method, url, future.result())
+            for path, node, url, future in cases]
+
+
+def write_jsonl(path: str, cases: List[CaseResult]):
+    with open(path, 'w', encoding='utf-8') as f:
+        for case in cases:
+            r = case.result
+            f.write(json.dumps({
+                'path': list(case.path),
+                'name': case.name,
+                'method': case.method,
+                'url': case.url,
+                'status': r.status,
+                'elapsed_ms': r.elapsed_ms,
+                'size': r.size,
+                'error': r.error,
+                'passed': not is_failure(r),
+                'failures': r.failures,
+            }) + '\n')
+
+
+def write_junit(path: str, suite_name: str, cases: List[CaseResult], elapsed: float):
+    errors = sum(1 for c in cases if c.result.error)
+    failures = sum(1 for c in cases if c.result.failures)
+    attrs = {'name': suite_name, 'tests': str(len(cases)), 'failures': str(failures), 'errors': str(errors),
+             'time': f'{elapsed:.3f}'}
+
+    root = ElementTree.Element('testsuites', attrs)
+    suite = ElementTree.SubElement(root, 'testsuite', attrs)
+    for case in cases:
+        r = case.result
+        el = ElementTree.SubElement(suite, 'testcase', {
+            'classname': '.'.join((suite_name,) + case.path),
+            'name': case.name,
+            'time': f'{r.elapsed_ms / 1000:.3f}',
+        })
+        if r.error:
+            ElementTree.SubElement(el, 'error', {'message': r.error}).text = f'{case.method} {case.url}'
+        elif r.failures:
+            ElementTree.SubElement(el, 'failure', {'message': r.failures[0]}).text = '\n'.join(r.failures)
+
+    ElementTree.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def print_summary(cases: List[CaseResult], elapsed: float, out=sys.stdout):
+    for case in cases:
+        r = case.result
+        mark = 'FAIL' if is_failure(r) else 'ok'
+        name = '/'.join(case.path + (case.name,))
+        print(f'{mark:<5} {name}  {case.method} {case.url} -> {r.status or r.error} ({r.elapsed_ms:.0f} ms)',
+              file=out)
+        for failure in r.failures:
+            print(f'        {failure}', file=out)
+
+    failed = sum(1 for c in cases if is_failure(c.result))
+    print(f'\n{len(cases)} requests, {failed} failed in {elapsed:.2f} s', file=out)
+
+
+def run(args, parser: argparse.ArgumentParser) -> int:
+    db = get_connection(args.db)
+    try:
+        pk = CollectionDAO(db).find_pk(args.collection)
+        if not pk:
+            parser.error(f'No collection named {args.collection}')
+        collection = CollectionDAO(db).get_collection(pk)
+
+        variables = {}
+        if args.env:
+            env = EnvironmentDAO(db).get_environment(args.env)
+            if not env:
+                parser.error(f'No environment named {args.env}')
+            variables = env.as_dict()
+    except sqlite3.Error as e:
+        parser.exit(2, f'Failed to read the collection: {e}\n')
+    finally:
+        db.close()
+
+    start = time.perf_counter()
+    try:
+        cases = run_collection(collection.nodes, variables, args.concurrency, args.timeout, args.transport)
+    except RuntimeError as e:
+        parser.exit(2, f'{e}\n')
+    elapsed = time.perf_counter() - start
+
+    print_summary(cases, elapsed)
+    if args.jsonl:
+        write_jsonl(args.jsonl, cases)
+    if args.junit:
+        write_junit(args.junit, collection.name, cases, elapsed)
+
+    return 1 if any(is_failure(c.result) for c in cases) else 0
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog='repose', description='Run Repose collections without the ui.')
+    parser.add_argument('--db', help='Path to the repose storage db')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='Send every request of a collection and check its assertions')
+    run_parser.add_argument('collection', help='Collection name or id')
+    run_parser.add_argument('--env', help='Environment whose variables are substituted into the requests')
+    run_parser.add_argument('--concurrency', type=int, default=1, help='Requests in flight at once')
+    run_parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for each response')
+    run_parser.add_argument('--transport', choices=TRANSPORTS, default=THREADS,
+                            help='Send with a thread per request in flight, or all of them from one asyncio loop')
+    run_parser.add_argument('--junit', metavar='PATH', help='Write a JUnit XML report')
+    run_parser.add_argument('--jsonl', metavar='PATH', help='Write a JSONL line per request')
+
+    args = parser.parse_args(argv)
+    METRICS.configure_from_env()
+    try:
+        return run(args, parser)
+    finally:
+        METRICS.stop()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
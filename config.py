@@ -4,3 +4,7 @@ APP_NAME = 'repose'
 APP_AUTHOR = 'Benjamin Quinn'
 
 DATA_DIR = appdirs.user_data_dir(APP_NAME, APP_AUTHOR)
+
+# Responses held by inactive tabs are compressed, then moved to disk, once
+# all open responses together take more than this.
+RESPONSE_MEMORY_BUDGET = 256 * 1024 * 1024
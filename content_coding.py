@@ -0,0 +1,158 @@
+"""
+Content codings of request and response bodies.
+
+Responses are decoded as they are read, with gzip and deflate always
+supported, brotli when `brotli` (or `brotlicffi`) is installed and zstd when
+`zstandard` is. ACCEPT_ENCODING only advertises what can be decoded.
+
+Request bodies can be compressed with gzip or deflate, see
+RequestRecord.body_encoding.
+"""
+import zlib
+from typing import Iterable, Iterator, Union
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+BROTLI = 'br'
+ZSTD = 'zstd'
+
+# Codings request bodies can be compressed with
+REQUEST_ENCODINGS = (GZIP, DEFLATE)
+
+ACCEPT_ENCODING = ', '.join([GZIP, DEFLATE] + [BROTLI] * bool(brotli) + [ZSTD] * bool(zstandard))
+
+
+class DecodeError(ValueError):
+    pass
+
+
+class _ZlibDecoder:
+    def __init__(self, encoding: str):
+        self._gzip = encoding == GZIP
+        self._obj = zlib.decompressobj(16 + zlib.MAX_WBITS if self._gzip else zlib.MAX_WBITS)
+        self._first = True
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._first and data:
+            self._first = False
+            if not self._gzip:
+                try:
+                    return self._obj.decompress(data)
+                except zlib.error:
+                    # Some servers send raw deflate streams without the zlib header
+                    self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        return self._obj.flush()
+
+
+class _BrotliDecoder:
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+        # brotli calls it process, brotlicffi decompress
+        self.decompress = getattr(self._obj, 'process', None) or self._obj.decompress
+
+    def flush(self) -> bytes:
+        return self._obj.flush() if hasattr(self._obj, 'flush') else b''
+
+
+class _ZstdDecoder:
+    def __init__(self):
+        self._obj = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        return b''
+
+
+def _single_decoder(encoding: str):
+    encoding = encoding.strip().lower()
+    if encoding in {GZIP, 'x-gzip'}:
+        return _ZlibDecoder(GZIP)
+    if encoding == DEFLATE:
+        return _ZlibDecoder(DEFLATE)
+    if encoding == BROTLI and brotli is not None:
+        return _BrotliDecoder()
+    if encoding == ZSTD and zstandard is not None:
+        return _ZstdDecoder()
+    raise DecodeError(f'Unsupported content encoding {encoding}')
+
+
+class Decoder:
+    """Incrementally decodes a body sent with the given Content-Encoding, which may list several codings."""
+
+    def __init__(self, content_encoding: str = ''):
+        # Codings are listed in the order they were applied
+        self._decoders = [_single_decoder(e) for e in reversed(content_encoding.split(','))
+                          if e.strip().lower() not in {'', 'identity'}]
+
+    def decompress(self, data: bytes) -> bytes:
+        try:
+            for decoder in self._decoders:
+                data = decoder.decompress(data)
+        except Exception as e:
+            raise DecodeError(e)
+        return data
+
+    def flush(self) -> bytes:
+        data = b''
+        try:
+            for decoder in self._decoders:
+                data = decoder.decompress(data) + decoder.flush() if data else decoder.flush()
+        except Exception as e:
+            raise DecodeError(e)
+        return data
+
+
+def decode(content: bytes, content_encoding: str) -> bytes:
+    decoder = Decoder(content_encoding)
+    return decoder.decompress(content) + decoder.flush()
+
+
+def _compressor(encoding: str):
+    if encoding == GZIP:
+        return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if encoding == DEFLATE:
+        return zlib.compressobj(6)
+    raise ValueError(f'Unsupported request body encoding {encoding}, expected one of {", ".join(REQUEST_ENCODINGS)}')
+
+
+def compress(data: Union[str, bytes], encoding: str) -> bytes:
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    compressor = _compressor(encoding)
+    return compressor.compress(data) + compressor.flush()
+
+
+class CompressedBody:
+    """A streamed body compressed while it is sent. Its length is unknown, so it goes out chunked."""
+
+    def __init__(self, body: Iterable[bytes], encoding: str):
+        _compressor(encoding)
+        self.body = body
+        self.encoding = encoding
+
+    def __iter__(self) -> Iterator[bytes]:
+        compressor = _compressor(self.encoding)
+        for chunk in self.body:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
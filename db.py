@@ -1,14 +1,21 @@
 import json
 import logging
+from concurrent.futures import Future
 from concurrent.futures.thread import ThreadPoolExecutor
+from multiprocessing import cpu_count
 from pathlib import Path
-from typing import List, Iterable
+from typing import List, Iterable, Iterator, Optional, Union, TYPE_CHECKING
 from collections import namedtuple
 import sqlite3
 import threading
 
+import serialization
 from config import DATA_DIR
-from models import RequestModel, CollectionModel, RequestTreeNode, FolderModel
+from models import RequestRecord, CollectionModel, RequestTreeNode, FolderModel, EnvironmentModel, POSITION_GAP
+from pool import resolve_on_main_loop
+
+if TYPE_CHECKING:
+    import requests
 
 
 db_local = threading.local()
@@ -23,14 +30,40 @@ def initialize_db_thread(*args, **kwargs):
     log.info('Initialized db in thread %s', threading.get_ident())
 
 
-# Serialize all access to sqlite connection via this single threaded executor.
-# All access to sqlite should happen through the executor.
+def initialize_read_db_thread(*args, **kwargs):
+    """Initialize each reader pool worker with its own read-only db connection"""
+    Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
+    db_local.db = get_read_connection()
+    log.info('Initialized read-only db in thread %s', threading.get_ident())
+
+
+# Serialize all writes to sqlite via this single threaded executor.
+# All writes to sqlite should happen through the executor.
 DB_EXECUTOR = ThreadPoolExecutor(max_workers=1, initializer=initialize_db_thread)
 
+# WAL lets readers run alongside the writer, so queries get a small pool of
+# read-only connections and never queue behind pending saves.
+DB_READ_EXECUTOR = ThreadPoolExecutor(max_workers=min(4, cpu_count()),
+                                      initializer=initialize_read_db_thread)
+
+
+def submit_read(fn, *args, **kwargs) -> Future:
+    """
+    Runs `fn` on a reader connection. The returned future resolves on the
+    GLib main loop, so its done callbacks may touch widgets.
+    """
+    return resolve_on_main_loop(DB_READ_EXECUTOR.submit(fn, *args, **kwargs))
+
+
+def submit_write(fn, *args, **kwargs) -> Future:
+    """Runs `fn` on the writer connection, resolving on the GLib main loop."""
+    return resolve_on_main_loop(DB_EXECUTOR.submit(fn, *args, **kwargs))
+
 
 def get_connection(path: str = None) -> sqlite3.Connection:
     path = path or f'{DATA_DIR}/storage.db'
     db = sqlite3.connect(path, 30.0)
+    db.execute('pragma journal_mode = wal')
     try:
         db.execute("""
         create table collections (
@@ -51,19 +84,93 @@ def get_connection(path: str = None) -> sqlite3.Connection:
     except sqlite3.OperationalError:
         pass
 
+    try:
+        db.execute('alter table requests add column position integer')
+    except sqlite3.OperationalError:
+        pass
+
+    # Rows saved before every row had a position go after those that have one,
+    # in the order they were added
+    with db:
+        db.execute('''
+        update requests set position = (select coalesce(max(position), 0) from requests) + rowid * ?
+        where position is null
+        ''', (POSITION_GAP,))
+
+    try:
+        # Replaces folder_json/request_json, see serialization.py
+        db.execute('alter table requests add column data blob')
+    except sqlite3.OperationalError:
+        pass
+
+    try:
+        db.execute("""
+        create table history (
+            id integer primary key,
+            request_id text,
+            sent_at real not null,
+            elapsed real,
+            method text,
+            url text,
+            status integer,
+            reason text,
+            request_headers_json text,
+            request_body blob,
+            response_headers_json text,
+            response_body blob
+        );
+        """)
+        db.execute('create index history_sent_at on history (sent_at)')
+    except sqlite3.OperationalError:
+        pass
+
+    try:
+        db.execute("""
+        create table environments (
+            id text primary key,
+            name text unique not null,
+            variables_json text
+        );
+        """)
+    except sqlite3.OperationalError:
+        pass
+
     return db
 
 
-NodeRecord = namedtuple('NodeRecord', ['pk', 'collection_pk', 'parent_pk', 'folder_json', 'request_json'])
+def get_read_connection(path: str = None) -> sqlite3.Connection:
+    path = path or f'{DATA_DIR}/storage.db'
+    # Make sure the schema exists before opening read-only
+    get_connection(path).close()
+    return sqlite3.connect(f'file:{path}?mode=ro', 30.0, uri=True)
 
 
-def map_record_to_node(rec: NodeRecord) -> RequestTreeNode:
+HistoryRecord = namedtuple('HistoryRecord', [
+    'pk', 'request_pk', 'sent_at', 'elapsed', 'method', 'url', 'status', 'reason',
+    'request_headers_json', 'response_headers_json', 'request_body_size', 'response_body_size'])
+
+NodeRecord = namedtuple('NodeRecord', ['pk', 'collection_pk', 'parent_pk', 'folder_json', 'request_json', 'data',
+                                       'position'])
+
+
+def load_node_record(rec: NodeRecord) -> Union[FolderModel, RequestRecord]:
+    if rec.data:
+        return serialization.load(rec.data)
+
+    # Rows written before the binary encoding was introduced
     if rec.folder_json:
-        folder = FolderModel(**json.loads(rec.folder_json))
-        return RequestTreeNode(pk=rec.pk, parent_pk=rec.parent_pk, folder=folder, collection_pk=rec.collection_pk)
+        return FolderModel(**json.loads(rec.folder_json))
+    return RequestRecord.from_dict(json.loads(rec.request_json))
+
+
+def map_record_to_node(rec: NodeRecord) -> RequestTreeNode:
+    loaded = load_node_record(rec)
+    if isinstance(loaded, FolderModel):
+        return RequestTreeNode(pk=rec.pk, parent_pk=rec.parent_pk, folder=loaded, collection_pk=rec.collection_pk,
+                               position=rec.position)
 
-    req = RequestModel(**json.loads(rec.request_json))
-    return RequestTreeNode(pk=rec.pk, parent_pk=rec.parent_pk, request=req, collection_pk=rec.collection_pk)
+    return RequestTreeNode(pk=rec.pk, parent_pk=rec.parent_pk, record=loaded, collection_pk=rec.collection_pk,
+                           position=rec.position)
 
 
 def map_records(recs: Iterable[NodeRecord]) -> List[RequestTreeNode]:
@@ -83,33 +190,130 @@ class RequestDAO:
     def __init__(self, db: sqlite3.Connection = None):
         self.db = db or db_local.db
 
-    def get_requests(self, has_collection=True) -> List[RequestTreeNode]:
+    def get_requests(self, has_collection=True, collection_pk: str = None) -> List[RequestTreeNode]:
+        where = 'where collection_id is not null' if has_collection else 'where collection_id is null'
+        args = ()
+        if collection_pk:
+            where, args = 'where collection_id = ?', (collection_pk,)
+
         rows = self.db.execute(f'''
-        select id, collection_id, parent_id, folder_json, request_json 
+        select id, collection_id, parent_id, folder_json, request_json, data, position
         from requests
-        {'where collection_id is not null' if has_collection else 'where collection_id is null'}
-        ''').fetchall()
+        {where}
+        order by position is null, position, rowid
+        ''', args).fetchall()
         rows = (NodeRecord(*row) for row in rows)
         return map_records(rows)
 
-    def save_request(self, node: RequestTreeNode):
-        exists = bool(self.db.execute('select count(*) > 0 from requests where id = ?', (node.pk,)).fetchone()[0])
+    def iter_records(self, collection_pk: str) -> Iterator[NodeRecord]:
+        """Streams the raw rows of a collection straight off the cursor."""
+        cursor = self.db.execute('''
+        select id, collection_id, parent_id, folder_json, request_json, data, position
+        from requests
+        where collection_id = ?
+        order by position is null, position, rowid
+        ''', (collection_pk,))
+        return (NodeRecord(*row) for row in cursor)
 
-        request_json, folder_json = None, None
+    @staticmethod
+    def _to_row(node: RequestTreeNode) -> tuple:
         if node.is_folder():
-            folder_json = json.dumps(vars(node.folder))
+            data = serialization.dump_folder(node.folder)
         else:
-            request_json = json.dumps(vars(node.request))
+            data = serialization.dump_request(node.record)
 
-        if exists:
-            self.db.execute('''
-            update requests set collection_id = ?, parent_id = ?, folder_json = ?, request_json = ?
-            where id = ?
-            ''', (node.collection_pk, node.parent_pk, folder_json, request_json))
-        else:
+        return node.pk, node.collection_pk, node.parent_pk, data, node.position
+
+    def save_request(self, node: RequestTreeNode):
+        exists = bool(self.db.execute('select count(*) > 0 from requests where id = ?', (node.pk,)).fetchone()[0])
+        pk, collection_pk, parent_pk, data, position = self._to_row(node)
+
+        with self.db:
+            if exists:
+                self.db.execute('''
+                update requests set collection_id = ?, parent_id = ?, folder_json = null, request_json = null, data = ?,
+                                    position = coalesce(?, position)
+                where id = ?
+                ''', (collection_pk, parent_pk, data, position, pk))
+            else:
+                self.db.execute('''
+                insert into requests (id, collection_id, parent_id, data, position) values (?, ?, ?, ?, ?)
+                ''', (pk, collection_pk, parent_pk, data, position))
+
+    def save_requests(self, nodes: Iterable[RequestTreeNode]):
+        """Inserts new nodes in bulk, using a single transaction."""
+        with self.db:
+            self.db.executemany('''
+            insert into requests (id, collection_id, parent_id, data, position) values (?, ?, ?, ?, ?)
+            ''', (self._to_row(node) for node in nodes))
+
+    def move_request(self, node: RequestTreeNode, moved: List[RequestTreeNode]):
+        """
+        Stores a node's new parent and the positions of the nodes moved with
+        it, as returned by CollectionModel.move_node.
+        """
+        with self.db:
+            self.db.execute('update requests set parent_id = ?, position = ? where id = ?',
+                            (node.parent_pk, node.position, node.pk))
+            self.db.executemany('update requests set position = ? where id = ?',
+                                ((n.position, n.pk) for n in moved if n is not node))
+
+    def detach_children(self, collection_pk: str, parent_pks: List[str]):
+        """Moves the children of the given parents to the top level of the collection."""
+        with self.db:
+            self.db.executemany('''
+            update requests set parent_id = null where collection_id = ? and parent_id = ?
+            ''', ((collection_pk, pk) for pk in parent_pks))
+
+
+class HistoryDAO:
+    """Stores every executed request along with the response it got."""
+
+    def __init__(self, db: sqlite3.Connection = None):
+        self.db = db or db_local.db
+
+    def save_response(self, request_pk: str, sent_at: float, response: 'requests.Response'):
+        body = response.request.body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        elif not isinstance(body, bytes):
+            body = None  # Streamed bodies aren't kept
+
+        with self.db:
             self.db.execute('''
-            insert into requests (id, collection_id, parent_id, folder_json, request_json) values (?, ?, ?, ?, ?)
-            ''', (node.pk, node.collection_pk, node.parent_pk, folder_json, request_json))
+            insert into history (request_id, sent_at, elapsed, method, url, status, reason,
+                                 request_headers_json, request_body, response_headers_json, response_body)
+            values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (request_pk, sent_at, response.elapsed.total_seconds(), response.request.method,
+                  response.url, response.status_code, response.reason,
+                  json.dumps(list(response.request.headers.items())), body,
+                  json.dumps(list(response.headers.items())), response.content))
+
+    def iter_history(self, start: float = None, end: float = None) -> Iterator[HistoryRecord]:
+        """Streams history rows, without bodies, sent within [start, end)."""
+        cursor = self.db.execute('''
+        select id, request_id, sent_at, elapsed, method, url, status, reason,
+               request_headers_json, response_headers_json,
+               coalesce(length(request_body), 0), coalesce(length(response_body), 0)
+        from history
+        where sent_at >= ? and sent_at < ?
+        order by sent_at
+        ''', (start or 0, end or float('inf')))
+        return (HistoryRecord(*row) for row in cursor)
+
+    def iter_body(self, pk: int, column: str, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Streams a stored body in chunks through an incremental blob handle, never loading it whole."""
+        assert column in {'request_body', 'response_body'}
+        try:
+            blob = self.db.blobopen('history', column, pk, readonly=True)
+        except sqlite3.OperationalError:
+            return  # No body was stored
+        with blob:
+            while True:
+                chunk = blob.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
 
 
 class CollectionDAO:
@@ -128,13 +332,64 @@ class CollectionDAO:
         nodes = self.request_dao.get_requests()
         for node in nodes:
             col = collections[node.collection_pk]
-            col.nodes.append(node)
+            col.add_node(node)
 
         return list(collections.values())
 
+    def get_collection(self, pk: str) -> CollectionModel:
+        row = self.db.execute('select id, name from collections where id = ?', (pk,)).fetchone()
+        return CollectionModel(pk=row[0], name=row[1], nodes=self.request_dao.get_requests(collection_pk=pk))
+
     def save_collection(self, col: CollectionModel):
         exists = bool(self.db.execute('select count(*) > 0 from collections where id = ?', (col.pk,)).fetchone()[0])
-        if exists:
-            self.db.execute('update collections set name = ? where id = ?', (col.name, col.pk))
-        else:
-            self.db.execute('insert into collections (id, name) values (?, ?)', (col.pk, col.name))
+        with self.db:
+            if exists:
+                self.db.execute('update collections set name = ? where id = ?', (col.name, col.pk))
+            else:
+                self.db.execute('insert into collections (id, name) values (?, ?)', (col.pk, col.name))
+
+    def find_pk(self, name_or_pk: str) -> Optional[str]:
+        row = self.db.execute('select id from collections where id = ? or name = ?', (name_or_pk, name_or_pk)).fetchone()
+        return row[0] if row else None
+
+    def name_exists(self, name: str) -> bool:
+        return bool(self.db.execute('select count(*) > 0 from collections where name = ?', (name,)).fetchone()[0])
+
+    def delete_collection(self, pk: str):
+        with self.db:
+            self.db.execute('delete from requests where collection_id = ?', (pk,))
+            self.db.execute('delete from collections where id = ?', (pk,))
+
+
+class EnvironmentDAO:
+    def __init__(self, db: sqlite3.Connection = None):
+        self.db = db or db_local.db
+
+    @staticmethod
+    def _to_model(row) -> EnvironmentModel:
+        variables = [tuple(v) for v in json.loads(row[2] or '[]')]
+        return EnvironmentModel(pk=row[0], name=row[1], variables=variables)
+
+    def get_environments(self) -> List[EnvironmentModel]:
+        rows = self.db.execute('select id, name, variables_json from environments order by name').fetchall()
+        return [self._to_model(row) for row in rows]
+
+    def get_environment(self, name_or_pk: str) -> Optional[EnvironmentModel]:
+        row = self.db.execute('select id, name, variables_json from environments where id = ? or name = ?',
+                              (name_or_pk, name_or_pk)).fetchone()
+        return self._to_model(row) if row else None
+
+    def save_environment(self, env: EnvironmentModel):
+        exists = bool(self.db.execute('select count(*) > 0 from environments where id = ?', (env.pk,)).fetchone()[0])
+        variables_json = json.dumps(env.variables)
+        with self.db:
+            if exists:
+                self.db.execute('update environments set name = ?, variables_json = ? where id = ?',
+                                (env.name, variables_json, env.pk))
+            else:
+                self.db.execute('insert into environments (id, name, variables_json) values (?, ?, ?)',
+                                (env.pk, env.name, variables_json))
+
+    def delete_environment(self, pk: str):
+        with self.db:
+            self.db.execute('delete from environments where id = ?', (pk,))
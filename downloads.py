@@ -0,0 +1,345 @@
+"""
+Downloads of response bodies straight to disk, so they are never held in
+memory, e.g. for large artifacts.
+
+The body is written to `<path>.part`, with what has been received so far
+in `<path>.part.json`. Starting a download to the same path again, after it
+failed or was cancelled, resumes it with Range requests, as long as the
+server still has the same version of the body (If-Range with its ETag or
+Last-Modified). Once complete the part file is renamed to the path.
+
+With more than one connection, bodies of servers that advertise
+Accept-Ranges are split into that many ranges downloaded in parallel.
+
+Downloads always go through requests' streaming client, as the transports
+read bodies in full. Bodies are saved as sent, so identity encoding is
+asked for.
+
+    python downloads.py <collection> <request> <path> [--connections N] [--env NAME]
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TYPE_CHECKING
+
+from progress import TransferProgress
+
+if TYPE_CHECKING:
+    import requests
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+# Bodies smaller than this are never split
+MIN_SPLIT_SIZE = 4 * 1024 * 1024
+# Seconds between saves of the part file's state while downloading
+STATE_INTERVAL = 1.0
+
+PART_SUFFIX = '.part'
+STATE_SUFFIX = '.part.json'
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadCancelled(DownloadError):
+    pass
+
+
+class Segment:
+    """A byte range of the body, `end` included and None when the length is unknown."""
+    __slots__ = ('start', 'end', 'done')
+
+    def __init__(self, start: int, end: Optional[int], done: int = 0):
+        self.start = start
+        self.end = end
+        self.done = done
+
+    @property
+    def position(self) -> int:
+        return self.start + self.done
+
+    @property
+    def finished(self) -> bool:
+        return self.end is not None and self.position > self.end
+
+
+def split(total: int, count: int) -> List[Segment]:
+    size = -(-total // count)
+    return [Segment(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+def _validator(response: 'requests.Response') -> Optional[str]:
+    # Weak ETags can't be used with If-Range
+    etag = response.headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('last-modified')
+
+
+def _content_range_start(response: 'requests.Response') -> Optional[int]:
+    # bytes <start>-<end>/<total>
+    value = response.headers.get('content-range', '')
+    try:
+        return int(value.split()[1].split('-')[0])
+    except (IndexError, ValueError):
+        return None
+
+
+class Download:
+    def __init__(self, request: Dict[str, object], path: str, connections: int = 1,
+                 on_progress: Callable[[TransferProgress], None] = None, timeout: float = None,
+                 chunk_size: int = CHUNK_SIZE, min_split_size: int = MIN_SPLIT_SIZE):
+        """`request` holds the keyword arguments of `requests.request`, see RequestPlan.render."""
+        self.request = request
+        self.path = os.path.expanduser(path)
+        self.connections = max(1, connections)
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.min_split_size = min_split_size
+        self.progress = TransferProgress(on_update=on_progress)
+
+        self.segments: List[Segment] = []
+        self.validator: Optional[str] = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        # Bytes received by this run, rather than earlier ones it resumed
+        self.received = 0
+
+    @property
+    def part_path(self) -> str:
+        return self.path + PART_SUFFIX
+
+    @property
+    def state_path(self) -> str:
+        return self.path + STATE_SUFFIX
+
+    def cancel(self):
+        """Stops the download, leaving what was received to resume from."""
+        self._cancelled.set()
+
+    def _load_state(self) -> bool:
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if state['url'] != self.request['url'] or not os.path.exists(self.part_path):
+                return False
+            self.validator = state['validator']
+            self.segments = [Segment(*s) for s in state['segments']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return bool(self.validator) and any(not s.finished for s in self.segments)
+
+    def _save_state(self, force: bool = True):
+        # Only worth keeping when the server lets us resume
+        if not self.validator:
+            return
+        now = time.perf_counter()
+        with self._lock:
+            if not force and now - self._last_save < STATE_INTERVAL:
+                return
+            self._last_save = now
+            state = {'url': self.request['url'], 'validator': self.validator,
+                     'segments': [[s.start, s.end, s.done] for s in self.segments]}
+            with open(self.state_path + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.replace(self.state_path + '.tmp', self.state_path)
+
+    def _get(self, segment: Optional[Segment] = None) -> 'requests.Response':
+        import requests
+
+        headers = {k: v for k, v in (self.request.get('headers') or {}).items()
+                   if k.lower() not in {'range', 'if-range', 'accept-encoding'}}
+        headers['Accept-Encoding'] = 'identity'
+        if segment is not None and (segment.position or segment.end is not None):
+            headers['Range'] = f'bytes={segment.position}-{"" if segment.end is None else segment.end}'
+            if self.validator:
+                headers['If-Range'] = self.validator
+
+        with requests.Session() as session:
+            return session.request(**{**self.request, 'headers': headers}, stream=True, timeout=self.timeout)
+
+    def _write(self, response: 'requests.Response', segment: Segment):
+        """Writes the body of the response to the segment's range of the part file."""
+        import requests
+        from urllib3.exceptions import HTTPError
+
+        try:
+            with open(self.part_path, 'r+b') as f:
+                f.seek(segment.position)
+                for chunk in response.raw.stream(self.chunk_size, decode_content=False):
+                    if self._cancelled.is_set():
+                        raise DownloadCancelled(f'Cancelled download of {self.request["url"]}')
+                    if segment.end is not None:
+                        # The first response is cut short when the rest of the body is split off
+                        chunk = chunk[:segment.end + 1 - segment.position]
+                    f.write(chunk)
+                    with self._lock:
+                        segment.done += len(chunk)
+                        self.received += len(chunk)
+                    self.progress.advance(len(chunk))
+                    self._save_state(force=False)
+                    if segment.finished:
+                        break
+        except HTTPError as e:
+            raise requests.exceptions.ChunkedEncodingError(e, request=response.request)
+        finally:
+            response.close()
+
+        if segment.end is not None and not segment.finished:
+            raise requests.exceptions.ChunkedEncodingError(
+                f'Got {segment.done} of {segment.end + 1 - segment.start} bytes from {self.request["url"]}',
+                request=response.request)
+        if segment.end is None:
+            segment.end = segment.position - 1
+
+    def _fetch(self, segment: Segment):
+        if segment.finished:
+            return
+        response = self._get(segment)
+        if response.status_code != 206 or _content_range_start(response) != segment.position:
+            response.close()
+            raise DownloadError(f'{self.request["url"]} no longer serves the ranges it advertised, '
+                                f'got {response.status_code}')
+        self._write(response, segment)
+
+    def _start(self) -> 'requests.Response':
+        """Sends the first request, resuming when there is a part file to resume, and plans the segments."""
+        resuming = self._load_state()
+        first = next((s for s in self.segments if not s.finished), self.segments[0]) if resuming else None
+        response = self._get(first)
+
+        if resuming and response.status_code == 206 and _content_range_start(response) == first.position:
+            log.info('Resuming download of %s to %s', self.request['url'], self.path)
+            total = self.segments[-1].end
+            self.progress.total = None if total is None else total + 1
+            self.progress.restart(sum(s.done for s in self.segments))
+            return response
+        if not response.ok:
+            return response
+
+        # A new download, or the body changed since the part file was written
+        self.validator = _validator(response)
+        total = int(response.headers['content-length']) if 'content-length' in response.headers else None
+        if (total is not None and self.connections > 1 and total >= self.min_split_size and self.validator
+                and response.headers.get('accept-ranges', '').lower() == 'bytes'):
+            self.segments = split(total, self.connections)
+        else:
+            self.segments = [Segment(0, None if total is None else total - 1)]
+        self.progress.total = total
+        self.progress.restart()
+
+        with open(self.part_path, 'wb') as f:
+            if total:
+                f.truncate(total)
+        self._save_state()
+        return response
+
+    def run(self) -> 'requests.Response':
+        """
+        Downloads the body, blocking until it is on disk. Returns the first
+        response, without its body, with the path it was saved to as
+        `download_path`. Error responses are returned with their body as usual.
+        """
+        response = self._start()
+        if not response.ok and response.status_code != 206:
+            response.content  # Read in error pages, they're small
+            return response
+
+        errors = []
+
+        def failed(e: BaseException):
+            # Stops the other ranges too, so the download can be resumed as a whole
+            errors.append(e)
+            self.cancel()
+
+        # None for empty bodies, and when every range was written before resuming
+        first = next((s for s in self.segments if not s.finished), None)
+        if first is None:
+            response.close()
+        else:
+            with ThreadPoolExecutor(self.connections, thread_name_prefix='download') as executor:
+                for segment in self.segments:
+                    if segment is not first:
+                        executor.submit(self._fetch, segment).add_done_callback(
+                            lambda f: f.exception() and failed(f.exception()))
+                try:
+                    self._write(response, first)
+                except BaseException as e:
+                    failed(e)
+        if errors:
+            self._save_state()
+            raise next((e for e in errors if not isinstance(e, DownloadCancelled)), errors[0])
+
+        os.replace(self.part_path, self.path)
+        try:
+            os.unlink(self.state_path)
+        except FileNotFoundError:
+            pass
+        log.info('Downloaded %s to %s', self.request['url'], self.path)
+
+        response._content = b''
+        response._content_consumed = True
+        response.download_path = self.path
+        response.wire_size = self.received
+        return response
+
+
+def _print_progress(progress: TransferProgress):
+    print(f'\r{progress.describe()}'.ljust(60), end='', file=sys.stderr, flush=True)
+
+
+def main(argv: List[str] = None):
+    from db import EnvironmentDAO, get_connection
+    from runner import find_request
+    from templating import RequestPlan
+
+    parser = argparse.ArgumentParser(description='Send a saved request and save the response body to a file, '
+                                                 'resuming an earlier download to the same file.')
+    parser.add_argument('--db', help='Path to the repose storage db')
+    parser.add_argument('--env', help='Environment whose variables are used in the request')
+    parser.add_argument('--connections', type=int, default=1,
+                        help='Download this many ranges in parallel when the server supports ranges')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for each read')
+    parser.add_argument('collection', help='Collection name or id')
+    parser.add_argument('request', help='Request name or id')
+    parser.add_argument('path', help='File to save the body to')
+    args = parser.parse_args(argv)
+
+    db = get_connection(args.db)
+    try:
+        record = find_request(db, args.collection, args.request)
+        if not record:
+            parser.error(f'No request {args.request} in collection {args.collection}')
+        variables = {}
+        if args.env:
+            env = EnvironmentDAO(db).get_environment(args.env)
+            if not env:
+                parser.error(f'No environment named {args.env}')
+            variables = env.as_dict()
+    finally:
+        db.close()
+
+    logging.basicConfig(level=logging.INFO)
+    download = Download(RequestPlan(record).render(variables), args.path, args.connections, _print_progress,
+                        args.timeout)
+    try:
+        response = download.run()
+    except KeyboardInterrupt:
+        parser.exit(130, '\nCancelled, run again to resume\n')
+    except Exception as e:
+        parser.exit(1, f'\nDownload failed, run again to resume: {e}\n')
+    print(file=sys.stderr)
+    if not getattr(response, 'download_path', None):
+        parser.exit(1, f'Got {response.status_code} {response.reason}\n')
+
+
+if __name__ == '__main__':
+    main()
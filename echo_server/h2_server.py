@@ -0,0 +1,165 @@
+"""
+HTTP/2 echo server for trying the http2 and h2c transports. Needs the `h2`
+package. Serves h2c with prior knowledge, or HTTP/2 over TLS negotiated with
+ALPN when given a certificate.
+
+    python -m echo_server.h2_server [--port 5001] [--certfile cert.pem --keyfile key.pem]
+
+Like the HTTP/1.1 echo server, responses echo the request body and headers,
+with the status set by x-response-code and a delay of x-sleep seconds. Every
+response also carries x-connection-id and x-stream-id, so multiplexed
+requests can be told apart.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import ssl
+from concurrent.futures import Future
+from typing import Dict, List, Set, Tuple
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+
+log = logging.getLogger(__name__)
+
+# Not echoed, as they describe the request's framing rather than its content
+HOP_BY_HOP = {'connection', 'keep-alive', 'content-length', 'transfer-encoding', 'content-encoding', 'te',
+              'trailer', 'upgrade', 'accept-encoding', 'host'}
+
+_connection_ids = itertools.count(1)
+
+
+class H2EchoProtocol(asyncio.Protocol):
+    def __init__(self):
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False,
+                                                                         header_encoding='utf-8'))
+        self.connection_id = next(_connection_ids)
+        self.transport = None
+        self.requests: Dict[int, Tuple[List[Tuple[str, str]], bytearray]] = {}
+        self.flow_waiters: Dict[int, asyncio.Future] = {}
+        self.tasks: Set[asyncio.Task] = set()
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.flush()
+
+    def connection_lost(self, exc):
+        for task in self.tasks:
+            task.cancel()
+        for waiter in self.flow_waiters.values():
+            waiter.cancel()
+
+    def flush(self):
+        data = self.conn.data_to_send()
+        if data and not self.transport.is_closing():
+            self.transport.write(data)
+
+    def data_received(self, data: bytes):
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError as e:
+            log.warning('Protocol error from a client %s', e)
+            self.flush()
+            self.transport.close()
+            return
+
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                self.requests[event.stream_id] = (list(event.headers), bytearray())
+            elif isinstance(event, h2.events.DataReceived):
+                if event.stream_id in self.requests:
+                    self.requests[event.stream_id][1].extend(event.data)
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                if event.stream_id in self.requests:
+                    task = asyncio.ensure_future(self.respond(event.stream_id, *self.requests.pop(event.stream_id)))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+            elif isinstance(event, h2.events.StreamReset):
+                self.requests.pop(event.stream_id, None)
+                waiter = self.flow_waiters.pop(event.stream_id, None)
+                if waiter:
+                    waiter.cancel()
+            elif isinstance(event, h2.events.WindowUpdated):
+                self.window_updated(event.stream_id)
+            elif isinstance(event, h2.events.ConnectionTerminated):
+                self.transport.close()
+        self.flush()
+
+    def window_updated(self, stream_id: int):
+        # Stream 0 is the connection, whose window every stream waits on
+        ids = list(self.flow_waiters) if stream_id == 0 else [stream_id]
+        for waiting_id in ids:
+            waiter = self.flow_waiters.pop(waiting_id, None)
+            if waiter and not waiter.done():
+                waiter.set_result(None)
+
+    async def respond(self, stream_id: int, headers: List[Tuple[str, str]], body: bytearray):
+        request_headers = dict(headers)
+        code = request_headers.get('x-response-code', '200')
+        delay = float(request_headers.get('x-sleep', 0) or 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        response_headers = [(':status', code), ('content-length', str(len(body))),
+                            ('x-connection-id', str(self.connection_id)), ('x-stream-id', str(stream_id))]
+        response_headers += [(k, v) for k, v in headers if not k.startswith(':') and k not in HOP_BY_HOP]
+        try:
+            self.conn.send_headers(stream_id, response_headers, end_stream=not body)
+            self.flush()
+            await self.send_body(stream_id, bytes(body))
+        except h2.exceptions.StreamClosedError:
+            pass
+
+    async def send_body(self, stream_id: int, data: bytes):
+        while data:
+            window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+            if window <= 0:
+                waiter = self.flow_waiters[stream_id] = asyncio.get_running_loop().create_future()
+                await waiter
+                continue
+            self.conn.send_data(stream_id, data[:window], end_stream=len(data) <= window)
+            data = data[window:]
+            self.flush()
+
+
+async def serve(host: str = '127.0.0.1', port: int = 5001, ssl_context: ssl.SSLContext = None,
+                started: Future = None):
+    """Serves until cancelled, resolving `started` with the bound port once listening."""
+    server = await asyncio.get_running_loop().create_server(H2EchoProtocol, host, port, ssl=ssl_context,
+                                                            backlog=4096)
+    bound = server.sockets[0].getsockname()[1]
+    if started is not None:
+        started.set_result(bound)
+    log.info('HTTP/2 echo server listening on %s://%s:%d', 'https' if ssl_context else 'http', host, bound)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Echoes HTTP/2 requests back, see the module docstring.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--certfile', help='Certificate to serve HTTP/2 over TLS with, h2c otherwise')
+    parser.add_argument('--keyfile', help='Private key of the certificate')
+    args = parser.parse_args(argv)
+
+    ssl_context = None
+    if args.certfile:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(args.certfile, args.keyfile)
+        ssl_context.set_alpn_protocols(['h2'])
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, ssl_context))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
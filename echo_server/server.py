@@ -1,22 +1,292 @@
-from time import sleep
+"""
+Echoes requests back, as a local target for sending, concurrency and load
+tests. Built on asyncio streams with no dependencies, so a single process
+holds thousands of concurrent connections; raise `ulimit -n` to match.
 
-from flask import Flask, request, Response
-from werkzeug.routing import Rule
+    python -m echo_server.server [--host 127.0.0.1] [--port 5000] [--seed N]
 
-app = Flask(__name__)
-app.url_map.add(Rule('/', endpoint='index'))
+The response echoes the request body and headers, shaped by these request
+headers:
 
+    x-response-code     status of the response, 200 by default
+    x-sleep             seconds to wait before responding
+    x-latency           random extra wait: uniform:<min>:<max>, normal:<mean>:<stddev>
+                        or exponential:<mean>, in seconds
+    x-response-size     respond with this many bytes instead of the echo, at most MAX_BODY
+    x-chunk-size        stream the body in chunks of this many bytes
+    x-chunk-delay       seconds to wait between chunks
+    x-gzip              gzip the body when set to 1
+    x-error-rate        probability of failing the request instead
+    x-error-code        status of those failures, 500 by default
+    x-fault             how to fail instead of with a status: reset closes the
+                        connection, hang never responds, truncate sends half the body
+"""
+import argparse
+import asyncio
+import gzip
+import logging
+import random
+from collections import namedtuple
+from concurrent.futures import Future
+from http import HTTPStatus
+from typing import List, Optional, Tuple
 
-@app.endpoint('index')
-def echo():
-    code = int(request.headers.get('x-response-code', 200))
-    timeout = float(request.headers.get('x-sleep', 0.0))
-    if timeout:
-        sleep(timeout)
+log = logging.getLogger(__name__)
 
-    return Response(response=request.data,
-                    status=code,
-                    headers=dict(request.headers.items()),
-                    mimetype=request.mimetype,
-                    content_type=request.content_type,
-                    direct_passthrough=True)
+MAX_HEADERS = 100
+MAX_LINE = 64 * 1024
+MAX_BODY = 1024 * 1024 * 1024
+
+# Not echoed, as they describe the request's framing rather than its content
+HOP_BY_HOP = {'connection', 'keep-alive', 'content-length', 'transfer-encoding', 'content-encoding', 'te',
+              'trailer', 'upgrade', 'expect', 'accept-encoding'}
+
+# Filler for sized responses, sliced rather than generated per request
+FILLER = bytes(range(32, 127)) * 1024
+
+Request = namedtuple('Request', ['method', 'target', 'version', 'headers', 'body'])
+
+
+class BadRequest(Exception):
+    pass
+
+
+class Fault(Exception):
+    """Ends the connection without a proper response."""
+
+
+def header(req: Request, name: str, default: str = None) -> Optional[str]:
+    return next((v for k, v in req.headers if k.lower() == name), default)
+
+
+async def read_line(reader: asyncio.StreamReader) -> bytes:
+    try:
+        return await reader.readline()
+    except ValueError:
+        # Raised by readline for lines over MAX_LINE
+        raise BadRequest('Line too long')
+
+
+async def read_chunked(reader: asyncio.StreamReader) -> bytes:
+    parts, size = [], 0
+    while True:
+        line = await read_line(reader)
+        try:
+            chunk_size = int(line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            raise BadRequest('Invalid chunk size')
+        if chunk_size < 0:
+            raise BadRequest('Invalid chunk size')
+        if chunk_size == 0:
+            # Skip any trailers
+            while (await read_line(reader)).strip():
+                pass
+            return b''.join(parts)
+
+        size += chunk_size
+        if size > MAX_BODY:
+            raise BadRequest('Body too large')
+        parts.append(await reader.readexactly(chunk_size))
+        await reader.readexactly(2)
+
+
+async def read_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[Request]:
+    line = await read_line(reader)
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise BadRequest('Invalid request line')
+
+    headers: List[Tuple[str, str]] = []
+    while True:
+        line = await read_line(reader)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise BadRequest('Too many headers')
+        name, sep, value = line.decode('latin-1').partition(':')
+        if not sep:
+            raise BadRequest('Invalid header')
+        headers.append((name.strip(), value.strip()))
+
+    req = Request(method.upper(), target, version, headers, b'')
+    if (header(req, 'expect') or '').lower() == '100-continue':
+        writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+    if (header(req, 'transfer-encoding') or '').lower().endswith('chunked'):
+        body = await read_chunked(reader)
+    else:
+        try:
+            length = int(header(req, 'content-length', '0') or 0)
+        except ValueError:
+            raise BadRequest('Invalid Content-Length')
+        if length < 0:
+            raise BadRequest('Invalid Content-Length')
+        if length > MAX_BODY:
+            raise BadRequest('Body too large')
+        body = await reader.readexactly(length) if length else b''
+    return req._replace(body=body)
+
+
+def sample_latency(spec: str, rnd: random.Random) -> float:
+    kind, *args = spec.split(':')
+    values = [float(a) for a in args]
+    if kind == 'uniform':
+        return rnd.uniform(*values)
+    if kind == 'normal':
+        return max(0.0, rnd.gauss(*values))
+    if kind == 'exponential':
+        return rnd.expovariate(1 / values[0])
+    raise ValueError(f'Unknown latency distribution {kind}')
+
+
+def filler(size: int) -> bytes:
+    if size <= len(FILLER):
+        return FILLER[:size]
+    return (FILLER * (size // len(FILLER) + 1))[:size]
+
+
+def status_line(code: int) -> bytes:
+    try:
+        reason = HTTPStatus(code).phrase
+    except ValueError:
+        reason = ''
+    return f'HTTP/1.1 {code} {reason}\r\n'.encode('latin-1')
+
+
+class EchoServer:
+    def __init__(self, seed: int = None):
+        self.random = random.Random(seed)
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    req = await read_request(reader, writer)
+                except BadRequest as e:
+                    await self.send_error(writer, 400, str(e))
+                    break
+                if req is None or not await self.respond(req, writer):
+                    break
+        except Fault:
+            transport = writer.transport
+            if transport is not None:
+                transport.abort()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def send_error(self, writer: asyncio.StreamWriter, code: int, message: str):
+        body = message.encode()
+        writer.write(status_line(code) + b'Content-Type: text/plain\r\nConnection: close\r\n'
+                     + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await writer.drain()
+
+    async def respond(self, req: Request, writer: asyncio.StreamWriter) -> bool:
+        """Sends the response to req, returning whether the connection can be kept alive."""
+        try:
+            code = int(header(req, 'x-response-code', '200'))
+            delay = float(header(req, 'x-sleep', '0') or 0)
+            if header(req, 'x-latency'):
+                delay += sample_latency(header(req, 'x-latency'), self.random)
+            size = header(req, 'x-response-size')
+            size = int(size) if size else None
+            if size is not None and size < 0:
+                raise ValueError(f'negative x-response-size {size}')
+            chunk_size = header(req, 'x-chunk-size')
+            chunk_size = int(chunk_size) if chunk_size else None
+            if chunk_size is not None and chunk_size <= 0:
+                raise ValueError(f'x-chunk-size must be positive, got {chunk_size}')
+            chunk_delay = float(header(req, 'x-chunk-delay', '0') or 0)
+            error_rate = float(header(req, 'x-error-rate', '0') or 0)
+            error_code = int(header(req, 'x-error-code', '500'))
+        except (ValueError, TypeError) as e:
+            await self.send_error(writer, 400, f'Invalid control header: {e}')
+            return False
+
+        # With an error rate, faults and error codes only affect that share of requests
+        failing = self.random.random() < error_rate if error_rate else True
+        fault = (header(req, 'x-fault') or '').lower() if failing else ''
+        if fault == 'hang':
+            await asyncio.Event().wait()
+        elif fault == 'reset':
+            raise Fault()
+        elif error_rate and failing and not fault:
+            code = error_code
+
+        if delay:
+            await asyncio.sleep(delay)
+
+        body = filler(min(size, MAX_BODY)) if size is not None else req.body
+        headers = [(k, v) for k, v in req.headers if k.lower() not in HOP_BY_HOP]
+        if header(req, 'x-gzip') == '1':
+            body = gzip.compress(body, compresslevel=1)
+            headers.append(('Content-Encoding', 'gzip'))
+        if req.method == 'HEAD':
+            body = b''
+
+        keep_alive = req.version == 'HTTP/1.1' and (header(req, 'connection') or '').lower() != 'close'
+        headers.append(('Connection', 'keep-alive' if keep_alive else 'close'))
+        if chunk_size:
+            headers.append(('Transfer-Encoding', 'chunked'))
+        else:
+            headers.append(('Content-Length', str(len(body))))
+
+        head = status_line(code) + ''.join(f'{k}: {v}\r\n' for k, v in headers).encode('latin-1') + b'\r\n'
+        writer.write(head)
+
+        if fault == 'truncate':
+            writer.write(body[:len(body) // 2])
+            await writer.drain()
+            raise Fault()
+
+        if chunk_size:
+            for i in range(0, len(body), chunk_size):
+                chunk = body[i:i + chunk_size]
+                writer.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n')
+                await writer.drain()
+                if chunk_delay:
+                    await asyncio.sleep(chunk_delay)
+            writer.write(b'0\r\n\r\n')
+        else:
+            writer.write(body)
+        await writer.drain()
+        return keep_alive
+
+
+async def serve(host: str = '127.0.0.1', port: int = 5000, backlog: int = 4096, seed: int = None,
+                started: Future = None):
+    """Serves until cancelled, resolving `started` with the bound port once listening."""
+    echo = EchoServer(seed)
+    server = await asyncio.start_server(echo.handle, host, port, backlog=backlog, limit=MAX_LINE)
+    if started is not None:
+        started.set_result(server.sockets[0].getsockname()[1])
+    log.info('Echo server listening on %s:%d', host, server.sockets[0].getsockname()[1])
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Echoes requests back, see the module docstring for the '
+                                                 'headers it accepts.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--backlog', type=int, default=4096, help='Pending connections queued by the os')
+    parser.add_argument('--seed', type=int, help='Seed for random latencies and errors')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.backlog, args.seed))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""
+Streaming HAR and JSONL exports of collections and request history.
+
+Rows are read off a sqlite cursor and written straight to disk, and bodies are
+copied over in chunks, so exports never build the whole document in memory.
+"""
+import argparse
+import base64
+import codecs
+import json
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, TextIO, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+from db import HistoryDAO, RequestDAO, CollectionDAO, HistoryRecord, NodeRecord, get_connection, load_node_record
+from models import FolderModel
+from utils import parse_content_type, content_type_map_reverse
+
+log = logging.getLogger(__name__)
+
+HAR = 'har'
+JSONL = 'jsonl'
+
+HAR_VERSION = '1.2'
+CREATOR = {'name': 'Repose', 'version': '0.1'}
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def format_for_path(path: str) -> str:
+    return HAR if path.lower().endswith('.har') else JSONL
+
+
+def is_text_mime_type(mime_type: str) -> bool:
+    mime_type = parse_content_type(mime_type).strip()
+    return (
+            mime_type.startswith('text/')
+            or mime_type in content_type_map_reverse
+            or mime_type.endswith(('+json', '+xml'))
+            or mime_type == 'application/x-www-form-urlencoded'
+    )
+
+
+def _write_object(f: TextIO, fields: dict, streamed: Dict[str, Callable[[], None]] = None):
+    """
+    Writes a json object whose small `fields` are dumped as usual, followed by
+    `streamed` fields whose values are written by their callbacks.
+    """
+    f.write(json.dumps(fields)[:-1])
+    sep = ', ' if fields else ''
+    for key, write_value in (streamed or {}).items():
+        f.write(f'{sep}{json.dumps(key)}: ')
+        write_value()
+        sep = ', '
+    f.write('}')
+
+
+def _write_string(f: TextIO, chunks: Iterable[bytes], as_base64: bool = False):
+    """Writes byte chunks as a single json string, decoded as utf-8 or base64 encoded."""
+    f.write('"')
+    if as_base64:
+        rest = b''
+        for chunk in chunks:
+            chunk = rest + chunk
+            cut = len(chunk) - len(chunk) % 3
+            f.write(base64.b64encode(chunk[:cut]).decode('ascii'))
+            rest = chunk[cut:]
+        f.write(base64.b64encode(rest).decode('ascii'))
+    else:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for chunk in chunks:
+            f.write(json.dumps(decoder.decode(chunk))[1:-1])
+        f.write(json.dumps(decoder.decode(b'', final=True))[1:-1])
+    f.write('"')
+
+
+def _har_headers(headers: List[Tuple[str, str]]) -> List[dict]:
+    return [{'name': k, 'value': v} for k, v in headers]
+
+
+def _header(headers: List[Tuple[str, str]], name: str, default: str = '') -> str:
+    return next((v for k, v in headers if k.lower() == name), default)
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+class HistoryExporter:
+    def __init__(self, dao: HistoryDAO = None):
+        self.dao = dao or HistoryDAO()
+
+    def export(self, path: str, fmt: str = None, start: float = None, end: float = None) -> int:
+        fmt = fmt or format_for_path(path)
+        with open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            records = self.dao.iter_history(start, end)
+            count = self._write_har(f, records) if fmt == HAR else self._write_jsonl(f, records)
+
+        log.info('Exported %d history entries to %s', count, path)
+        return count
+
+    def _body(self, f: TextIO, rec: HistoryRecord, column: str, as_base64: bool) -> Callable[[], None]:
+        return lambda: _write_string(f, self.dao.iter_body(rec.pk, column), as_base64)
+
+    def _write_jsonl(self, f: TextIO, records: Iterable[HistoryRecord]) -> int:
+        count = 0
+        for rec in records:
+            request_headers = json.loads(rec.request_headers_json or '[]')
+            response_headers = json.loads(rec.response_headers_json or '[]')
+            request_base64 = not is_text_mime_type(_header(request_headers, 'content-type'))
+            response_base64 = not is_text_mime_type(_header(response_headers, 'content-type'))
+            _write_object(f, {
+                'id': rec.pk,
+                'request_id': rec.request_pk,
+                'sent_at': _iso(rec.sent_at),
+                'elapsed': rec.elapsed,
+                'method': rec.method,
+                'url': rec.url,
+                'status': rec.status,
+                'reason': rec.reason,
+                'request_headers': request_headers,
+                'response_headers': response_headers,
+                'request_body_encoding': 'base64' if request_base64 else None,
+                'response_body_encoding': 'base64' if response_base64 else None,
+            }, {
+                'request_body': self._body(f, rec, 'request_body', request_base64),
+                'response_body': self._body(f, rec, 'response_body', response_base64),
+            })
+            f.write('\n')
+            count += 1
+        return count
+
+    def _write_har(self, f: TextIO, records: Iterable[HistoryRecord]) -> int:
+        f.write(f'{{"log": {{"version": "{HAR_VERSION}", "creator": {json.dumps(CREATOR)}, "entries": [\n')
+        count = 0
+        for rec in records:
+            if count:
+                f.write(',\n')
+            self._write_har_entry(f, rec)
+            count += 1
+        f.write('\n]}}\n')
+        return count
+
+    def _write_har_entry(self, f: TextIO, rec: HistoryRecord):
+        request_headers = json.loads(rec.request_headers_json or '[]')
+        response_headers = json.loads(rec.response_headers_json or '[]')
+        request_mime_type = _header(request_headers, 'content-type')
+        request_base64 = not is_text_mime_type(request_mime_type)
+        response_mime_type = _header(response_headers, 'content-type')
+        response_base64 = not is_text_mime_type(response_mime_type)
+
+        request = {
+            'method': rec.method,
+            'url': rec.url,
+            'httpVersion': 'HTTP/1.1',
+            'cookies': [],
+            'headers': _har_headers(request_headers),
+            'queryString': [{'name': k, 'value': v} for k, v in parse_qsl(urlsplit(rec.url).query)],
+            'headersSize': -1,
+            'bodySize': rec.request_body_size,
+        }
+        post_data = {}
+        if rec.request_body_size:
+            # HAR has no encoding for postData, binary bodies are marked the way content is
+            fields = {'mimeType': request_mime_type}
+            if request_base64:
+                fields['encoding'] = 'base64'
+            post_data['postData'] = lambda: _write_object(
+                f, fields, {'text': self._body(f, rec, 'request_body', request_base64)})
+
+        content = {'size': rec.response_body_size, 'mimeType': response_mime_type}
+        if response_base64:
+            content['encoding'] = 'base64'
+        response = {
+            'status': rec.status,
+            'statusText': rec.reason,
+            'httpVersion': 'HTTP/1.1',
+            'cookies': [],
+            'headers': _har_headers(response_headers),
+            'redirectURL': _header(response_headers, 'location'),
+            'headersSize': -1,
+            'bodySize': rec.response_body_size,
+        }
+
+        _write_object(f, {
+            'startedDateTime': _iso(rec.sent_at),
+            'time': rec.elapsed * 1000,
+            'cache': {},
+            'timings': {'send': 0, 'wait': rec.elapsed * 1000, 'receive': 0},
+        }, {
+            'request': lambda: _write_object(f, request, post_data),
+            'response': lambda: _write_object(f, response, {
+                'content': lambda: _write_object(f, content, {
+                    'text': self._body(f, rec, 'response_body', response_base64)
+                })
+            }),
+        })
+
+
+class CollectionExporter:
+    def __init__(self, dao: RequestDAO = None):
+        self.dao = dao or RequestDAO()
+
+    def export(self, path: str, collection_pk: str, fmt: str = None) -> int:
+        fmt = fmt or format_for_path(path)
+        with open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as f:
+            records = self.dao.iter_records(collection_pk)
+            count = self._write_har(f, records) if fmt == HAR else self._write_jsonl(f, records)
+
+        log.info('Exported %d collection nodes to %s', count, path)
+        return count
+
+    @staticmethod
+    def _write_jsonl(f: TextIO, records: Iterable[NodeRecord]) -> int:
+        count = 0
+        for rec in records:
+            loaded = load_node_record(rec)
+            is_folder = isinstance(loaded, FolderModel)
+            json.dump({
+                'id': rec.pk,
+                'collection_id': rec.collection_pk,
+                'parent_id': rec.parent_pk,
+                'folder': loaded.to_dict() if is_folder else None,
+                'request': None if is_folder else loaded.to_dict(),
+            }, f)
+            f.write('\n')
+            count += 1
+        return count
+
+    @staticmethod
+    def _write_har(f: TextIO, records: Iterable[NodeRecord]) -> int:
+        f.write(f'{{"log": {{"version": "{HAR_VERSION}", "creator": {json.dumps(CREATOR)}, "entries": [\n')
+        started = _iso(datetime.now(timezone.utc).timestamp())
+        count = 0
+        for rec in records:
+            loaded = load_node_record(rec)
+            if isinstance(loaded, FolderModel):
+                continue  # HAR has no notion of folders
+            if count:
+                f.write(',\n')
+            json.dump(_har_request_entry(loaded.to_dict(), started), f)
+            count += 1
+        f.write('\n]}}\n')
+        return count
+
+
+def _har_request_entry(req: dict, started: str) -> dict:
+    headers = [(k, v) for k, v, *_ in req.get('headers') or [] if k]
+    params = [(k, v) for k, v, *_ in req.get('params') or [] if k]
+    request = {
+        'method': req.get('method', 'GET'),
+        'url': req.get('url', ''),
+        'httpVersion': 'HTTP/1.1',
+        'cookies': [],
+        'headers': _har_headers(headers),
+        'queryString': _har_headers(params),
+        'headersSize': -1,
+        'bodySize': -1,
+    }
+
+    content_type = req.get('content_type') or ''
+    if content_type in {'multipart/form-data', 'application/x-www-form-urlencoded'}:
+        form = req.get('body_form_data' if content_type == 'multipart/form-data' else 'body_form_urlencoded')
+        request['postData'] = {'mimeType': content_type,
+                               'params': _har_headers([(k, v) for k, v, *_ in form or [] if k])}
+    elif content_type:
+        request['postData'] = {'mimeType': content_type, 'text': req.get('body_text', '')}
+
+    return {
+        'startedDateTime': started,
+        'time': 0,
+        'request': request,
+        'response': {
+            'status': 0, 'statusText': '', 'httpVersion': '', 'cookies': [], 'headers': [],
+            'content': {'size': 0, 'mimeType': ''}, 'redirectURL': '', 'headersSize': -1, 'bodySize': -1,
+        },
+        'cache': {},
+        'timings': {'send': 0, 'wait': 0, 'receive': 0},
+    }
+
+
+def _parse_time(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Export collections or request history to HAR or JSONL.')
+    parser.add_argument('--db', help='Path to the repose storage db')
+    sub = parser.add_subparsers(dest='what', required=True)
+
+    col = sub.add_parser('collection', help='Export the requests of a collection')
+    col.add_argument('collection', help='Collection name or id')
+    col.add_argument('out', help='Output file, .har for HAR and JSONL otherwise')
+
+    hist = sub.add_parser('history', help='Export executed requests and their responses')
+    hist.add_argument('--since', type=_parse_time, help='ISO 8601 start time, inclusive')
+    hist.add_argument('--until', type=_parse_time, help='ISO 8601 end time, exclusive')
+    hist.add_argument('out', help='Output file, .har for HAR and JSONL otherwise')
+
+    args = parser.parse_args(argv)
+    db = get_connection(args.db)
+    try:
+        if args.what == 'collection':
+            pk = CollectionDAO(db).find_pk(args.collection)
+            if not pk:
+                parser.error(f'No collection named {args.collection}')
+            CollectionExporter(RequestDAO(db)).export(args.out, pk)
+        else:
+            HistoryExporter(HistoryDAO(db)).export(args.out, start=args.since, end=args.until)
+    except sqlite3.Error as e:
+        parser.exit(1, f'Export failed: {e}\n')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
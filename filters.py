@@ -0,0 +1,125 @@
+"""
+JSONPath and XPath queries over response bodies, shared by the response
+filter in the ui and by response assertions.
+
+jsonpath_rw and lxml are imported on first use, as both are slow to import.
+"""
+import json
+from functools import lru_cache
+from typing import List
+
+JSON_TYPES = {'application/json'}
+XML_TYPES = {'text/xml', 'application/xml'}
+HTML_TYPES = {'text/html'}
+
+FILTERABLE_TYPES = JSON_TYPES | XML_TYPES | HTML_TYPES
+
+
+class FilterError(Exception):
+    pass
+
+
+@lru_cache(maxsize=256)
+def _compile_jsonpath(expr: str):
+    import jsonpath_rw
+    return jsonpath_rw.parse(expr)
+
+
+def _parse_markup(content_type: str, text: str):
+    from lxml import etree, html
+    if content_type in HTML_TYPES:
+        return html.fromstring(text)
+    return etree.fromstring(text.encode('utf-8'))
+
+
+def _parse_root(content_type: str, text: str):
+    try:
+        return _parse_markup(content_type, text)
+    except Exception as e:
+        raise FilterError(f'Invalid markup: {e}')
+
+
+def _xpath(root, expr: str) -> list:
+    try:
+        result = root.xpath(expr)
+    except Exception as e:
+        raise FilterError(f'Failed to evaluate XPath {expr}: {e}')
+    return result if isinstance(result, list) else [result]
+
+
+def query_json(doc, expr: str) -> list:
+    """Values matched by a JSONPath expression in an already decoded document."""
+    try:
+        return [match.value for match in _compile_jsonpath(expr).find(doc)]
+    except Exception as e:
+        raise FilterError(f'Invalid JSONPath {expr}: {e}')
+
+
+def query(content_type: str, text: str, expr: str) -> list:
+    """
+    Matches of a JSONPath or XPath expression, depending on the content type.
+    XPath matches are elements, or strings for text and attribute queries.
+    """
+    if content_type in JSON_TYPES:
+        try:
+            doc = json.loads(text)
+        except ValueError as e:
+            raise FilterError(f'Invalid json: {e}')
+        return query_json(doc, expr)
+
+    if content_type in XML_TYPES | HTML_TYPES:
+        return _xpath(_parse_root(content_type, text), expr)
+
+    raise FilterError(f'Can not filter {content_type or "untyped"} responses')
+
+
+def match_text(value) -> str:
+    """The text of a single match, as compared by assertions."""
+    if isinstance(value, str):
+        return value
+    if hasattr(value, 'tag'):
+        from lxml import etree
+        return etree.tostring(value, encoding='unicode', method='text').strip()
+    return json.dumps(value)
+
+
+def filter_text(content_type: str, text: str, expr: str) -> str:
+    """The matches of `expr`, formatted for display."""
+    matches = query(content_type, text, expr)
+    if content_type in JSON_TYPES:
+        return json.dumps(matches, indent=4) if matches else 'No matches found'
+
+    from lxml import etree
+    matches_root = etree.Element('matches')
+    for m in matches:
+        if hasattr(m, 'tag'):
+            matches_root.append(m)
+        else:
+            etree.SubElement(matches_root, 'match').text = str(m)
+    return etree.tostring(matches_root, encoding='unicode', pretty_print=True)
+
+
+def pretty_text(content_type: str, text: str) -> str:
+    """Indents json, xml and html bodies, other bodies are returned as is."""
+    if content_type in JSON_TYPES:
+        return json.dumps(json.loads(text), indent=2)
+    if content_type in XML_TYPES | HTML_TYPES:
+        from lxml import etree
+        return etree.tostring(_parse_markup(content_type, text), encoding='unicode', pretty_print=True)
+    return text
+
+
+def find_all(content_type: str, text: str, exprs: List[str]) -> List[list]:
+    """Matches of several expressions, parsing the body only once."""
+    if content_type in JSON_TYPES:
+        try:
+            doc = json.loads(text)
+        except ValueError as e:
+            raise FilterError(f'Invalid json: {e}')
+        return [query_json(doc, expr) for expr in exprs]
+
+    if content_type in XML_TYPES | HTML_TYPES:
+        root = _parse_root(content_type, text)
+        return [_xpath(root, expr) for expr in exprs]
+
+    raise FilterError(f'Can not filter {content_type or "untyped"} responses')
@@ -0,0 +1,126 @@
+"""
+Bundles the ui templates, css and images into a single compiled GResource.
+
+The bundle is rebuilt with glib-compile-resources whenever one of its files is
+newer than it. When it can't be built, or REPOSE_NO_GRESOURCE is set, assets
+are loaded from the loose files instead. Paths are resolved against the
+project root either way, so the app can be started from any directory.
+
+    python gresources.py
+"""
+import logging
+import os
+import shutil
+import subprocess
+import xml.etree.ElementTree as ElementTree
+from typing import List, Optional
+
+log = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MANIFEST = os.path.join(ROOT, 'resources', 'repose.gresource.xml')
+BUNDLE = os.path.join(ROOT, 'resources', 'repose.gresource')
+PREFIX = '/org/repose/Repose'
+
+ENV_VAR = 'REPOSE_NO_GRESOURCE'
+
+ICON = 'resources/img/nightcap-round-grey-100x100.png'
+
+_registered: Optional[bool] = None
+
+
+def manifest_files() -> List[str]:
+    """Project relative paths of the files listed in the manifest."""
+    tree = ElementTree.parse(MANIFEST)
+    return [f.text.strip() for f in tree.iter('file')]
+
+
+def is_stale() -> bool:
+    if not os.path.exists(BUNDLE):
+        return True
+    built = os.path.getmtime(BUNDLE)
+    sources = [MANIFEST] + [os.path.join(ROOT, f) for f in manifest_files()]
+    return any(os.path.getmtime(f) > built for f in sources)
+
+
+def compile_bundle() -> bool:
+    compiler = shutil.which('glib-compile-resources')
+    if not compiler:
+        log.warning('glib-compile-resources not found, loading ui files from disk')
+        return False
+
+    try:
+        subprocess.run([compiler, f'--sourcedir={ROOT}', f'--target={BUNDLE}', MANIFEST],
+                       check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        log.warning('Failed to compile %s, loading ui files from disk: %s', MANIFEST, e)
+        return False
+
+    log.info('Compiled resources to %s', BUNDLE)
+    return True
+
+
+def register() -> bool:
+    """Registers the bundle, building it first if needed. Returns whether resources are used."""
+    global _registered
+    if _registered is not None:
+        return _registered
+
+    _registered = False
+    if os.environ.get(ENV_VAR):
+        return False
+
+    try:
+        if is_stale() and not compile_bundle():
+            return False
+    except OSError as e:
+        # A read-only install without a usable bundle
+        log.warning('Failed to check %s: %s', BUNDLE, e)
+        if not os.path.exists(BUNDLE):
+            return False
+
+    from gi.repository import Gio, GLib
+    try:
+        Gio.Resource.load(BUNDLE)._register()
+    except GLib.Error as e:
+        log.warning('Failed to load %s, loading ui files from disk: %s', BUNDLE, e)
+        return False
+
+    _registered = True
+    return True
+
+
+def resource_path(path: str) -> str:
+    return f'{PREFIX}/{path}'
+
+
+def file_path(path: str) -> str:
+    return os.path.join(ROOT, path)
+
+
+def template(path: str):
+    """A Gtk.Template for the project relative `path`, e.g. ui/MainWindow.glade."""
+    from gi.repository import Gtk
+    if register():
+        return Gtk.Template.from_resource(resource_path(path))
+    return Gtk.Template.from_file(file_path(path))
+
+
+def load_css(provider, path: str):
+    if register():
+        provider.load_from_resource(resource_path(path))
+    else:
+        provider.load_from_path(file_path(path))
+
+
+def set_icon(window, path: str = ICON):
+    if register():
+        from gi.repository import GdkPixbuf
+        window.set_icon(GdkPixbuf.Pixbuf.new_from_resource(resource_path(path)))
+    else:
+        window.set_icon_from_file(file_path(path))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(0 if compile_bundle() else 1)
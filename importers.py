@@ -0,0 +1,333 @@
+"""
+Streaming importers for Postman, Insomnia and HAR files.
+
+Exports are parsed item by item with ijson when it is installed, so even very
+large files never have to be held in memory in full. Nodes are written to the
+db in large batched transactions as they are parsed.
+"""
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+from uuid import uuid1
+
+from db import RequestDAO, CollectionDAO
+from models import CollectionModel, RequestTreeNode, RequestRecord, FolderModel, POSITION_GAP
+from utils import parse_content_type
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = 2000
+
+POSTMAN = 'postman'
+INSOMNIA = 'insomnia'
+HAR = 'har'
+
+postman_language_map = {
+    'json': 'application/json',
+    'javascript': 'application/javascript',
+    'xml': 'application/xml',
+    'html': 'text/html',
+    'text': 'text/plain',
+}
+
+# (bytes read, total bytes, nodes imported)
+ProgressCallback = Callable[[int, int, int], None]
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+def detect_format(path: str) -> str:
+    """Sniffs the start of the file to tell which tool exported it."""
+    if path.lower().endswith('.har'):
+        return HAR
+
+    with open(path, 'rb') as f:
+        head = f.read(64 * 1024)
+
+    if b'"_type"' in head and b'"export"' in head:
+        return INSOMNIA
+    if b'"log"' in head and b'"entries"' in head:
+        return HAR
+    if b'schema.getpostman.com' in head or b'"_postman_id"' in head:
+        return POSTMAN
+
+    raise ValueError(f'Unrecognized import format for {path}')
+
+
+def _iter_items(f, prefix: str) -> Iterator:
+    """Yields each value found at the ijson style `prefix`, e.g. 'log.entries.item'."""
+    if ijson:
+        yield from ijson.items(f, prefix, use_float=True)
+        return
+
+    log.warning('ijson is not installed, falling back to loading the whole file.')
+    yield from _walk(json.load(f), prefix.split('.'))
+
+
+def _walk(value, keys: List[str]) -> Iterator:
+    if not keys:
+        yield value
+    elif isinstance(value, list) and keys[0] == 'item':
+        for v in value:
+            yield from _walk(v, keys[1:])
+    elif isinstance(value, dict) and keys[0] in value:
+        yield from _walk(value[keys[0]], keys[1:])
+
+
+def _first_item(path: str, prefix: str, default=None):
+    with open(path, 'rb') as f:
+        return next(_iter_items(f, prefix), default)
+
+
+def _text(value) -> str:
+    if isinstance(value, dict):  # Postman descriptions may be {content, type}
+        value = value.get('content', '')
+    return '' if value is None else str(value)
+
+
+def _rows(items: Iterable[dict], key='key', value='value') -> List[Tuple[str, str, str]]:
+    return [(_text(i.get(key)), _text(i.get(value)), _text(i.get('description')))
+            for i in items or [] if not i.get('disabled')]
+
+
+def _form_rows(items: Iterable[dict]) -> List[tuple]:
+    """Postman formdata rows, with file rows flagged and the path of their file in src as the value."""
+    rows = []
+    for i in items or []:
+        if i.get('disabled'):
+            continue
+        if i.get('type') == 'file':
+            src = i.get('src')
+            src = (src[0] if src else '') if isinstance(src, list) else src
+            rows.append((_text(i.get('key')), _text(src), _text(i.get('description')), True))
+        else:
+            rows.append((_text(i.get('key')), _text(i.get('value')), _text(i.get('description'))))
+    return rows
+
+
+def _strip_query(url: str) -> str:
+    return url.split('?', 1)[0]
+
+
+def _postman_request(item: dict) -> RequestRecord:
+    req = item.get('request') or {}
+    if isinstance(req, str):  # Shorthand for a GET to the url
+        req = {'url': req}
+
+    url = req.get('url') or ''
+    params = []
+    if isinstance(url, dict):
+        params = _rows(url.get('query'))
+        url = _strip_query(url.get('raw', '')) if params else url.get('raw', '')
+
+    headers = _rows(req.get('header'))
+    body = req.get('body') or {}
+    mode = body.get('mode')
+    content_type, body_text, form_data, form_urlencoded = '', '', None, None
+    if mode == 'raw':
+        language = ((body.get('options') or {}).get('raw') or {}).get('language', 'text')
+        content_type = postman_language_map.get(language, 'text/plain')
+        body_text = body.get('raw', '')
+    elif mode == 'urlencoded':
+        content_type = 'application/x-www-form-urlencoded'
+        form_urlencoded = _rows(body.get('urlencoded'))
+    elif mode == 'formdata':
+        content_type = 'multipart/form-data'
+        form_data = _form_rows(body.get('formdata'))
+
+    return RequestRecord(name=_text(item.get('name')),
+                         method=req.get('method', 'GET'),
+                         url=url,
+                         params=params,
+                         headers=headers,
+                         content_type=content_type,
+                         body_text=body_text,
+                         body_form_data=form_data,
+                         body_form_urlencoded=form_urlencoded)
+
+
+def _postman_nodes(item: dict, collection_pk: str, parent_pk: str = None) -> Iterator[RequestTreeNode]:
+    if 'item' in item:
+        folder = RequestTreeNode(parent_pk, collection_pk, folder=FolderModel(_text(item.get('name'))))
+        yield folder
+        for child in item['item']:
+            yield from _postman_nodes(child, collection_pk, folder.pk)
+    else:
+        yield RequestTreeNode(parent_pk, collection_pk, record=_postman_request(item))
+
+
+def _insomnia_request(res: dict) -> RequestRecord:
+    body = res.get('body') or {}
+    content_type = body.get('mimeType') or ''
+    form_data, form_urlencoded = None, None
+    if content_type == 'multipart/form-data':
+        form_data = _rows(body.get('params'), key='name')
+    elif content_type == 'application/x-www-form-urlencoded':
+        form_urlencoded = _rows(body.get('params'), key='name')
+
+    return RequestRecord(name=_text(res.get('name')),
+                         method=res.get('method', 'GET'),
+                         url=res.get('url', ''),
+                         params=_rows(res.get('parameters'), key='name'),
+                         headers=_rows(res.get('headers'), key='name'),
+                         content_type=content_type,
+                         body_text=body.get('text', ''),
+                         body_form_data=form_data,
+                         body_form_urlencoded=form_urlencoded)
+
+
+def _har_request(entry: dict) -> RequestRecord:
+    req = entry.get('request') or {}
+    url = req.get('url', '')
+    query = _rows(req.get('queryString'), key='name')
+    headers = [h for h in _rows(req.get('headers'), key='name') if not h[0].startswith(':')]
+
+    post_data = req.get('postData') or {}
+    content_type = parse_content_type(post_data.get('mimeType', '')).strip()
+    form_data, form_urlencoded = None, None
+    if content_type == 'multipart/form-data':
+        form_data = _rows(post_data.get('params'), key='name')
+    elif content_type == 'application/x-www-form-urlencoded':
+        form_urlencoded = _rows(post_data.get('params'), key='name')
+
+    method = req.get('method', 'GET')
+    return RequestRecord(name=f'{method} {urlsplit(url).path or "/"}',
+                         method=method,
+                         url=_strip_query(url) if query else url,
+                         params=query,
+                         headers=headers,
+                         content_type=content_type,
+                         body_text=post_data.get('text', ''),
+                         body_form_data=form_data,
+                         body_form_urlencoded=form_urlencoded)
+
+
+class Importer:
+    """
+    Imports a single export file into a new collection. Meant to be run on the
+    db writer thread; `cancel` may be set from any thread to stop the import,
+    in which case everything imported so far is removed again.
+    """
+
+    def __init__(self, path: str,
+                 fmt: str = None,
+                 request_dao: RequestDAO = None,
+                 collection_dao: CollectionDAO = None,
+                 batch_size: int = BATCH_SIZE,
+                 progress: Optional[ProgressCallback] = None,
+                 cancel: Optional[threading.Event] = None):
+        self.path = path
+        self.fmt = fmt or detect_format(path)
+        self.request_dao = request_dao or RequestDAO()
+        self.collection_dao = collection_dao or CollectionDAO(self.request_dao.db, self.request_dao)
+        self.batch_size = batch_size
+        self.progress = progress
+        self.cancel = cancel or threading.Event()
+
+        self.total_bytes = os.path.getsize(path)
+        self.imported = 0
+        self._file = None
+        self._batch: List[RequestTreeNode] = []
+
+    def run(self) -> CollectionModel:
+        collection = CollectionModel(self._unique_name(self._collection_name()))
+        self.collection_dao.save_collection(collection)
+
+        try:
+            with open(self.path, 'rb') as self._file:
+                nodes = {
+                    POSTMAN: self._postman_nodes,
+                    INSOMNIA: self._insomnia_nodes,
+                    HAR: self._har_nodes,
+                }[self.fmt](collection)
+
+                for node in nodes:
+                    self._add(node)
+                self._flush()
+        except BaseException:
+            log.info('Import of %s stopped, removing partial collection.', self.path)
+            self.collection_dao.delete_collection(collection.pk)
+            raise
+
+        log.info('Imported %d nodes from %s', self.imported, self.path)
+        return collection
+
+    def _collection_name(self) -> str:
+        name = None
+        if self.fmt == POSTMAN:
+            name = _first_item(self.path, 'info.name')
+        return name or Path(self.path).stem
+
+    def _unique_name(self, name: str) -> str:
+        unique, n = name, 1
+        while self.collection_dao.name_exists(unique):
+            n += 1
+            unique = f'{name} ({n})'
+        return unique
+
+    def _add(self, node: RequestTreeNode):
+        if self.cancel.is_set():
+            raise ImportCancelled()
+
+        # Nodes come in the order of their siblings, whatever their parent
+        node.position = (self.imported + len(self._batch) + 1) * POSITION_GAP
+        self._batch.append(node)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        self.request_dao.save_requests(self._batch)
+        self.imported += len(self._batch)
+        self._batch = []
+
+        if self.progress:
+            self.progress(self._file.tell(), self.total_bytes, self.imported)
+
+    def _postman_nodes(self, collection: CollectionModel) -> Iterator[RequestTreeNode]:
+        for item in _iter_items(self._file, 'item.item'):
+            yield from _postman_nodes(item, collection.pk)
+
+    def _insomnia_nodes(self, collection: CollectionModel) -> Iterator[RequestTreeNode]:
+        # Resources reference their parents by id and may come in any order,
+        # so ids are mapped up front and workspace parents are cleared after.
+        pks = {}
+        workspaces = []
+
+        def pk_for(res_id):
+            return pks.setdefault(res_id, str(uuid1())) if res_id else None
+
+        for res in _iter_items(self._file, 'resources.item'):
+            res_type = res.get('_type')
+            if res_type == 'workspace':
+                workspaces.append(pk_for(res['_id']))
+                if len(workspaces) == 1 and res.get('name'):
+                    collection.name = self._unique_name(_text(res['name']))
+            elif res_type == 'request_group':
+                yield RequestTreeNode(pk_for(res.get('parentId')), collection.pk,
+                                      pk=pk_for(res['_id']), folder=FolderModel(_text(res.get('name'))))
+            elif res_type == 'request':
+                yield RequestTreeNode(pk_for(res.get('parentId')), collection.pk,
+                                      pk=pk_for(res['_id']), record=_insomnia_request(res))
+
+        self._flush()
+        self.request_dao.detach_children(collection.pk, workspaces)
+        self.collection_dao.save_collection(collection)
+
+    def _har_nodes(self, collection: CollectionModel) -> Iterator[RequestTreeNode]:
+        for entry in _iter_items(self._file, 'log.entries.item'):
+            yield RequestTreeNode(None, collection.pk, record=_har_request(entry))
+
+
+def import_file(path: str, **kwargs) -> CollectionModel:
+    return Importer(path, **kwargs).run()
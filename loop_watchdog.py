@@ -0,0 +1,213 @@
+"""
+Opt-in detector for stalls of the GLib main loop, enabled by setting
+REPOSE_WATCHDOG to 1 or to a threshold in milliseconds (100 by default).
+
+A heartbeat on the main loop measures how late each iteration runs. A
+background thread samples the main thread's python stack while a heartbeat
+is overdue, so every stall longer than the threshold is logged along with
+the handler it happened in and where the time went. On exit a report of the
+worst handlers is written to `stalls.log` in the data dir.
+"""
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque, namedtuple
+from typing import Deque, Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+ENV_VAR = 'REPOSE_WATCHDOG'
+
+DEFAULT_THRESHOLD_MS = 100
+
+# Stack samples kept per stall
+MAX_SAMPLES = 500
+# Heartbeat delays kept for the latency percentiles
+MAX_LATENCIES = 100_000
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+Frame = Tuple[str, int, str]  # (filename, line, function)
+
+Stall = namedtuple('Stall', ['duration_ms', 'handler', 'hot_frame', 'stack'])
+
+
+def _is_app_frame(frame: Frame) -> bool:
+    filename = frame[0]
+    return filename.startswith(ROOT) and not filename.endswith(('loop_watchdog.py', 'main.py'))
+
+
+def _describe(frame: Optional[Frame]) -> str:
+    if frame is None:
+        return 'unknown'
+    filename, line, name = frame
+    return f'{name} ({os.path.relpath(filename, ROOT)}:{line})'
+
+
+def _sample_stack(frame) -> Tuple[Frame, ...]:
+    """The frames of a stack, outermost first."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, frame.f_lineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _format_stack(stack: Tuple[Frame, ...]) -> str:
+    if not stack:
+        return '  (no samples)'
+    summary = traceback.StackSummary.from_list([(f, line, name, None) for f, line, name in stack])
+    return ''.join(summary.format()).rstrip()
+
+
+class HandlerStats:
+    __slots__ = ('count', 'total_ms', 'max_ms', 'hot_frames')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.hot_frames: Counter = Counter()
+
+
+class MainLoopWatchdog:
+    def __init__(self, threshold_ms: float = DEFAULT_THRESHOLD_MS, interval_ms: int = 10,
+                 sample_ms: float = 5, log_path: str = None):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.sample_interval = sample_ms / 1000
+        self.log_path = log_path
+
+        self.main_thread_id = threading.main_thread().ident
+        self.latencies: Deque[float] = deque(maxlen=MAX_LATENCIES)
+        self.stalls: List[Stall] = []
+        self.handlers: Dict[Frame, HandlerStats] = {}
+
+        self._lock = threading.Lock()
+        self._last_beat = time.perf_counter()
+        self._samples: List[Tuple[Frame, ...]] = []
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._source_id = None
+
+    @classmethod
+    def from_env(cls) -> Optional['MainLoopWatchdog']:
+        value = os.environ.get(ENV_VAR)
+        if not value:
+            return None
+
+        from config import DATA_DIR
+        threshold = DEFAULT_THRESHOLD_MS if value == '1' else float(value)
+        return cls(threshold, log_path=f'{DATA_DIR}/stalls.log')
+
+    def start(self, use_main_loop: bool = True):
+        """Starts sampling, and the heartbeat unless the caller calls beat() itself."""
+        self._last_beat = time.perf_counter()
+        if use_main_loop:
+            from gi.repository import GLib
+            self._source_id = GLib.timeout_add(int(self.interval * 1000), self._on_timeout)
+
+        self._thread = threading.Thread(target=self._watch, name='main-loop-watchdog', daemon=True)
+        self._thread.start()
+        log.info('Watching for main loop stalls over %.0f ms', self.threshold * 1000)
+
+    def _on_timeout(self) -> bool:
+        self.beat()
+        return not self._stopped.is_set()
+
+    def beat(self):
+        """Called from the main loop, closes any stall that it has just recovered from."""
+        now = time.perf_counter()
+        with self._lock:
+            gap = now - self._last_beat
+            self._last_beat = now
+            samples, self._samples = self._samples, []
+
+        self.latencies.append(max(0.0, gap - self.interval))
+        if gap > self.threshold:
+            self._record_stall(gap * 1000, samples)
+
+    def _watch(self):
+        while not self._stopped.wait(self.sample_interval):
+            with self._lock:
+                last_beat = self._last_beat
+                if time.perf_counter() - last_beat < self.threshold or len(self._samples) >= MAX_SAMPLES:
+                    continue
+
+            # Sampled outside the lock, so beat() never waits on it. Source
+            # lines are only looked up when a stall is formatted.
+            stack = _sample_stack(sys._current_frames().get(self.main_thread_id))
+            if not stack:
+                continue
+            with self._lock:
+                # Samples taken as the stall ended belong to no stall
+                if self._last_beat == last_beat and len(self._samples) < MAX_SAMPLES:
+                    self._samples.append(stack)
+
+    def _record_stall(self, duration_ms: float, samples: List[Tuple[Frame, ...]]):
+        stack = Counter(samples).most_common(1)[0][0] if samples else ()
+        app_frames = [f for f in stack if _is_app_frame(f)]
+        # The outermost app frame is the handler the main loop called into,
+        # the innermost is where that handler spent its time.
+        handler = app_frames[0] if app_frames else None
+        hot_frame = app_frames[-1] if app_frames else None
+
+        stall = Stall(duration_ms, handler, hot_frame, stack)
+        self.stalls.append(stall)
+
+        stats = self.handlers.setdefault(handler, HandlerStats())
+        stats.count += 1
+        stats.total_ms += duration_ms
+        stats.max_ms = max(stats.max_ms, duration_ms)
+        for sample in samples:
+            inner = [f for f in sample if _is_app_frame(f)]
+            stats.hot_frames[inner[-1] if inner else None] += 1
+
+        log.warning('Main loop stalled for %.0f ms in %s\n%s', duration_ms, _describe(handler), _format_stack(stack))
+
+    def report(self, top: int = 20) -> str:
+        lines = []
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            pct = {p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000 for p in (50, 95, 99)}
+            lines.append(f'Main loop latency over {len(ordered)} iterations: p50 {pct[50]:.1f} ms, '
+                         f'p95 {pct[95]:.1f} ms, p99 {pct[99]:.1f} ms, max {ordered[-1] * 1000:.1f} ms')
+
+        total = sum(s.duration_ms for s in self.stalls)
+        lines.append(f'{len(self.stalls)} stalls over {self.threshold * 1000:.0f} ms, {total:.0f} ms in total')
+        if not self.stalls:
+            return '\n'.join(lines)
+
+        lines += ['', 'Worst handlers (stalls, total, max, median):']
+        ranked = sorted(self.handlers.items(), key=lambda i: i[1].total_ms, reverse=True)[:top]
+        for handler, stats in ranked:
+            durations = [s.duration_ms for s in self.stalls if s.handler == handler]
+            lines.append(f'  {stats.count:5d} {stats.total_ms:9.0f} ms {stats.max_ms:8.0f} ms '
+                         f'{statistics.median(durations):8.0f} ms  {_describe(handler)}')
+            for frame, count in stats.hot_frames.most_common(3):
+                if frame != handler:
+                    lines.append(f'{"":37}{count:5d} samples in {_describe(frame)}')
+        return '\n'.join(lines)
+
+    def stop(self) -> str:
+        """Stops watching and writes the report. Returns the report."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        if self._source_id is not None:
+            from gi.repository import GLib
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+
+        report = self.report()
+        log.info('Main loop watchdog report\n%s', report)
+        if self.log_path:
+            with open(self.log_path, 'w') as f:
+                f.write(report + '\n')
+        return report
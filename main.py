@@ -1,24 +1,18 @@
 import logging
 
-import gi
-gi.require_version("Gtk", "3.0")
-gi.require_version('GtkSource', '4')
-gi.require_version('WebKit2', '4.0')  # TODO: Ensure we don't crash if webkit isn't available
-from gi.repository import Gtk, GtkSource, Gdk
-
-from widgets.main_window import MainWindow
-
-logging.basicConfig(
-    format='%(asctime)s - %(module)s - [%(levelname)s] %(message)s',
-    datefmt='%m/%d/%Y %I:%M:%S %p',
-    level=logging.INFO)
+from tracing import StartupTracer
 
 log = logging.getLogger(__name__)
 
+# Set up under the __main__ guard: spawned assertion workers import this
+# module as __mp_main__ and must not load gtk or start the tracer and watchdog
+TRACER: StartupTracer = None
+WATCHDOG = None
+
 
 def create_non_gtk_widgets():
-    sv = GtkSource.View()
-    sv.destroy()
+    # Registers the type so templates can use it, without building a widget
+    GObject.type_ensure(GtkSource.View)
 
 
 # Can we do this during install?
@@ -26,22 +20,82 @@ def create_user_dirs():
     log.info('Ensuring data directories exist.')
 
 
-# TODO: Loading screen for starting db, creating user dirs etc?
+def prewarm_imports():
+    # Imported off the main thread, so the first request doesn't pay for it
+    import requests  # noqa: F401
+
+
+def show_main_window(loading_window):
+    with TRACER.phase('import main window'):
+        from widgets.main_window import MainWindow
+    with TRACER.phase('create main window'):
+        MainWindow()
+
+    loading_window.destroy()
+    log.info('Starting application.')
+    GLib.idle_add(TRACER.finish)
+    return False
+
+
+def start(loading_window):
+    # Importing db opens the connection and migrates it on the writer thread
+    with TRACER.phase('import db'):
+        from db import submit_write
+        from pool import TPE
+        from metrics import METRICS
+
+    TPE.submit(prewarm_imports)
+    METRICS.configure_from_env()
+    submit_write(lambda: None).add_done_callback(lambda _: show_main_window(loading_window))
+    return False
 
 
 if __name__ == '__main__':
+    # Installed before anything else is imported, so that every import is timed
+    TRACER = StartupTracer.from_env()
+
+    with TRACER.phase('import gi'):
+        import gi
+        gi.require_version("Gtk", "3.0")
+        gi.require_version('GtkSource', '4')
+        from gi.repository import Gtk, GtkSource, Gdk, GLib, GObject
+
+    import gresources
+    from loop_watchdog import MainLoopWatchdog
+
+    logging.basicConfig(
+        format='%(asctime)s - %(module)s - [%(levelname)s] %(message)s',
+        datefmt='%m/%d/%Y %I:%M:%S %p',
+        level=logging.INFO)
+
+    WATCHDOG = MainLoopWatchdog.from_env()
+
     create_user_dirs()
     log.info('Bootstrapping gtk resources.')
-    create_non_gtk_widgets()
+    with TRACER.phase('register resources'):
+        gresources.register()
+    with TRACER.phase('register widgets'):
+        create_non_gtk_widgets()
 
-    css_provider = Gtk.CssProvider()
-    css_provider.load_from_path('ui/style.css')
+    with TRACER.phase('load css'):
+        css_provider = Gtk.CssProvider()
+        gresources.load_css(css_provider, 'ui/style.css')
 
-    Gtk.StyleContext().add_provider_for_screen(
-        Gdk.Screen().get_default(),
-        css_provider,
-        Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+        Gtk.StyleContext().add_provider_for_screen(
+            Gdk.Screen().get_default(),
+            css_provider,
+            Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
 
-    MainWindow()
-    log.info('Starting application.')
+    with TRACER.phase('show loading window'):
+        from widgets.loading_window import LoadingWindow
+        loading = LoadingWindow()
+        loading.show_all()
+
+    if WATCHDOG:
+        WATCHDOG.start()
+
+    GLib.idle_add(start, loading)
     Gtk.main()
+
+    if WATCHDOG:
+        WATCHDOG.stop()
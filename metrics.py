@@ -0,0 +1,240 @@
+"""
+In-process metrics of every request sent, whether from the editor, a data
+driven run or the cli.
+
+Each send is recorded with its method, host, status, size, error class and
+the time spent in each phase:
+
+    render      expanding templates into the request
+    wait        from sending until the response headers were read
+    download    reading the response body
+    assertions  evaluating the request's assertions
+    total       all of the above
+
+The registry keeps counters and latency histograms per method, host and
+status. They can be scraped as OpenMetrics text from localhost by setting
+REPOSE_METRICS_PORT, and every sample can be appended to a rolling JSONL log
+by setting REPOSE_METRICS_LOG to a path, or to 1 for `metrics.jsonl` in the
+data dir.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    import requests
+
+log = logging.getLogger(__name__)
+
+PORT_ENV_VAR = 'REPOSE_METRICS_PORT'
+LOG_ENV_VAR = 'REPOSE_METRICS_LOG'
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The JSONL log is rolled over at this size, keeping LOG_BACKUPS old files
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 3
+
+Sample = namedtuple('Sample', ['time', 'source', 'method', 'host', 'status', 'bytes', 'error', 'timings'])
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def request_timings(start: float, sent: float, received: float, finished: float,
+                    response: 'requests.Response' = None) -> Dict[str, float]:
+    """
+    Phase timings from perf_counter readings taken before rendering, before
+    sending, once the response was read and once it was checked.
+    """
+    timings = {'render': sent - start}
+    if response is not None:
+        wait = min(response.elapsed.total_seconds(), received - sent)
+        timings['wait'] = wait
+        timings['download'] = received - sent - wait
+        timings['assertions'] = finished - received
+    timings['total'] = finished - start
+    return timings
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: Dict[Labels, int] = {}
+        self._errors: Dict[Labels, int] = {}
+        self._bytes: Dict[Labels, int] = {}
+        self._durations: Dict[Labels, Histogram] = {}
+        self._log: Optional[logging.Logger] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def observe(self, source: str, method: str, url: str, response: 'requests.Response' = None,
+                error: Exception = None, timings: Dict[str, float] = None) -> Sample:
+        """Records a send, which either got a response or failed with an error."""
+        host = urlsplit(url).netloc or url
+        status = response.status_code if response is not None else None
+        size = None
+        if response is not None:
+            # Downloaded bodies went to a file, what was received is counted instead
+            size = response.wire_size if getattr(response, 'download_path', None) else len(response.content)
+        sample = Sample(time.time(), source, method, host, status, size,
+                        type(error).__name__ if error else None, timings or {})
+
+        labels = (('source', source), ('method', method), ('host', host))
+        with self._lock:
+            request_labels = labels + (('status', str(status or '')),)
+            self._requests[request_labels] = self._requests.get(request_labels, 0) + 1
+            if error:
+                error_labels = labels + (('error', sample.error),)
+                self._errors[error_labels] = self._errors.get(error_labels, 0) + 1
+            if size is not None:
+                self._bytes[labels] = self._bytes.get(labels, 0) + size
+            for phase, seconds in sample.timings.items():
+                phase_labels = labels + (('phase', phase),)
+                histogram = self._durations.get(phase_labels)
+                if histogram is None:
+                    histogram = self._durations[phase_labels] = Histogram()
+                histogram.observe(seconds)
+
+        if self._log:
+            self._log.info(json.dumps(sample._asdict()))
+        return sample
+
+    def render(self) -> str:
+        """The registry in the OpenMetrics text format."""
+        with self._lock:
+            requests_, errors = dict(self._requests), dict(self._errors)
+            sizes = dict(self._bytes)
+            durations = {k: (list(h.counts), h.sum) for k, h in self._durations.items()}
+
+        lines: List[str] = []
+
+        def counter(name: str, help_text: str, values: Dict[Labels, int]):
+            lines.extend([f'# TYPE {name} counter', f'# HELP {name} {help_text}'])
+            lines.extend(f'{name}_total{_format_labels(labels)} {value}' for labels, value in sorted(values.items()))
+
+        counter('repose_requests', 'Requests sent.', requests_)
+        counter('repose_request_errors', 'Requests that failed without a response.', errors)
+        counter('repose_response_bytes', 'Bytes of response bodies received.', sizes)
+
+        name = 'repose_request_duration_seconds'
+        lines.extend([f'# TYPE {name} histogram', f'# HELP {name} Time spent in each phase of a request.',
+                      f'# UNIT {name} seconds'])
+        for labels, (counts, total) in sorted(durations.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._requests.clear()
+            self._errors.clear()
+            self._bytes.clear()
+            self._durations.clear()
+
+    def log_to(self, path: str, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS):
+        """Appends every sample to a JSONL file, rolled over once it reaches max_bytes."""
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        sample_log = logging.getLogger(f'{__name__}.samples')
+        sample_log.propagate = False
+        sample_log.setLevel(logging.INFO)
+        for old in list(sample_log.handlers):
+            sample_log.removeHandler(old)
+            old.close()
+        sample_log.addHandler(handler)
+        self._log = sample_log
+
+    def serve(self, port: int = 0, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Serves the registry at /metrics on a background thread. Port 0 picks a free one."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in {'/', '/metrics'}:
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                log.debug(fmt, *args)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='metrics-server', daemon=True).start()
+        log.info('Serving metrics on http://%s:%d/metrics', host, self._server.server_address[1])
+        return self._server
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._log:
+            for handler in list(self._log.handlers):
+                self._log.removeHandler(handler)
+                handler.close()
+            self._log = None
+
+    def configure_from_env(self):
+        """Starts the endpoint and the log when enabled by their environment variables."""
+        path = os.environ.get(LOG_ENV_VAR)
+        if path:
+            if path == '1':
+                from config import DATA_DIR
+                os.makedirs(DATA_DIR, exist_ok=True)
+                path = f'{DATA_DIR}/metrics.jsonl'
+            self.log_to(path)
+
+        port = os.environ.get(PORT_ENV_VAR)
+        if port:
+            try:
+                self.serve(int(port))
+            except (OSError, ValueError) as e:
+                log.error('Failed to serve metrics on port %s %s', port, e)
+
+
+METRICS = MetricsRegistry()
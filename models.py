@@ -1,131 +1,102 @@
 import logging
-import requests
-
-from gi.repository import GLib, GObject
+from bisect import bisect_left
+from operator import attrgetter
 from uuid import uuid1
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
 
-from utils import content_type_map_reverse
+if TYPE_CHECKING:
+    from request_model import RequestModel
 
 log = logging.getLogger(__name__)
 
+# Space left between the positions of siblings, so a node can be moved between
+# two others by only changing its own position
+POSITION_GAP = 1 << 16
+
+# Where a node is dropped relative to the node under the pointer
+DROP_BEFORE = 'before'
+DROP_AFTER = 'after'
+DROP_INTO = 'into'
+
 
 class MainModel:
     def __init__(self):
         self.requests: Dict[str, RequestTreeNode] = {}
 
 
-class RequestModel(GObject.GObject):
-    __gsignals__ = {
-        'request_finished': (GObject.SIGNAL_RUN_FIRST, None, ())
-    }
+class RequestRecord:
+    """
+    The stored fields of a request. Kept deliberately small, as one is held
+    for every request in every loaded collection.
+    """
+    __slots__ = ('url', 'method', 'name', 'params', 'headers', 'content_type',
+                 'body_text', 'body_form_data', 'body_form_urlencoded', 'assertions', 'body_file',
+                 'body_encoding')
 
     def __init__(self,
                  url: str = '',
                  method: str = 'GET',
                  name: str = '',
-                 params: List[Tuple[str, str, str]] = None,
-                 headers: List[Tuple[str, str, str]] = None,
+                 params: List[Tuple[str, str, str]] = (),
+                 headers: List[Tuple[str, str, str]] = (),
                  content_type: str = '',
                  body_text: str = '',
-                 body_form_data: List[Tuple[str, str, str]] = None,
-                 body_form_urlencoded: List[Tuple[str, str, str]] = None,
-
-                 saved: bool = False,
+                 body_form_data: List[Tuple[str, str, str]] = (),
+                 body_form_urlencoded: List[Tuple[str, str, str]] = (),
+                 assertions: List[Tuple[str, str, str]] = (),
+                 body_file: str = '',
+                 body_encoding: str = '',
                  ):
-        GObject.GObject.__init__(self)
-
-        self.name = name
-
-        self.method = method
         self.url = url
-
-        self.params = params or [('', '', '')]
-        self.headers = headers or [('', '', '')]
-
+        self.method = method
+        self.name = name
+        self.params = params or ()
+        self.headers = headers or ()
         self.content_type = content_type
-
         self.body_text = body_text
-        self.body_form_data = body_form_data or [('', '', '')]
-        self.body_form_urlencoded = body_form_urlencoded or [('', '', '')]
-
-        self.saved = saved
-
-        self.request: Optional[requests.Request] = None
-        self.response: Optional[requests.Response] = None
-
-    def set_headers(self, headers):
-        self.headers = headers
-
-    def do_request(self):
-        url = self._get_url()
-        params = self._get_params()
-        headers = self._get_headers()
-        body = self._get_body()
-
-        try:
-            self.response = requests.request(self.method,
-                                             url=url,
-                                             params=params,
-                                             headers=headers,
-                                             data=body)
-            GLib.idle_add(self.handle_request_finished)
-        except Exception as e:
-            log.error('Error occurred while sending request %s', e)
-            GLib.idle_add(self.handle_request_finished_exceptionally, e)
-
-    def handle_request_finished(self):
-        log.info(f'Got {self.response.status_code} response from {self.url}')
-        self.emit('request_finished')
-
-    def handle_request_finished_exceptionally(self, ex: Exception):
-        self.body_text = f'Error occurred while performing request: {ex}'
+        self.body_form_data = body_form_data or ()
+        self.body_form_urlencoded = body_form_urlencoded or ()
+        # (check, expected, description), see assertions.py
+        self.assertions = assertions or ()
+        # Path of the file streamed as the body, see bodies.py
+        self.body_file = body_file
+        # Content coding the body is compressed with, see content_coding.py
+        self.body_encoding = body_encoding
 
-    def _get_url(self) -> str:
-        return f'http://{self.url}' if self.url.find('://') == -1 else self.url
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
 
-    def _get_params(self) -> List[Tuple[str, str]]:
-        return [(k, v) for k, v, _ in self.params if k]
-
-    def _get_headers(self) -> Dict[str, str]:
-        return dict([(k, v) for k, v, _ in self.headers if k])
-
-    def _get_body(self):
-        if self.content_type in content_type_map_reverse:
-            return self.body_text
-
-        form_body = {
-            'multipart/form-data': self._get_form_data,
-            'application/x-www-form-urlencoded': self._get_form_urlencoded,
-        }
-        if self.content_type in form_body:
-            return form_body[self.content_type]()
-
-        return ''
-
-    def _get_form_data(self):
-        return [(k, v) for k, v, _ in self.body_form_data]
-
-    def _get_form_urlencoded(self):
-        return [(k, v) for k, v, _ in self.body_form_urlencoded]
+    @classmethod
+    def from_dict(cls, d: dict) -> 'RequestRecord':
+        return cls(**{k: v for k, v in d.items() if k in cls.__slots__})
 
 
 class FolderModel:
+    __slots__ = ('name',)
+
     def __init__(self, name: str):
         self.name = name
 
+    def to_dict(self) -> dict:
+        return {'name': self.name}
+
 
 class RequestTreeNode:
+    __slots__ = ('pk', 'parent_pk', 'parent', 'collection_pk', 'collection',
+                 'folder', 'record', 'children', 'position', '_request')
+
     def __init__(self,
                  parent_pk: str = None,
                  collection_pk: str = None,
                  pk: str = None,
                  parent=None,
                  collection=None,
-                 request: Optional[RequestModel] = None,
-                 folder: Optional[FolderModel] = None
+                 request: Optional['RequestModel'] = None,
+                 folder: Optional[FolderModel] = None,
+                 record: Optional[RequestRecord] = None,
+                 position: Optional[int] = None,
                  ):
-        assert request or folder
+        assert request or folder or record
 
         self.pk = pk or str(uuid1())
         self.parent_pk = parent_pk
@@ -133,8 +104,28 @@ class RequestTreeNode:
         self.collection_pk = collection.pk if collection else collection_pk
         self.collection = collection
         self.folder = folder
-        self.request = request
+        self.record = request.record if request else record
+        self._request = request
         self.children = []
+        # Orders the node amongst its siblings, assigned when it's added to a collection
+        self.position = position
+
+    @property
+    def request(self) -> Optional['RequestModel']:
+        """The GObject wrapper for this request, created on first use."""
+        if self._request is None and self.record is not None:
+            # Imported here, so that models stay usable without gtk
+            from request_model import RequestModel
+            self._request = RequestModel(record=self.record)
+        return self._request
+
+    def release_request(self):
+        """Drops the GObject wrapper, along with any response it holds."""
+        self._request = None
+
+    @property
+    def name(self) -> str:
+        return self.folder.name if self.is_folder() else self.record.name
 
     def is_folder(self) -> bool:
         return self.folder is not None
@@ -143,10 +134,34 @@ class RequestTreeNode:
         assert self.is_folder()
         node.parent = self
         node.parent_pk = self.pk
+        _place_last(node, self.children)
         self.children.append(node)
 
     def remove_request(self, node):
-        self.children.remove(node)
+        del self.children[index_of(node, self.children)]
+
+
+def _place_last(node: RequestTreeNode, siblings: List[RequestTreeNode]):
+    """Makes sure a node appended to `siblings` is positioned after the last of them."""
+    last = siblings[-1].position if siblings else None
+    if node.position is None or (last is not None and node.position <= last):
+        node.position = (last if last is not None else 0) + POSITION_GAP
+
+
+def _place_all(siblings: List[RequestTreeNode]):
+    # Nodes loaded without positions, or with colliding ones, are placed in the order they're in
+    last = None
+    for node in siblings:
+        if node.position is None or (last is not None and node.position <= last):
+            node.position = (last if last is not None else 0) + POSITION_GAP
+        last = node.position
+
+
+def index_of(node: RequestTreeNode, siblings: List[RequestTreeNode]) -> int:
+    """Where `node` is amongst its siblings, which are sorted by position."""
+    index = bisect_left(siblings, node.position, key=attrgetter('position'))
+    assert index < len(siblings) and siblings[index] is node
+    return index
 
 
 class CollectionModel:
@@ -154,9 +169,115 @@ class CollectionModel:
                  pk: str = None):
         self.pk = pk or str(uuid1())
         self.name = name
-        self.nodes = nodes or []
+        self.nodes = []
+        self.index: Dict[str, RequestTreeNode] = {}
 
-    def add_node(self, node: RequestTreeNode):
+        for node in nodes or []:
+            self.add_node(node)
+
+    def add_node(self, node: RequestTreeNode, parent: Optional[RequestTreeNode] = None):
         node.collection = self
         node.collection_pk = self.pk
-        self.nodes.append(node)
+        if parent:
+            parent.add_child(node)
+        else:
+            node.parent, node.parent_pk = None, None
+            _place_last(node, self.nodes)
+            self.nodes.append(node)
+        self._index(node)
+
+    def _index(self, node: RequestTreeNode):
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            n.collection, n.collection_pk = self, self.pk
+            self.index[n.pk] = n
+            _place_all(n.children)
+            stack.extend(n.children)
+
+    def get_node(self, pk: str) -> Optional[RequestTreeNode]:
+        return self.index.get(pk)
+
+    def siblings(self, node: RequestTreeNode) -> List[RequestTreeNode]:
+        return node.parent.children if node.parent else self.nodes
+
+    def index_of(self, node: RequestTreeNode) -> int:
+        return index_of(node, self.siblings(node))
+
+    def move_node(self, node: RequestTreeNode, parent: Optional[RequestTreeNode] = None,
+                  position: int = -1) -> List[RequestTreeNode]:
+        """
+        Moves `node` under `parent`, or to the top level when no parent is
+        given, at `position` amongst its new siblings (appended when negative).
+        Returns the nodes whose position changed, only `node` unless there
+        was no gap left between its new neighbours and its siblings were
+        spread out again.
+        """
+        assert parent is None or parent.is_folder()
+        assert node is not parent and not self.is_ancestor(node, parent)
+
+        siblings = self.siblings(node)
+        del siblings[index_of(node, siblings)]
+
+        node.parent = parent
+        node.parent_pk = parent.pk if parent else None
+        siblings = self.siblings(node)
+        index = position if 0 <= position <= len(siblings) else len(siblings)
+        before = siblings[index - 1].position if index > 0 else None
+        after = siblings[index].position if index < len(siblings) else None
+        siblings.insert(index, node)
+
+        if after is None:
+            node.position = (before if before is not None else 0) + POSITION_GAP
+        elif before is None:
+            node.position = after - POSITION_GAP
+        elif after - before > 1:
+            node.position = (before + after) // 2
+        else:
+            for i, sibling in enumerate(siblings):
+                sibling.position = (i + 1) * POSITION_GAP
+            return list(siblings)
+        return [node]
+
+    def drop_position(self, node: RequestTreeNode, target: Optional[RequestTreeNode],
+                      where: str = DROP_AFTER) -> Optional[Tuple[Optional[RequestTreeNode], int]]:
+        """
+        The (parent, position) arguments of move_node for dropping `node`
+        `where` relative to `target`, or at the end of the top level without a
+        target. None when the drop would put a folder inside itself.
+        """
+        if target is None:
+            return None, -1
+        if where == DROP_INTO and target.is_folder():
+            parent, index = target, len(target.children)
+        else:
+            parent, index = target.parent, self.index_of(target)
+            if where != DROP_BEFORE:
+                index += 1
+        if node is target or self.is_ancestor(node, parent):
+            return None
+
+        # The node leaves its old place first, which shifts later siblings back by one
+        if node.parent is parent and self.index_of(node) < index:
+            index -= 1
+        return parent, index
+
+    @staticmethod
+    def is_ancestor(node: RequestTreeNode, other: Optional[RequestTreeNode]) -> bool:
+        while other:
+            if other is node:
+                return True
+            other = other.parent
+        return False
+
+
+class EnvironmentModel:
+    """A named set of variables substituted into {{variable}} templates."""
+
+    def __init__(self, name: str, variables: List[Tuple[str, str, str]] = None, pk: str = None):
+        self.pk = pk or str(uuid1())
+        self.name = name
+        self.variables = variables or []  # (name, value, description)
+
+    def as_dict(self) -> Dict[str, str]:
+        return {k: v for k, v, *_ in self.variables if k}
@@ -1,4 +1,27 @@
+from concurrent.futures import Future
 from concurrent.futures.thread import ThreadPoolExecutor
 from multiprocessing import cpu_count
 
 TPE = ThreadPoolExecutor(max_workers=cpu_count())
+
+
+def resolve_on_main_loop(future: Future) -> Future:
+    """
+    Returns a future mirroring `future` which is only resolved from the GLib
+    main loop, so done callbacks added to it are free to touch widgets.
+    """
+    from gi.repository import GLib
+
+    main_loop_future = Future()
+
+    def transfer():
+        if future.cancelled():
+            main_loop_future.cancel()
+        elif future.exception():
+            main_loop_future.set_exception(future.exception())
+        else:
+            main_loop_future.set_result(future.result())
+        return False
+
+    future.add_done_callback(lambda _: GLib.idle_add(transfer))
+    return main_loop_future
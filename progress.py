@@ -0,0 +1,68 @@
+"""
+Progress of a transfer, in either direction, with its throughput and the
+time left. Updated from the thread doing the transfer, and reported to a
+callback at most every `interval` seconds so the ui isn't flooded.
+"""
+import threading
+import time
+from typing import Callable, Optional
+
+from utils import sizeof_fmt
+
+
+class TransferProgress:
+    def __init__(self, total: Optional[int] = None, on_update: Callable[['TransferProgress'], None] = None,
+                 interval: float = 0.1, done: int = 0):
+        self.total = total
+        self.done = done
+        self.on_update = on_update
+        self.interval = interval
+        self.started = time.perf_counter()
+        # Bytes already done when the transfer started, e.g. when resuming, don't count towards the rate
+        self._initial = done
+        self._last_report = 0.0
+        self._lock = threading.Lock()
+
+    def advance(self, count: int):
+        with self._lock:
+            self.done += count
+            now = time.perf_counter()
+            due = now - self._last_report >= self.interval or self.finished
+            if due:
+                self._last_report = now
+        if due and self.on_update:
+            self.on_update(self)
+
+    def restart(self, done: int = 0):
+        """Measures again from `done` bytes, e.g. once it is known where a resumed transfer starts."""
+        with self._lock:
+            self.done = self._initial = done
+            self.started = time.perf_counter()
+
+    @property
+    def finished(self) -> bool:
+        return self.total is not None and self.done >= self.total
+
+    @property
+    def fraction(self) -> Optional[float]:
+        return min(1.0, self.done / self.total) if self.total else None
+
+    def rate(self) -> float:
+        """Bytes per second since the start."""
+        elapsed = time.perf_counter() - self.started
+        return (self.done - self._initial) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> Optional[float]:
+        """Seconds left at the current rate, None when unknown."""
+        rate = self.rate()
+        if not self.total or not rate:
+            return None
+        return max(0.0, (self.total - self.done) / rate)
+
+    def describe(self) -> str:
+        parts = [sizeof_fmt(self.done) if self.total is None else f'{self.fraction:.0%} of {sizeof_fmt(self.total)}',
+                 f'{sizeof_fmt(self.rate())}/s']
+        eta = self.eta()
+        if eta is not None and not self.finished:
+            parts.append(f'{eta:.0f} s left')
+        return ', '.join(parts)
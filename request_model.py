@@ -0,0 +1,252 @@
+"""
+The GObject wrapper around a request that is open in the editor. Kept apart
+from models.py so that the model and db layers can be used without gtk.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
+
+from gi.repository import GLib, GObject
+
+from assertions import ASSERTION_POOL
+from bodies import streamed_size
+from downloads import Download
+from metrics import METRICS, request_timings
+from models import RequestRecord
+from progress import TransferProgress
+from templating import RequestPlan
+from transport import Transport, get_transport
+
+if TYPE_CHECKING:
+    import requests
+
+log = logging.getLogger(__name__)
+
+
+class _RecordField:
+    """Exposes a field of the wrapped RequestRecord as an attribute of the model."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        return self if instance is None else getattr(instance.record, self.name)
+
+    def __set__(self, instance, value):
+        setattr(instance.record, self.name, value)
+
+
+class RequestModel(GObject.GObject):
+    """
+    GObject wrapper around a RequestRecord, only created for requests that
+    are open in the editor.
+    """
+    __gsignals__ = {
+        'request_finished': (GObject.SIGNAL_RUN_FIRST, None, ()),
+        # Emitted from the main loop while a streamed body is uploading
+        'upload_progress': (GObject.SIGNAL_RUN_FIRST, None, ()),
+        # Emitted from the main loop while a response body is saved to a file
+        'download_progress': (GObject.SIGNAL_RUN_FIRST, None, ()),
+    }
+
+    url = _RecordField()
+    method = _RecordField()
+    name = _RecordField()
+    params = _RecordField()
+    headers = _RecordField()
+    content_type = _RecordField()
+    body_text = _RecordField()
+    body_form_data = _RecordField()
+    body_form_urlencoded = _RecordField()
+    assertions = _RecordField()
+    body_file = _RecordField()
+    body_encoding = _RecordField()
+
+    def __init__(self,
+                 url: str = '',
+                 method: str = 'GET',
+                 name: str = '',
+                 params: List[Tuple[str, str, str]] = None,
+                 headers: List[Tuple[str, str, str]] = None,
+                 content_type: str = '',
+                 body_text: str = '',
+                 body_form_data: List[Tuple[str, str, str]] = None,
+                 body_form_urlencoded: List[Tuple[str, str, str]] = None,
+                 assertions: List[Tuple[str, str, str]] = None,
+                 body_file: str = '',
+                 body_encoding: str = '',
+
+                 saved: bool = False,
+                 record: RequestRecord = None,
+                 ):
+        GObject.GObject.__init__(self)
+
+        self.record = record or RequestRecord(
+            url=url,
+            method=method,
+            name=name,
+            params=params or [('', '', '')],
+            headers=headers or [('', '', '')],
+            content_type=content_type,
+            body_text=body_text,
+            body_form_data=body_form_data or [('', '', '')],
+            body_form_urlencoded=body_form_urlencoded or [('', '', '')],
+            assertions=assertions or [('', '', '')],
+            body_file=body_file,
+            body_encoding=body_encoding,
+        )
+
+        self.saved = saved
+
+        self.request: Optional['requests.Request'] = None
+        self._response: Optional['requests.Response'] = None
+        # Outcome of the assertions on the last response, see assertions.py
+        self.assertion_results = None
+        # Progress of the body being sent, when it is streamed from files
+        self.upload_progress: Optional[TransferProgress] = None
+        # The download saving the response body to a file, while it runs
+        self.active_download: Optional[Download] = None
+        # Set by the response store when the response is swapped out
+        self.parked_response = None
+
+    @property
+    def response(self) -> Optional['requests.Response']:
+        """The last response, transparently loaded back if it was parked."""
+        if self._response is None and self.parked_response is not None:
+            self._response = self.parked_response.load()
+            self.parked_response = None
+        return self._response
+
+    @response.setter
+    def response(self, response: Optional['requests.Response']):
+        self._response = response
+        self.parked_response = None
+
+    def peek_response(self) -> Optional['requests.Response']:
+        """The response if it is held in memory, without loading it back."""
+        return self._response
+
+    def park_response(self, parked):
+        self.parked_response = parked
+        self._response = None
+
+    def set_headers(self, headers):
+        self.headers = headers
+
+    def send(self, variables: Dict[str, str] = None, transport: Transport = None) -> Future:
+        """
+        Sends the request without blocking, on the editor's transport unless
+        given one. The finished signal is emitted from the main loop, and the
+        returned future resolves once the response and its assertions are in.
+        """
+        done: Future = Future()
+        start = time.perf_counter()
+        progress = TransferProgress(on_update=lambda _: GLib.idle_add(self.emit, 'upload_progress'))
+        try:
+            request = RequestPlan(self.record).render(variables, progress.advance)
+        except Exception as e:
+            self._handle_send_failed(e, done)
+            return done
+        progress.total = streamed_size(request['data'])
+        self.upload_progress = progress if progress.total is not None else None
+        sent = time.perf_counter()
+
+        def failed(e: Exception):
+            finished = time.perf_counter()
+            METRICS.observe('editor', request['method'], request['url'], error=e,
+                            timings=request_timings(start, sent, finished, finished))
+            self._handle_send_failed(e, done)
+
+        def finish(response: 'requests.Response', received: float, assertion_results=None):
+            METRICS.observe('editor', request['method'], request['url'], response,
+                            timings=request_timings(start, sent, received, time.perf_counter(), response))
+            self.assertion_results = assertion_results
+            self.response = response
+            GLib.idle_add(self.handle_request_finished)
+            done.set_result(response)
+
+        def on_assertions(future: Future, response: 'requests.Response', received: float, assertions):
+            # Exceptions raised in done callbacks are only logged, so they must resolve `done` here
+            try:
+                finish(response, received, ASSERTION_POOL.result(future, assertions))
+            except Exception as e:
+                failed(e)
+
+        def on_response(future: Future):
+            received = time.perf_counter()
+            try:
+                response = future.result()
+                assertions = [row for row in self.assertions if row[0].strip()]
+                if not assertions:
+                    finish(response, received)
+                    return
+                ASSERTION_POOL.submit(assertions, response).add_done_callback(
+                    lambda f: on_assertions(f, response, received, assertions))
+            except Exception as e:
+                failed(e)
+
+        (transport or get_transport()).send(request).add_done_callback(on_response)
+        return done
+
+    def download(self, path: str, variables: Dict[str, str] = None, connections: int = 1) -> Future:
+        """
+        Sends the request and saves the response body to `path` instead of
+        keeping it, resuming an earlier download to the same path, see
+        downloads.py. Signals and the returned future are as for send, but
+        assertions aren't run as there is no body to check.
+        """
+        done: Future = Future()
+        start = time.perf_counter()
+        try:
+            request = RequestPlan(self.record).render(variables)
+        except Exception as e:
+            self._handle_send_failed(e, done)
+            return done
+        download = self.active_download = Download(
+            request, path, connections, on_progress=lambda _: GLib.idle_add(self.emit, 'download_progress'))
+        sent = time.perf_counter()
+
+        def finish(response: 'requests.Response'):
+            # On the main loop, like the signals it emits
+            self.active_download = None
+            self.assertion_results = None
+            self.response = response
+            self.handle_request_finished()
+            done.set_result(response)
+
+        def run():
+            try:
+                response = download.run()
+            except Exception as e:
+                finished = time.perf_counter()
+                METRICS.observe('editor', request['method'], request['url'], error=e,
+                                timings=request_timings(start, sent, finished, finished))
+                self.active_download = None
+                self._handle_send_failed(e, done)
+                return
+            received = time.perf_counter()
+            METRICS.observe('editor', request['method'], request['url'], response,
+                            timings=request_timings(start, sent, received, received, response))
+            GLib.idle_add(finish, response)
+
+        threading.Thread(target=run, name='download', daemon=True).start()
+        return done
+
+    def cancel_download(self):
+        download = self.active_download
+        if download:
+            download.cancel()
+
+    def _handle_send_failed(self, e: Exception, done: Future):
+        log.error('Error occurred while sending request %s', e)
+        GLib.idle_add(self.handle_request_finished_exceptionally, e)
+        done.set_result(None)
+
+    def handle_request_finished(self):
+        log.info(f'Got {self.response.status_code} response from {self.url}')
+        self.emit('request_finished')
+
+    def handle_request_finished_exceptionally(self, ex: Exception):
+        self.body_text = f'Error occurred while performing request: {ex}'
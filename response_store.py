@@ -0,0 +1,171 @@
+"""
+Keeps the responses held by open requests within a global memory budget.
+
+Least recently used responses are first compressed in memory, then moved to
+disk, and are loaded back transparently the next time they are accessed.
+"""
+import logging
+import os
+import pickle
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, TYPE_CHECKING
+from uuid import uuid1
+
+from config import DATA_DIR, RESPONSE_MEMORY_BUDGET
+
+if TYPE_CHECKING:
+    import requests
+
+log = logging.getLogger(__name__)
+
+# Compressed responses larger than this go straight to disk
+SPILL_THRESHOLD = 4 * 1024 * 1024
+
+# Attributes set on responses by the transports, which requests doesn't pickle
+EXTRA_ATTRS = ('http_version', 'wire_size', 'download_path')
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class ParkedResponse:
+    """A compressed response, held either in memory or in a file on disk."""
+
+    def __init__(self, data: bytes):
+        self.data: Optional[bytes] = data
+        self.path: Optional[str] = None
+        self.size = len(data)
+
+    def spill(self, spill_dir: str):
+        Path(spill_dir).mkdir(parents=True, exist_ok=True)
+        self.path = f'{spill_dir}/{uuid1()}.response'
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+        self.data = None
+        # Remove the file once nothing refers to the response anymore
+        weakref.finalize(self, _unlink, self.path)
+
+    def memory_size(self) -> int:
+        return 0 if self.data is None else self.size
+
+    def load(self) -> 'requests.Response':
+        data = self.data
+        if data is None:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        response, extras = pickle.loads(zlib.decompress(data))
+        response.__dict__.update(extras)
+        return response
+
+    @staticmethod
+    def park(response: 'requests.Response') -> 'ParkedResponse':
+        # Pickling reads the body in and drops the raw connection
+        extras = {name: getattr(response, name) for name in EXTRA_ATTRS if hasattr(response, name)}
+        return ParkedResponse(zlib.compress(pickle.dumps((response, extras), pickle.HIGHEST_PROTOCOL), 1))
+
+
+def response_size(response: 'requests.Response') -> int:
+    return len(response.content or b'') + sum(len(k) + len(v) for k, v in response.headers.items())
+
+
+class ResponseStore:
+    """
+    Tracks the request models that hold responses, most recently used last.
+    Models are expected to expose `peek_response()` and `parked_response`.
+    """
+
+    def __init__(self, budget: int = RESPONSE_MEMORY_BUDGET, spill_dir: str = None):
+        self.budget = budget
+        self.spill_dir = spill_dir or f'{DATA_DIR}/responses'
+        self._models: 'OrderedDict[int, weakref.ref]' = OrderedDict()
+        self._lock = threading.RLock()
+        self.listeners: List[Callable[[], None]] = []
+
+    def _live_models(self) -> list:
+        models = []
+        for key, ref in list(self._models.items()):
+            model = ref()
+            if model is None:
+                del self._models[key]
+            else:
+                models.append(model)
+        return models
+
+    @staticmethod
+    def _memory_size(model) -> int:
+        response = model.peek_response()
+        if response is not None:
+            return response_size(response)
+        if model.parked_response is not None:
+            return model.parked_response.memory_size()
+        return 0
+
+    def touch(self, model):
+        """Marks the model as most recently used and brings others within the budget."""
+        with self._lock:
+            key = id(model)
+            self._models.pop(key, None)
+            self._models[key] = weakref.ref(model)
+            self._enforce_budget(keep=model)
+        self._notify()
+
+    def forget(self, model):
+        with self._lock:
+            self._models.pop(id(model), None)
+        self._notify()
+
+    def _enforce_budget(self, keep):
+        models = self._live_models()
+        total = sum(self._memory_size(m) for m in models)
+
+        # Least recently used first, compress the response and if that is
+        # not enough move it to disk, before touching the next one.
+        for model in models:
+            if total <= self.budget:
+                return
+            if model is keep:
+                continue
+
+            if model.peek_response() is not None:
+                before = self._memory_size(model)
+                parked = ParkedResponse.park(model.peek_response())
+                if parked.size > SPILL_THRESHOLD:
+                    parked.spill(self.spill_dir)
+                model.park_response(parked)
+                total -= before - parked.memory_size()
+                log.debug('Parked response of %s, %d -> %d bytes', model.name, before, parked.size)
+
+            parked = model.parked_response
+            if total > self.budget and parked is not None and parked.data is not None:
+                total -= parked.size
+                parked.spill(self.spill_dir)
+                log.debug('Moved response of %s to disk', model.name)
+
+    def usage(self) -> Tuple[int, int, int]:
+        """Returns the bytes held by live responses, compressed responses and responses on disk."""
+        live, compressed, on_disk = 0, 0, 0
+        with self._lock:
+            for model in self._live_models():
+                parked = model.parked_response
+                if model.peek_response() is not None:
+                    live += response_size(model.peek_response())
+                elif parked is not None and parked.data is not None:
+                    compressed += parked.size
+                elif parked is not None:
+                    on_disk += parked.size
+        return live, compressed, on_disk
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+
+RESPONSE_STORE = ResponseStore()
@@ -0,0 +1,293 @@
+"""
+Runs a request once per row of a CSV or JSONL dataset.
+
+Each row's values are bound as template variables, on top of those of an
+optional environment. The dataset is read as a stream and at most
+`concurrency` rows are in flight, so memory stays flat however large the
+file is. Results are written out as they complete.
+
+    python runner.py <collection> <request> <dataset> <out> [--concurrency N] [--env NAME]
+"""
+import argparse
+import csv
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterator, List, Optional, Set, TextIO, Union
+
+from assertions import ASSERTION_POOL, AssertionPool
+from db import CollectionDAO, EnvironmentDAO, RequestDAO, get_connection, load_node_record
+from metrics import METRICS, request_timings
+from models import RequestRecord
+from templating import RequestPlan
+from transport import THREADS, TRANSPORTS, Transport, create_transport
+
+log = logging.getLogger(__name__)
+
+CSV = 'csv'
+JSONL = 'jsonl'
+
+RESULT_FIELDS = ['row', 'status', 'elapsed_ms', 'size', 'error', 'passed', 'failures']
+
+RunResult = namedtuple('RunResult', ['row', 'status', 'elapsed_ms', 'size', 'error', 'passed', 'failures', 'fields'])
+
+
+class RunCancelled(Exception):
+    pass
+
+
+def format_for_path(path: str) -> str:
+    return CSV if path.lower().endswith('.csv') else JSONL
+
+
+def iter_dataset(path: str, fmt: str = None) -> Iterator[Dict[str, str]]:
+    """Streams the rows of a CSV file with a header line, or of a JSONL file of objects."""
+    fmt = fmt or format_for_path(path)
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == CSV:
+            yield from csv.DictReader(f)
+            return
+
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError(f'{path}:{line_num} is not a json object')
+            yield {k: v if isinstance(v, str) else json.dumps(v) for k, v in row.items()}
+
+
+def parse_extractors(specs: List[str]) -> Dict[str, object]:
+    """Compiles `name=jsonpath` specs, whose first match is included in each result."""
+    import jsonpath_rw
+
+    extractors = {}
+    for spec in specs or []:
+        name, sep, path = spec.partition('=')
+        if not sep or not name:
+            raise ValueError(f'Expected name=jsonpath, got {spec}')
+        extractors[name.strip()] = jsonpath_rw.parse(path.strip())
+    return extractors
+
+
+class ResultWriter:
+    def __init__(self, f: TextIO, fmt: str, field_names: List[str]):
+        self.f = f
+        self.fmt = fmt
+        self.field_names = field_names
+        if fmt == CSV:
+            self.csv = csv.writer(f)
+            self.csv.writerow(RESULT_FIELDS + field_names)
+
+    def write(self, result: RunResult):
+        values = [result.row, result.status, result.elapsed_ms, result.size, result.error, result.passed,
+                  result.failures]
+        if self.fmt == CSV:
+            values[-1] = '; '.join(result.failures)
+            extracted = [result.fields.get(name, '') for name in self.field_names]
+            self.csv.writerow(values + [v if isinstance(v, str) else json.dumps(v) for v in extracted])
+        else:
+            obj = dict(zip(RESULT_FIELDS, values))
+            obj.update(result.fields)
+            self.f.write(json.dumps(obj) + '\n')
+
+
+class Runner:
+    def __init__(self,
+                 record: RequestRecord,
+                 concurrency: int = 8,
+                 variables: Dict[str, str] = None,
+                 extractors: Dict[str, object] = None,
+                 timeout: float = 30.0,
+                 assertion_pool: AssertionPool = None,
+                 progress: Callable[[int, int], None] = None,
+                 cancel: threading.Event = None,
+                 source: str = 'runner',
+                 transport: Union[str, Transport] = THREADS):
+        self.plan = RequestPlan(record)
+        self.concurrency = max(1, concurrency)
+        self.variables = variables or {}
+        self.extractors = extractors or {}
+        self.timeout = timeout
+        self.assertions = [row for row in record.assertions if row[0].strip()]
+        self.assertion_pool = assertion_pool or ASSERTION_POOL
+        self.progress = progress
+        self.cancel = cancel or threading.Event()
+        self.source = source
+        # A transport given by name is owned by the runner, and closed once it has run
+        self._owns_transport = isinstance(transport, str)
+        self.transport = create_transport(transport, self.concurrency) if self._owns_transport else transport
+
+    def _extract(self, response) -> Dict[str, object]:
+        if not self.extractors:
+            return {}
+        try:
+            body = response.json()
+        except ValueError:
+            return {}
+        fields = {}
+        for name, expr in self.extractors.items():
+            matches = expr.find(body)
+            fields[name] = matches[0].value if matches else None
+        return fields
+
+    def submit(self, row_num: int, row: Dict[str, str]) -> 'Future[RunResult]':
+        """Sends the request for a row, returning a future of its result."""
+        result: Future = Future()
+        start = time.perf_counter()
+        try:
+            request = self.plan.render({**self.variables, **row})
+        except Exception as e:
+            result.set_result(RunResult(row_num, None, 0.0, None, str(e), False, [], {}))
+            return result
+        sent = time.perf_counter()
+
+        def failed(e: Exception):
+            finished = time.perf_counter()
+            METRICS.observe(self.source, request['method'], request['url'], error=e,
+                            timings=request_timings(start, sent, finished, finished))
+            result.set_result(RunResult(row_num, None, round((finished - start) * 1000, 3), None,
+                                        str(e) or type(e).__name__, False, [], {}))
+
+        def finish(response, received: float, assertion_results=None):
+            passed, failures = None, []
+            if assertion_results is not None:
+                failures = [f'{r.check}: {r.message}' for r in assertion_results if not r.passed]
+                passed = not failures
+            METRICS.observe(self.source, request['method'], request['url'], response,
+                            timings=request_timings(start, sent, received, time.perf_counter(), response))
+            result.set_result(RunResult(row_num, response.status_code, round((received - start) * 1000, 3),
+                                        len(response.content), None, passed, failures, self._extract(response)))
+
+        def on_assertions(future: Future, response, received: float):
+            # Exceptions raised in done callbacks are only logged, so they must resolve the result here
+            try:
+                finish(response, received, self.assertion_pool.result(future, self.assertions))
+            except Exception as e:
+                failed(e)
+
+        def on_response(future: Future):
+            received = time.perf_counter()
+            try:
+                response = future.result()
+            except Exception as e:
+                failed(e)
+                return
+            try:
+                if not self.assertions:
+                    finish(response, received)
+                    return
+                self.assertion_pool.submit(self.assertions, response).add_done_callback(
+                    lambda f: on_assertions(f, response, received))
+            except Exception as e:
+                failed(e)
+
+        self.transport.send(request, self.timeout).add_done_callback(on_response)
+        return result
+
+    def send(self, row_num: int, row: Dict[str, str]) -> RunResult:
+        return self.submit(row_num, row).result()
+
+    def run(self, rows: Iterator[Dict[str, str]], on_result: Callable[[RunResult], None]) -> int:
+        """Sends a request per row, passing results to `on_result` as they complete. Returns the row count."""
+        sent, done = 0, 0
+        in_flight: Set[Future] = set()
+
+        def collect(futures):
+            nonlocal done
+            for future in futures:
+                on_result(future.result())
+                done += 1
+            if self.progress:
+                self.progress(done, sent)
+
+        try:
+            for row in rows:
+                if self.cancel.is_set():
+                    raise RunCancelled()
+                if len(in_flight) >= self.concurrency:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+
+                in_flight.add(self.submit(sent, row))
+                sent += 1
+        finally:
+            collect(wait(in_flight).done)
+            if self._owns_transport:
+                self.transport.close()
+
+        return sent
+
+    def run_file(self, dataset_path: str, out_path: str, dataset_fmt: str = None, out_fmt: str = None) -> int:
+        out_fmt = out_fmt or format_for_path(out_path)
+        with open(out_path, 'w', newline='', encoding='utf-8') as f:
+            writer = ResultWriter(f, out_fmt, list(self.extractors))
+            count = self.run(iter_dataset(dataset_path, dataset_fmt), writer.write)
+
+        log.info('Ran %d rows of %s, results written to %s', count, dataset_path, out_path)
+        return count
+
+
+def find_request(db: sqlite3.Connection, collection: str, name_or_pk: str) -> Optional[RequestRecord]:
+    collection_pk = CollectionDAO(db).find_pk(collection)
+    if not collection_pk:
+        return None
+
+    for rec in RequestDAO(db).iter_records(collection_pk):
+        loaded = load_node_record(rec)
+        if isinstance(loaded, RequestRecord) and name_or_pk in (rec.pk, loaded.name):
+            return loaded
+    return None
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description='Run a saved request once per row of a CSV or JSONL dataset.')
+    parser.add_argument('--db', help='Path to the repose storage db')
+    parser.add_argument('--env', help='Environment whose variables are used for values missing from a row')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for each response')
+    parser.add_argument('--transport', choices=TRANSPORTS, default=THREADS,
+                        help='Send with a thread per request in flight, or all of them from one asyncio loop')
+    parser.add_argument('--extract', action='append', metavar='NAME=JSONPATH',
+                        help='Include the first match of a jsonpath in the response body, may be repeated')
+    parser.add_argument('collection', help='Collection name or id')
+    parser.add_argument('request', help='Request name or id')
+    parser.add_argument('dataset', help='Dataset, .csv with a header line or JSONL otherwise')
+    parser.add_argument('out', help='Results file, .csv for CSV and JSONL otherwise')
+
+    args = parser.parse_args(argv)
+    METRICS.configure_from_env()
+    db = get_connection(args.db)
+    try:
+        record = find_request(db, args.collection, args.request)
+        if not record:
+            parser.error(f'No request {args.request} in collection {args.collection}')
+
+        variables = {}
+        if args.env:
+            env = EnvironmentDAO(db).get_environment(args.env)
+            if not env:
+                parser.error(f'No environment named {args.env}')
+            variables = env.as_dict()
+    finally:
+        db.close()
+
+    try:
+        extractors = parse_extractors(args.extract)
+    except Exception as e:
+        parser.error(f'Invalid --extract: {e}')
+
+    try:
+        runner = Runner(record, args.concurrency, variables, extractors, args.timeout, transport=args.transport)
+    except RuntimeError as e:
+        parser.exit(2, f'{e}\n')
+    runner.run_file(args.dataset, args.out)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
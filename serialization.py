@@ -0,0 +1,127 @@
+"""
+Versioned binary encoding for stored requests and folders.
+
+Every blob starts with a 4 byte header: kind, schema version, codec and flags.
+The payload is the record's fields as a positional list, encoded with msgpack
+when available, otherwise json (through orjson when it is installed).
+Payloads above COMPRESS_THRESHOLD bytes are zlib compressed.
+"""
+import json
+import zlib
+from typing import Tuple, Union
+
+from models import RequestRecord, FolderModel
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+KIND_REQUEST = ord('R')
+KIND_FOLDER = ord('F')
+
+VERSION = 4
+
+CODEC_JSON = 0
+CODEC_MSGPACK = 1
+
+FLAG_ZLIB = 1
+
+COMPRESS_THRESHOLD = 4096
+
+# Positional field order per schema version, never reorder an existing version.
+REQUEST_FIELDS = {
+    1: ('url', 'method', 'name', 'params', 'headers', 'content_type',
+        'body_text', 'body_form_data', 'body_form_urlencoded'),
+    2: ('url', 'method', 'name', 'params', 'headers', 'content_type',
+        'body_text', 'body_form_data', 'body_form_urlencoded', 'assertions'),
+    3: ('url', 'method', 'name', 'params', 'headers', 'content_type',
+        'body_text', 'body_form_data', 'body_form_urlencoded', 'assertions', 'body_file'),
+    4: ('url', 'method', 'name', 'params', 'headers', 'content_type',
+        'body_text', 'body_form_data', 'body_form_urlencoded', 'assertions', 'body_file', 'body_encoding'),
+}
+FOLDER_FIELDS = {
+    1: ('name',),
+    2: ('name',),
+    3: ('name',),
+    4: ('name',),
+}
+ROW_FIELDS = {'params', 'headers', 'body_form_data', 'body_form_urlencoded', 'assertions'}
+
+
+class SerializationError(Exception):
+    pass
+
+
+def _default_codec() -> int:
+    return CODEC_MSGPACK if msgpack else CODEC_JSON
+
+
+def _encode_payload(values: list, codec: int) -> bytes:
+    if codec == CODEC_MSGPACK:
+        return msgpack.packb(values, use_bin_type=True)
+    if orjson:
+        return orjson.dumps(values)
+    return json.dumps(values, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _decode_payload(payload: bytes, codec: int) -> list:
+    if codec == CODEC_MSGPACK:
+        if not msgpack:
+            raise SerializationError('msgpack is required to load this record')
+        return msgpack.unpackb(payload, raw=False)
+    if orjson:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def _pack(kind: int, values: list, codec: int = None) -> bytes:
+    codec = _default_codec() if codec is None else codec
+    payload, flags = _encode_payload(values, codec), 0
+    if len(payload) > COMPRESS_THRESHOLD:
+        payload, flags = zlib.compress(payload, 1), FLAG_ZLIB
+    return bytes((kind, VERSION, codec, flags)) + payload
+
+
+def _unpack(data: bytes) -> Tuple[int, int, list]:
+    if len(data) < 4:
+        raise SerializationError('Truncated record')
+
+    kind, version, codec, flags = data[:4]
+    payload = data[4:]
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return kind, version, _decode_payload(payload, codec)
+
+
+def dump_request(record: RequestRecord, codec: int = None) -> bytes:
+    return _pack(KIND_REQUEST, [getattr(record, f) for f in REQUEST_FIELDS[VERSION]], codec)
+
+
+def dump_folder(folder: FolderModel, codec: int = None) -> bytes:
+    return _pack(KIND_FOLDER, [getattr(folder, f) for f in FOLDER_FIELDS[VERSION]], codec)
+
+
+def load(data: bytes) -> Union[RequestRecord, FolderModel]:
+    kind, version, values = _unpack(data)
+    if kind == KIND_FOLDER:
+        fields = FOLDER_FIELDS.get(version)
+        if not fields:
+            raise SerializationError(f'Unsupported folder version {version}')
+        return FolderModel(**dict(zip(fields, values)))
+
+    if kind == KIND_REQUEST:
+        fields = REQUEST_FIELDS.get(version)
+        if not fields:
+            raise SerializationError(f'Unsupported request version {version}')
+        return RequestRecord(**{
+            field: [tuple(row) for row in value] if field in ROW_FIELDS else value
+            for field, value in zip(fields, values)
+        })
+
+    raise SerializationError(f'Unknown record kind {kind}')
@@ -0,0 +1,175 @@
+"""
+{{variable}} substitution in urls, params, headers and bodies.
+
+A template is parsed once into a plan of literal chunks interleaved with
+variable names, and plans are cached by their source text. Rendering a plan
+is a lookup per variable and a single join, so the same request can be
+rendered many times with different variables without parsing it again.
+
+Variables that aren't defined are left in place as written. Values are
+substituted as is, they are not rendered themselves.
+
+Bodies are compressed when the request has a body_encoding, with a
+Content-Encoding header added to match.
+"""
+import re
+from functools import lru_cache
+from urllib.parse import urlencode
+from typing import Dict, List, Mapping, Optional, Tuple, Union
+
+from bodies import FileBody, MultipartBody, Progress
+from content_coding import CompressedBody, compress
+from utils import content_type_map_reverse
+
+# The body type whose contents are streamed from RequestRecord.body_file
+FILE_CONTENT_TYPE = 'application/octet-stream'
+
+VARIABLE = re.compile(r'{{\s*([\w.$-]+)\s*}}')
+
+PLAN_CACHE_SIZE = 8192
+
+
+class Template:
+    __slots__ = ('source', 'literals', 'names')
+
+    def __init__(self, source: str):
+        self.source = source
+        # literals[0] names[0] literals[1] names[1] ... literals[-1]
+        self.literals: List[str] = []
+        self.names: List[str] = []
+
+        pos = 0
+        for m in VARIABLE.finditer(source):
+            self.literals.append(source[pos:m.start()])
+            self.names.append(m.group(1))
+            pos = m.end()
+        self.literals.append(source[pos:])
+
+    def render(self, variables: Mapping[str, str]) -> str:
+        if not self.names:
+            return self.source
+
+        parts = [self.literals[0]]
+        for name, literal in zip(self.names, self.literals[1:]):
+            value = variables.get(name)
+            parts.append(f'{{{{{name}}}}}' if value is None else str(value))
+            parts.append(literal)
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def compile_template(source: str) -> Template:
+    return Template(source)
+
+
+def render(source: str, variables: Optional[Mapping[str, str]]) -> str:
+    if not variables or '{{' not in source:
+        return source
+    return compile_template(source).render(variables)
+
+
+Rows = List[Tuple[Template, Template]]
+
+
+def _compile_rows(rows) -> Rows:
+    return [(compile_template(k), compile_template(v)) for k, v, *_ in rows or () if k]
+
+
+def _file_rows(rows) -> List[bool]:
+    # Form data rows may have a fourth element, true for file uploads
+    return [len(row) > 3 and bool(row[3]) for row in rows or () if row[0]]
+
+
+def _render_rows(rows: Rows, variables: Mapping[str, str]) -> List[Tuple[str, str]]:
+    return [(k.render(variables), v.render(variables)) for k, v in rows]
+
+
+class RequestPlan:
+    """
+    The templates of a request, compiled once. `record` may be anything with
+    the fields of a RequestRecord.
+    """
+
+    def __init__(self, record):
+        self.method: str = record.method
+        self.url = compile_template(record.url or '')
+        self.params = _compile_rows(record.params)
+        self.headers = _compile_rows(record.headers)
+        self.content_type: str = record.content_type
+        self.body_encoding: str = record.body_encoding
+
+        self.body_text: Optional[Template] = None
+        self.body_form: Optional[Rows] = None
+        # Which body_form rows are files to upload, taken from the record, never from rendered values
+        self.body_files: List[bool] = []
+        self.body_file: Optional[Template] = None
+        if record.content_type in content_type_map_reverse:
+            self.body_text = compile_template(record.body_text or '')
+        elif record.content_type == 'multipart/form-data':
+            self.body_form = _compile_rows(record.body_form_data)
+            self.body_files = _file_rows(record.body_form_data)
+        elif record.content_type == 'application/x-www-form-urlencoded':
+            self.body_form = _compile_rows(record.body_form_urlencoded)
+        elif record.content_type == FILE_CONTENT_TYPE:
+            self.body_file = compile_template(record.body_file or '')
+
+    def variables(self) -> set:
+        """Names of all variables used by the request."""
+        templates = [self.url] + [t for row in self.params + self.headers + (self.body_form or []) for t in row]
+        templates += [t for t in (self.body_text, self.body_file) if t]
+        return {name for t in templates for name in t.names}
+
+    def url_for(self, variables: Mapping[str, str]) -> str:
+        url = self.url.render(variables)
+        return f'http://{url}' if url.find('://') == -1 else url
+
+    def body_for(self, variables: Mapping[str, str]) -> Union[str, List[Tuple[str, str]]]:
+        if self.body_text is not None:
+            return self.body_text.render(variables)
+        if self.body_form is not None:
+            return _render_rows(self.body_form, variables)
+        return ''
+
+    def _compress(self, data, headers: Dict[str, str]) -> Tuple[object, Dict[str, str]]:
+        if isinstance(data, (FileBody, MultipartBody)):
+            data = CompressedBody(data, self.body_encoding)
+        elif isinstance(data, list):
+            # Form rows are otherwise urlencoded by requests, which also sets their content type
+            if not any(k.lower() == 'content-type' for k in headers):
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            data = compress(urlencode(data), self.body_encoding)
+        else:
+            data = compress(data, self.body_encoding)
+        headers = {k: v for k, v in headers.items() if k.lower() != 'content-encoding'}
+        headers['Content-Encoding'] = self.body_encoding
+        return data, headers
+
+    def render(self, variables: Mapping[str, str] = None, progress: Progress = None) -> Dict[str, object]:
+        """
+        Keyword arguments for `requests.request`. File and multipart bodies are
+        streamed, calling `progress` with the size of every chunk sent.
+        """
+        variables = variables or {}
+        headers = dict(_render_rows(self.headers, variables))
+        path = self.body_file.render(variables) if self.body_file is not None else ''
+        if path:
+            data = FileBody(path, progress)
+        elif self.body_form is not None and self.content_type == 'multipart/form-data':
+            data = MultipartBody([(k, v, is_file) for (k, v), is_file
+                                  in zip(_render_rows(self.body_form, variables), self.body_files)], progress)
+            # The boundary is only known now
+            headers = {k: v for k, v in headers.items() if k.lower() != 'content-type'}
+            headers['Content-Type'] = data.content_type
+        else:
+            data = self.body_for(variables)
+
+        if self.body_encoding and data:
+            data, headers = self._compress(data, headers)
+
+        return {
+            'method': self.method,
+            'url': self.url_for(variables),
+            'params': _render_rows(self.params, variables),
+            'headers': headers,
+            'data': data,
+        }
@@ -0,0 +1,105 @@
+import os
+import runpy
+import unittest
+
+from assertions import AssertionPool, ResponseSnapshot, evaluate, evaluate_one
+from tests.helpers import make_response
+
+JSON = ResponseSnapshot(200, 'OK', [('Content-Type', 'application/json')], 'application/json',
+                        '{"items": [{"id": 7, "name": "foo"}]}', 120.0)
+XML = ResponseSnapshot(404, 'Not Found', [('Content-Type', 'application/xml')], 'application/xml',
+                       '<?xml version="1.0" encoding="utf-8"?><r><title lang="en">Foo</title></r>', 5.0)
+
+
+class AssertionTest(unittest.TestCase):
+    def assertPasses(self, resp, check, expected=''):
+        result = evaluate_one(resp, check, expected)
+        self.assertTrue(result.passed, result.message)
+
+    def assertFails(self, resp, check, expected=''):
+        self.assertFalse(evaluate_one(resp, check, expected).passed)
+
+    def test_status(self):
+        self.assertPasses(JSON, 'status', '200')
+        self.assertPasses(JSON, 'status', '2xx')
+        self.assertPasses(XML, 'status', '200, 404')
+        self.assertFails(XML, 'status', '2xx')
+
+    def test_header(self):
+        self.assertPasses(JSON, 'header content-type', 'application/json')
+        self.assertPasses(JSON, 'header Content-Type', '~json$')
+        self.assertFails(JSON, 'header X-Missing')
+
+    def test_jsonpath(self):
+        self.assertPasses(JSON, 'jsonpath $.items[0].id', '7')
+        self.assertPasses(JSON, 'jsonpath $.items[0].name')
+        self.assertFails(JSON, 'jsonpath $.items[0].name', 'bar')
+        self.assertFails(JSON, 'jsonpath $.missing')
+
+    def test_xpath(self):
+        self.assertPasses(XML, 'xpath //title', 'Foo')
+        self.assertPasses(XML, 'xpath //title/@lang', 'en')
+        self.assertFails(XML, 'xpath //missing')
+
+    def test_body_and_latency(self):
+        self.assertPasses(JSON, 'body', '"foo"')
+        self.assertPasses(JSON, 'latency', '500')
+        self.assertFails(JSON, 'latency', '100')
+
+    def test_script(self):
+        self.assertPasses(JSON, 'script', 'assert status == 200\nassert body()["items"][0]["id"] == 7')
+        self.assertFails(JSON, 'script', 'assert len(text) == 0, "not empty"')
+        self.assertFails(JSON, 'script', 'import os')
+        self.assertFails(JSON, 'script', 'open("/etc/passwd")')
+        self.assertPasses(JSON, 'script', 'assert json.loads(text)["items"] and re.search("foo", text)')
+
+    def test_script_cannot_reach_modules(self):
+        for source in ('json.codecs.open("/etc/hostname").read()',
+                       're.enum.sys.modules["os"].listdir("/")',
+                       'json.loads.__globals__["codecs"]',
+                       'body.func.__globals__',
+                       '().__class__.__base__.__subclasses__()'):
+            self.assertFails(JSON, 'script', source)
+
+    def test_script_time_limit(self):
+        result = evaluate_one(JSON, 'script', 'while True: pass', script_timeout=0.2)
+        self.assertFalse(result.passed)
+        self.assertIn('longer than', result.message)
+
+    def test_blank_and_unknown_checks(self):
+        results = evaluate([('', '', ''), ('bogus', '1', '')], JSON)
+        self.assertEqual(1, len(results))
+        self.assertFalse(results[0].passed)
+
+
+class AssertionPoolTest(unittest.TestCase):
+    def test_runs_in_worker_process(self):
+        pool = AssertionPool(max_workers=1)
+        self.addCleanup(pool.shutdown)
+
+        response = make_response(b'{"id": 1}', 'application/json')
+        results = pool.run([('status', '200', ''), ('jsonpath $.id', '2', '')], response)
+        self.assertEqual([True, False], [r.passed for r in results])
+
+    def test_workers_over_the_deadline_are_replaced(self):
+        pool = AssertionPool(max_workers=1, deadline=3)
+        self.addCleanup(pool.shutdown)
+        pool.run([('status', '200', '')], make_response(b'', 'text/plain'))  # Starts the worker
+
+        # Catastrophic backtracking, which SIGALRM can't interrupt
+        bomb = make_response(b'a' * 40 + b'!', 'text/plain')
+        future = pool.submit([('body', '~^(a+)+$', '')], bomb)
+        results = pool.result(future, [('body', '~^(a+)+$', '')])
+        self.assertFalse(results[0].passed)
+        self.assertIn('longer than', results[0].message)
+
+        results = pool.run([('status', '200', '')], make_response(b'', 'text/plain'))
+        self.assertTrue(results[0].passed)
+
+    def test_workers_do_not_set_up_the_app(self):
+        # Spawned workers run the entry script as __mp_main__
+        main = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'main.py')
+        namespace = runpy.run_path(main, run_name='__mp_main__')
+        self.assertIsNone(namespace['TRACER'])
+        self.assertIsNone(namespace['WATCHDOG'])
+        self.assertNotIn('Gtk', namespace)
@@ -0,0 +1,36 @@
+import argparse
+import unittest
+from unittest import mock
+
+from benchmarks import suite
+from benchmarks.suite import compare
+
+
+def result(median: float) -> dict:
+    return {'median': median, 'min': median, 'runs': 1}
+
+
+class CompareTest(unittest.TestCase):
+    baseline = {
+        'results': {'fast': result(1.0), 'tuned': result(1.0), 'tiny': result(0.0001)},
+        'thresholds': {'tuned': 0.5},
+    }
+
+    def test_flags_slowdowns_over_threshold(self):
+        regressions = compare({'fast': result(1.3), 'tuned': result(1.3)}, self.baseline, 0.25)
+        self.assertEqual(1, len(regressions))
+        self.assertTrue(regressions[0].startswith('fast:'))
+
+    def test_ignores_noise_and_unknown_metrics(self):
+        self.assertEqual([], compare({'tiny': result(0.0005), 'new': result(9.0), 'fast': result(0.5)},
+                                     self.baseline, 0.25))
+
+
+class FilterTest(unittest.TestCase):
+    def test_filtered_out_metrics_build_no_data(self):
+        opts = argparse.Namespace(filter='pretty_xml', rows=suite.ROW_COUNTS, body_sizes=(1,), tmp_dir='/nonexistent')
+        with mock.patch.object(suite, 'make_nodes', side_effect=AssertionError), \
+                mock.patch.object(suite, 'make_json_body', side_effect=AssertionError):
+            names = [name for bench in suite.BENCHMARKS for name, _ in bench(opts)]
+        # Metrics sharing the data are still listed, main skips them
+        self.assertEqual(['pretty_xml[1MB]', 'xpath[1MB]'], names)
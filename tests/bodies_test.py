@@ -0,0 +1,95 @@
+import email.parser
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+import requests
+
+from bodies import FileBody, MultipartBody
+from progress import TransferProgress
+
+
+class BodiesTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def make_file(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_file_body(self):
+        path = self.make_file('a.bin', os.urandom(100_000))
+        sizes = []
+        body = FileBody(path, sizes.append, chunk_size=4096)
+
+        self.assertEqual(100_000, len(body))
+        self.assertEqual(open(path, 'rb').read(), b''.join(body))
+        # Can be sent again
+        self.assertEqual(100_000, len(b''.join(body)))
+        self.assertEqual(200_000, sum(sizes))
+
+    def test_multipart_matches_requests(self):
+        path = self.make_file('a.json', b'{"a": 1}')
+        fields = [('name', 'bob', False), ('file', path, True), ('at', '@home', False)]
+        body = MultipartBody(fields, boundary='b0undary')
+
+        expected = requests.Request('POST', 'http://x', data={'name': 'bob', 'at': '@home'},
+                                    files={'file': ('a.json', b'{"a": 1}', 'application/json')}).prepare()
+        expected_parts = email.parser.BytesParser().parsebytes(
+            f'Content-Type: {expected.headers["Content-Type"]}\r\n\r\n'.encode() + expected.body).get_payload()
+
+        data = b''.join(body)
+        self.assertEqual(len(data), len(body))
+        parts = email.parser.BytesParser().parsebytes(
+            f'Content-Type: {body.content_type}\r\n\r\n'.encode() + data).get_payload()
+        self.assertEqual(sorted((p.get_param('name', header='content-disposition'), p.get_filename(),
+                                 p.get_content_type(), p.get_payload(decode=True)) for p in expected_parts),
+                         sorted((p.get_param('name', header='content-disposition'), p.get_filename(),
+                                 p.get_content_type(), p.get_payload(decode=True)) for p in parts))
+
+    def test_large_files_stream_in_constant_memory(self):
+        path = self.make_file('big.bin', b'')
+        with open(path, 'wb') as f:
+            f.truncate(50 * 1024 * 1024)
+        progress = TransferProgress(total=None)
+        body = MultipartBody([('file', path, True)], progress.advance)
+        progress.total = len(body)
+
+        tracemalloc.start()
+        try:
+            sent = sum(len(chunk) for chunk in body)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(len(body), sent)
+        self.assertLess(peak, 2 * 1024 * 1024)
+        self.assertTrue(progress.finished)
+        self.assertEqual(1.0, progress.fraction)
+
+    def test_text_values_are_never_read_as_paths(self):
+        path = self.make_file('secret', b'secret')
+        body = MultipartBody([('handle', '@' + path, False)], boundary='b0undary')
+        data = b''.join(body)
+        self.assertIn(b'@' + path.encode(), data)
+        self.assertNotIn(b'filename', data)
+
+
+class TransferProgressTest(unittest.TestCase):
+    def test_reports_are_throttled(self):
+        reports = []
+        progress = TransferProgress(total=100, on_update=reports.append, interval=60)
+        for _ in range(10):
+            progress.advance(10)
+        # The first update and the last, as it finishes the transfer
+        self.assertEqual(2, len(reports))
+        self.assertIn('100% of', progress.describe())
+        self.assertEqual(0, progress.eta())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import io
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from http.server import ThreadingHTTPServer
+from threading import Thread
+from xml.etree import ElementTree
+
+import cli
+from db import CollectionDAO, EnvironmentDAO, RequestDAO, get_connection
+from models import CollectionModel, EnvironmentModel, FolderModel, RequestRecord, RequestTreeNode
+from tests.runner_test import EchoHandler
+
+
+class CliTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.db_path = os.path.join(self.dir.name, 'storage.db')
+
+        db = get_connection(self.db_path)
+        col = CollectionModel('smoke')
+        CollectionDAO(db).save_collection(col)
+        EnvironmentDAO(db).save_environment(EnvironmentModel('local', [('host', f'127.0.0.1:{self.server.server_port}', '')]))
+
+        folder = RequestTreeNode(None, col.pk, folder=FolderModel('items'))
+        ok = RequestTreeNode(folder.pk, col.pk, record=RequestRecord(
+            url='{{host}}/items/1', name='get item', assertions=[('status', '200', ''), ('jsonpath $.path', '/items/1', '')]))
+        missing = RequestTreeNode(None, col.pk, record=RequestRecord(
+            url='{{host}}/missing', name='missing', assertions=[('status', '2xx', '')]))
+        RequestDAO(db).save_requests([folder, ok, missing])
+        db.close()
+
+    def run_cli(self, *args) -> int:
+        with redirect_stdout(io.StringIO()):
+            return cli.main(['--db', self.db_path, 'run', 'smoke', '--env', 'local', *args])
+
+    def test_reports_failures(self):
+        junit, jsonl = os.path.join(self.dir.name, 'out.xml'), os.path.join(self.dir.name, 'out.jsonl')
+        self.assertEqual(1, self.run_cli('--concurrency', '2', '--junit', junit, '--jsonl', jsonl))
+
+        with open(jsonl) as f:
+            results = [json.loads(line) for line in f]
+        self.assertEqual([(['items'], 'get item', True), ([], 'missing', False)],
+                         [(r['path'], r['name'], r['passed']) for r in results])
+
+        suite = ElementTree.parse(junit).getroot().find('testsuite')
+        self.assertEqual('1', suite.get('failures'))
+        cases = suite.findall('testcase')
+        self.assertEqual('smoke.items', cases[0].get('classname'))
+        self.assertIsNotNone(cases[1].find('failure'))
+
+    def test_asyncio_transport(self):
+        jsonl = os.path.join(self.dir.name, 'out.jsonl')
+        self.assertEqual(1, self.run_cli('--transport', 'asyncio', '--concurrency', '2', '--jsonl', jsonl))
+
+        with open(jsonl) as f:
+            self.assertEqual([200, 404], [json.loads(line)['status'] for line in f])
+
+    def test_passes_without_failures(self):
+        db = get_connection(self.db_path)
+        col = CollectionModel('healthy')
+        CollectionDAO(db).save_collection(col)
+        RequestDAO(db).save_request(RequestTreeNode(None, col.pk, record=RequestRecord(
+            url='{{host}}/ok', name='ok', assertions=[('status', '200', '')])))
+        db.close()
+
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(0, cli.main(['--db', self.db_path, 'run', 'healthy', '--env', 'local']))
+
+    def test_does_not_import_gtk(self):
+        root = pathlib.Path(__file__).parent.parent
+        code = 'import sys, cli; sys.exit("gi" in sys.modules)'
+        self.assertEqual(0, subprocess.run([sys.executable, '-c', code], cwd=root).returncode)
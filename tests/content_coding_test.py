@@ -0,0 +1,63 @@
+import gzip
+import os
+import unittest
+import zlib
+
+import content_coding
+from content_coding import CompressedBody, Decoder, DecodeError, compress, decode
+
+DATA = b'{"id": 1, "name": "repose"}\n' * 5000
+
+
+def pieces(data: bytes, size: int = 1000):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class ContentCodingTest(unittest.TestCase):
+    def assertStreamDecodes(self, encoded: bytes, content_encoding: str):
+        decoder = Decoder(content_encoding)
+        decoded = b''.join(decoder.decompress(p) for p in pieces(encoded)) + decoder.flush()
+        self.assertEqual(DATA, decoded)
+
+    def test_gzip_and_deflate(self):
+        self.assertStreamDecodes(gzip.compress(DATA), 'gzip')
+        self.assertStreamDecodes(zlib.compress(DATA), 'deflate')
+        raw = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+        self.assertStreamDecodes(raw.compress(DATA) + raw.flush(), 'deflate')
+
+    def test_several_codings(self):
+        self.assertStreamDecodes(gzip.compress(zlib.compress(DATA)), 'deflate, gzip')
+        self.assertEqual(DATA, decode(DATA, 'identity'))
+
+    @unittest.skipUnless(content_coding.brotli, 'brotli is not installed')
+    def test_brotli(self):
+        self.assertIn('br', content_coding.ACCEPT_ENCODING)
+        self.assertStreamDecodes(content_coding.brotli.compress(DATA), 'br')
+
+    @unittest.skipUnless(content_coding.zstandard, 'zstandard is not installed')
+    def test_zstd(self):
+        self.assertIn('zstd', content_coding.ACCEPT_ENCODING)
+        self.assertStreamDecodes(content_coding.zstandard.ZstdCompressor().compress(DATA), 'zstd')
+
+    def test_errors(self):
+        with self.assertRaises(DecodeError):
+            Decoder('compress')
+        with self.assertRaises(DecodeError):
+            decode(b'not gzip', 'gzip')
+
+    def test_compresses_request_bodies(self):
+        self.assertEqual(DATA, gzip.decompress(compress(DATA, 'gzip')))
+        self.assertEqual('héllo', zlib.decompress(compress('héllo', 'deflate')).decode())
+        with self.assertRaises(ValueError):
+            compress(DATA, 'br')
+
+    def test_compressed_bodies_stream(self):
+        data = os.urandom(100_000)
+        body = CompressedBody(pieces(data), 'gzip')
+        self.assertEqual(data, gzip.decompress(b''.join(body)))
+        # Can be sent again
+        self.assertEqual(data, gzip.decompress(b''.join(body)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
 import pathlib
 import unittest
 
-from db import RequestDAO, CollectionDAO, get_connection
-from models import RequestModel, CollectionModel, RequestTreeNode, FolderModel
+import sqlite3
+
+from db import RequestDAO, CollectionDAO, EnvironmentDAO, get_connection, get_read_connection
+from models import CollectionModel, RequestTreeNode, FolderModel, RequestRecord, EnvironmentModel, \
+    DROP_AFTER, DROP_BEFORE, DROP_INTO
+from request_model import RequestModel
 
 TEST_DB_PATH = '/tmp/repose_test.db'
 
@@ -14,7 +18,9 @@ class RequestDAOTest(unittest.TestCase):
         self.collection_dao = CollectionDAO(self.db, self.request_dao)
 
     def tearDown(self) -> None:
-        pathlib.Path(TEST_DB_PATH).unlink()
+        self.db.close()
+        for suffix in ('', '-wal', '-shm'):
+            pathlib.Path(TEST_DB_PATH + suffix).unlink(missing_ok=True)
 
     def test_saving_collection(self):
         test_col = CollectionModel('Test collection')
@@ -42,6 +48,151 @@ class RequestDAOTest(unittest.TestCase):
         self.assertEqual(1, len(first_col.nodes[2].children))
         self.assertEqual('dir1 req1', first_col.nodes[2].children[0].request.name)
 
+    def test_reader_sees_committed_writes(self):
+        reader = get_read_connection(TEST_DB_PATH)
+        self.addCleanup(reader.close)
+
+        test_col = CollectionModel('Test collection')
+        self.collection_dao.save_collection(test_col)
+        self.request_dao.save_request(
+            RequestTreeNode(None, test_col.pk, request=RequestModel(name='req1', url='http://foo.com')))
+
+        cols = CollectionDAO(reader).get_collections()
+        self.assertEqual(1, len(cols))
+        self.assertEqual('req1', cols[0].nodes[0].request.name)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            reader.execute('delete from requests')
+
+    def test_request_model_wraps_stored_record(self):
+        test_col = CollectionModel('Test collection')
+        self.collection_dao.save_collection(test_col)
+        self.db.execute('''
+        insert into requests (id, collection_id, request_json) values (?, ?, ?)
+        ''', ('legacy', test_col.pk, '{"name": "legacy", "url": "http://foo.com", "saved": true, "response": null}'))
+
+        node = self.collection_dao.get_collections()[0].nodes[0]
+        self.assertIsInstance(node.record, RequestRecord)
+        self.assertEqual('legacy', node.name)
+
+        node.request.url = 'http://bar.com'
+        self.assertEqual('http://bar.com', node.record.url)
+
+        node.release_request()
+        self.assertEqual('http://bar.com', node.request.url)
+
+    def test_moving_requests(self):
+        test_col = CollectionModel('Test collection')
+        self.collection_dao.save_collection(test_col)
+        dir1 = RequestTreeNode(folder=FolderModel('dir1'))
+        req1 = RequestTreeNode(request=RequestModel(name='req1'))
+        req2 = RequestTreeNode(request=RequestModel(name='req2'))
+        for node in (dir1, req1, req2):
+            test_col.add_node(node)
+            self.request_dao.save_request(node)
+
+        self.assertIs(req2, test_col.get_node(req2.pk))
+
+        moved = test_col.move_node(req2, position=0)
+        self.assertEqual([req2], moved)
+        self.request_dao.move_request(req2, moved)
+        moved = test_col.move_node(req1, dir1)
+        self.request_dao.move_request(req1, moved)
+
+        self.assertEqual(['req2', 'dir1'], [n.name for n in test_col.nodes])
+        with self.assertRaises(AssertionError):
+            test_col.move_node(dir1, dir1)
+
+        loaded = self.collection_dao.get_collections()[0]
+        self.assertEqual(['req2', 'dir1'], [n.name for n in loaded.nodes])
+        self.assertEqual(['req1'], [n.name for n in loaded.get_node(dir1.pk).children])
+        self.assertIs(loaded.get_node(dir1.pk), loaded.get_node(req1.pk).parent)
+
+    def test_dropping_nodes(self):
+        test_col = CollectionModel('Test collection')
+        self.collection_dao.save_collection(test_col)
+        folder = RequestTreeNode(folder=FolderModel('folder'))
+        a, b, c = (RequestTreeNode(record=RequestRecord(name=name)) for name in 'abc')
+        for node in (folder, a, b, c):
+            test_col.add_node(node)
+            self.request_dao.save_request(node)
+
+        def drop(node, target, where):
+            moved = test_col.move_node(node, *test_col.drop_position(node, target, where))
+            self.request_dao.move_request(node, moved)
+
+        drop(a, c, DROP_AFTER)
+        self.assertEqual(['folder', 'b', 'c', 'a'], [n.name for n in test_col.nodes])
+        drop(c, folder, DROP_BEFORE)
+        self.assertEqual(['c', 'folder', 'b', 'a'], [n.name for n in test_col.nodes])
+        drop(b, folder, DROP_INTO)
+        drop(a, b, DROP_BEFORE)
+        self.assertEqual(['a', 'b'], [n.name for n in folder.children])
+        drop(c, None, DROP_AFTER)
+        self.assertEqual(['folder', 'c'], [n.name for n in test_col.nodes])
+        self.assertIsNone(test_col.drop_position(folder, a, DROP_AFTER))
+
+        loaded = self.collection_dao.get_collection(test_col.pk)
+        self.assertEqual(['folder', 'c'], [n.name for n in loaded.nodes])
+        self.assertEqual(['a', 'b'], [n.name for n in loaded.get_node(folder.pk).children])
+
+    def test_moves_spread_siblings_out_when_out_of_gaps(self):
+        test_col = CollectionModel('Test collection')
+        nodes = [RequestTreeNode(record=RequestRecord(name=str(i))) for i in range(3)]
+        for node in nodes:
+            test_col.add_node(node)
+
+        # Each move halves the gap between the first two nodes, until there is none left
+        moves = 0
+        while True:
+            moved = test_col.move_node(test_col.nodes[-1], position=1)
+            moves += 1
+            if len(moved) > 1:
+                break
+        self.assertGreater(moves, 10)
+        self.assertEqual(test_col.nodes, moved)
+        positions = [n.position for n in test_col.nodes]
+        self.assertEqual(sorted(set(positions)), positions)
+
+    def test_rows_without_positions_keep_their_order(self):
+        test_col = CollectionModel('Test collection')
+        self.collection_dao.save_collection(test_col)
+        nodes = [RequestTreeNode(record=RequestRecord(name=str(i)), collection_pk=test_col.pk) for i in range(3)]
+        self.request_dao.save_requests(nodes)
+        self.db.close()
+
+        self.db = get_connection(TEST_DB_PATH)
+        self.request_dao = RequestDAO(self.db)
+        positions = [row[0] for row in self.db.execute('select position from requests order by rowid')]
+        self.assertNotIn(None, positions)
+        self.assertEqual(sorted(positions), positions)
+        self.assertEqual(['0', '1', '2'], [n.name for n in self.request_dao.get_requests(collection_pk=test_col.pk)])
+
 
 if __name__ == '__main__':
     unittest.main()
+
+
+class EnvironmentDAOTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db = get_connection(TEST_DB_PATH)
+        self.dao = EnvironmentDAO(self.db)
+
+    def tearDown(self) -> None:
+        self.db.close()
+        for suffix in ('', '-wal', '-shm'):
+            pathlib.Path(TEST_DB_PATH + suffix).unlink(missing_ok=True)
+
+    def test_saving_environment(self):
+        env = EnvironmentModel('staging', [('host', 'staging.foo.com', 'API host')])
+        self.dao.save_environment(env)
+        env.variables.append(('token', 'abc', ''))
+        self.dao.save_environment(env)
+
+        envs = self.dao.get_environments()
+        self.assertEqual(1, len(envs))
+        self.assertEqual({'host': 'staging.foo.com', 'token': 'abc'}, envs[0].as_dict())
+        self.assertEqual(env.pk, self.dao.get_environment('staging').pk)
+
+        self.dao.delete_environment(env.pk)
+        self.assertEqual([], self.dao.get_environments())
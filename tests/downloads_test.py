@@ -0,0 +1,150 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from downloads import Download, DownloadCancelled, split
+
+BODY = os.urandom(1024 * 1024 + 7)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves BODY with Range support, dropping the connection after `fail_after` bytes when set."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.ranges.append(self.headers.get('Range'))
+        body = server.body
+        start, end = 0, len(body) - 1
+        ranged = self.headers.get('Range') and self.headers.get('If-Range', server.etag) == server.etag
+        if ranged:
+            first, _, last = self.headers['Range'][len('bytes='):].partition('-')
+            start, end = int(first), int(last) if last else end
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+        else:
+            self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.end_headers()
+
+        data = body[start:end + 1]
+        if server.fail_after is not None:
+            self.wfile.write(data[:server.fail_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        cls.server.daemon_threads = True
+        cls.server.lock = threading.Lock()
+        # Clients close the connection early when a body is split into ranges
+        cls.server.handle_error = lambda request, address: None
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/artifact'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.ranges = []
+        self.server.body = BODY
+        self.server.etag = '"v1"'
+        self.server.fail_after = None
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'artifact.bin')
+
+    def download(self, connections: int = 1, **kwargs) -> Download:
+        return Download({'method': 'GET', 'url': self.url, 'headers': {}}, self.path, connections,
+                        timeout=5, chunk_size=16 * 1024, min_split_size=1024, **kwargs)
+
+    def assertDownloaded(self):
+        with open(self.path, 'rb') as f:
+            self.assertEqual(BODY, f.read())
+        self.assertEqual([self.path], [os.path.join(self.dir.name, name) for name in os.listdir(self.dir.name)])
+
+    def test_saves_body_to_file(self):
+        updates = []
+        download = self.download(on_progress=updates.append)
+        response = download.run()
+
+        self.assertDownloaded()
+        self.assertEqual(b'', response.content)
+        self.assertEqual(self.path, response.download_path)
+        self.assertEqual(len(BODY), response.wire_size)
+        self.assertTrue(download.progress.finished)
+        self.assertTrue(updates)
+
+    def test_parallel_ranges(self):
+        self.download(connections=4).run()
+        self.assertDownloaded()
+        # The first request is cut short once the rest is split off
+        self.assertEqual(sorted([None] + [f'bytes={s.start}-{s.end}' for s in split(len(BODY), 4)[1:]], key=str),
+                         sorted(self.server.ranges, key=str))
+
+    def test_resumes_interrupted_downloads(self):
+        self.server.fail_after = 300_000
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.download().run()
+        self.assertTrue(os.path.exists(self.path + '.part.json'))
+
+        self.server.fail_after = None
+        response = self.download().run()
+        self.assertDownloaded()
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(f'bytes=300000-{len(BODY) - 1}', self.server.ranges[-1])
+        self.assertEqual(len(BODY) - 300_000, response.wire_size)
+
+    def test_restarts_when_body_changed(self):
+        self.server.fail_after = 300_000
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.download(connections=2).run()
+
+        self.server.fail_after = None
+        self.server.etag = '"v2"'
+        response = self.download().run()
+        self.assertDownloaded()
+        self.assertEqual(200, response.status_code)
+
+    def test_cancel(self):
+        download = self.download(on_progress=lambda _: download.cancel())
+        with self.assertRaises(DownloadCancelled):
+            download.run()
+        self.assertFalse(os.path.exists(self.path))
+
+        self.download().run()
+        self.assertDownloaded()
+
+    def test_empty_body(self):
+        self.server.body = b''
+        response = self.download(connections=4).run()
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.path, response.download_path)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(b'', f.read())
+        self.assertEqual(['artifact.bin'], os.listdir(self.dir.name))
+
+    def test_split(self):
+        self.assertEqual([(0, 3), (4, 7), (8, 9)], [(s.start, s.end) for s in split(10, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
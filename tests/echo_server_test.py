@@ -0,0 +1,101 @@
+import asyncio
+import gzip
+import socket
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+
+import requests
+
+from echo_server.server import serve
+
+
+class EchoServerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        started = Future()
+        cls.task = cls.loop.create_task(serve(port=0, seed=1, started=started))
+        threading.Thread(target=cls.loop.run_forever, daemon=True).start()
+        cls.port = started.result(5)
+        cls.url = f'http://127.0.0.1:{cls.port}/'
+
+    @classmethod
+    def tearDownClass(cls):
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), cls.loop).result(5)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+
+    def test_echoes_body_and_headers(self):
+        resp = requests.post(self.url, data=b'{"a": 1}', headers={'Content-Type': 'application/json', 'x-foo': 'bar',
+                                                                   'x-response-code': '201'})
+        self.assertEqual(201, resp.status_code)
+        self.assertEqual(b'{"a": 1}', resp.content)
+        self.assertEqual('bar', resp.headers['x-foo'])
+        self.assertEqual('application/json', resp.headers['Content-Type'])
+
+    def test_chunked_request_body(self):
+        resp = requests.post(self.url, data=iter([b'abc', b'def']))
+        self.assertEqual(b'abcdef', resp.content)
+
+    def test_sized_gzipped_chunked_response(self):
+        resp = requests.get(self.url, headers={'x-response-size': '200000', 'x-chunk-size': '65536',
+                                               'x-gzip': '1'}, stream=True)
+        self.assertEqual('chunked', resp.headers['Transfer-Encoding'])
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+        raw = resp.raw.read(decode_content=False)
+        self.assertEqual(200000, len(gzip.decompress(raw)))
+
+    def test_error_injection(self):
+        codes = [requests.get(self.url, headers={'x-error-rate': '0.5', 'x-error-code': '503'}).status_code
+                 for _ in range(40)]
+        self.assertEqual({200, 503}, set(codes))
+
+        with self.assertRaises(requests.ConnectionError):
+            requests.get(self.url, headers={'x-fault': 'reset'})
+        with self.assertRaises(requests.Timeout):
+            requests.get(self.url, headers={'x-fault': 'hang'}, timeout=0.2)
+
+    def test_invalid_control_header(self):
+        self.assertEqual(400, requests.get(self.url, headers={'x-latency': 'bimodal:1'}).status_code)
+        for name, value in [('x-response-size', 'abc'), ('x-response-size', '-5'),
+                            ('x-chunk-size', '0'), ('x-chunk-size', '-5')]:
+            with self.subTest(name=name, value=value):
+                self.assertEqual(400, requests.get(self.url, headers={name: value}).status_code)
+
+    def _send_raw(self, data: bytes) -> bytes:
+        with socket.create_connection(('127.0.0.1', self.port), timeout=5) as sock:
+            sock.sendall(data)
+            return sock.makefile('rb').readline()
+
+    def test_malformed_framing_is_a_bad_request(self):
+        self.assertTrue(self._send_raw(b'POST / HTTP/1.1\r\nContent-Length: abc\r\n\r\n')
+                        .startswith(b'HTTP/1.1 400'))
+        self.assertTrue(self._send_raw(b'GET / HTTP/1.1\r\nX-Long: ' + b'a' * 100_000 + b'\r\n\r\n')
+                        .startswith(b'HTTP/1.1 400'))
+
+    def test_concurrent_sleeps_overlap(self):
+        async def one():
+            reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+            writer.write(b'GET / HTTP/1.1\r\nHost: x\r\nx-sleep: 0.5\r\nConnection: close\r\n\r\n')
+            data = await reader.read()
+            writer.close()
+            return data.startswith(b'HTTP/1.1 200')
+
+        async def many():
+            return await asyncio.gather(*(one() for _ in range(500)))
+
+        start = time.perf_counter()
+        results = asyncio.run(many())
+        self.assertTrue(all(results))
+        self.assertLess(time.perf_counter() - start, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import json
+import pathlib
+import tempfile
+import unittest
+
+from db import HistoryDAO, RequestDAO, CollectionDAO, get_connection
+from exporters import HistoryExporter, CollectionExporter
+from models import CollectionModel, RequestTreeNode, FolderModel
+from request_model import RequestModel
+from tests.helpers import make_response
+
+TEST_DB_PATH = '/tmp/repose_export_test.db'
+
+
+class ExporterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db = get_connection(TEST_DB_PATH)
+        self.history_dao = HistoryDAO(self.db)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.tmp_dir.cleanup()
+        for suffix in ('', '-wal', '-shm'):
+            pathlib.Path(TEST_DB_PATH + suffix).unlink(missing_ok=True)
+
+    def test_history_body_is_streamed_in_chunks(self):
+        self.history_dao.save_response('req', 100.0, make_response(b'x' * 10, 'text/plain'))
+        pk = next(self.history_dao.iter_history()).pk
+        self.assertEqual([b'xxxx', b'xxxx', b'xx'], list(self.history_dao.iter_body(pk, 'response_body', 4)))
+
+    def test_missing_history_body_streams_nothing(self):
+        self.history_dao.save_response('req', 100.0, make_response(b'', 'text/plain', request_body=None))
+        pk = next(self.history_dao.iter_history()).pk
+        self.assertEqual([], list(self.history_dao.iter_body(pk, 'request_body')))
+
+    def test_binary_request_bodies_are_exported_as_base64(self):
+        self.history_dao.save_response('req', 100.0, make_response(b'ok', 'text/plain', request_body=b'\xff\x00\xfe',
+                                                                    request_content_type='application/octet-stream'))
+
+        path = f'{self.tmp_dir.name}/out.jsonl'
+        HistoryExporter(self.history_dao).export(path)
+        with open(path) as f:
+            line = json.loads(f.readline())
+        self.assertEqual('base64', line['request_body_encoding'])
+        self.assertEqual('/wD+', line['request_body'])
+
+        path = f'{self.tmp_dir.name}/out.har'
+        HistoryExporter(self.history_dao).export(path)
+        with open(path) as f:
+            post_data = json.load(f)['log']['entries'][0]['request']['postData']
+        self.assertEqual({'mimeType': 'application/octet-stream', 'encoding': 'base64', 'text': '/wD+'}, post_data)
+
+    def test_export_history_har_within_time_range(self):
+        self.history_dao.save_response('req', 100.0, make_response('{"ü": 1}'.encode(), 'application/json'))
+        self.history_dao.save_response('req', 200.0, make_response(b'\x00\x01\x02\x03', 'image/png'))
+        self.history_dao.save_response('req', 300.0, make_response(b'late', 'text/plain'))
+
+        path = f'{self.tmp_dir.name}/out.har'
+        self.assertEqual(2, HistoryExporter(self.history_dao).export(path, start=100.0, end=300.0))
+
+        with open(path) as f:
+            entries = json.load(f)['log']['entries']
+        self.assertEqual('{"ü": 1}', entries[0]['response']['content']['text'])
+        self.assertEqual('{"a": 1}', entries[0]['request']['postData']['text'])
+        self.assertEqual([{'name': 'page', 'value': '2'}], entries[0]['request']['queryString'])
+        self.assertEqual('base64', entries[1]['response']['content']['encoding'])
+        self.assertEqual('AAECAw==', entries[1]['response']['content']['text'])
+
+    def test_export_history_jsonl(self):
+        self.history_dao.save_response('req', 100.0, make_response(b'hello', 'text/plain'))
+
+        path = f'{self.tmp_dir.name}/out.jsonl'
+        HistoryExporter(self.history_dao).export(path)
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(1, len(lines))
+        self.assertEqual('hello', lines[0]['response_body'])
+        self.assertEqual(200, lines[0]['status'])
+
+    def test_export_collection(self):
+        request_dao = RequestDAO(self.db)
+        col = CollectionModel('Test collection')
+        CollectionDAO(self.db, request_dao).save_collection(col)
+        folder = RequestTreeNode(None, col.pk, folder=FolderModel('dir1'))
+        request_dao.save_request(folder)
+        req = RequestTreeNode(folder.pk, col.pk, request=RequestModel(
+            name='req1', url='http://foo.com', method='POST', content_type='application/json', body_text='{}'))
+        request_dao.save_request(req)
+
+        jsonl_path = f'{self.tmp_dir.name}/out.jsonl'
+        self.assertEqual(2, CollectionExporter(request_dao).export(jsonl_path, col.pk))
+        with open(jsonl_path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual('dir1', lines[0]['folder']['name'])
+        self.assertEqual(folder.pk, lines[1]['parent_id'])
+
+        har_path = f'{self.tmp_dir.name}/out.har'
+        self.assertEqual(1, CollectionExporter(request_dao).export(har_path, col.pk))
+        with open(har_path) as f:
+            entries = json.load(f)['log']['entries']
+        self.assertEqual('{}', entries[0]['request']['postData']['text'])
+
+
+if __name__ == '__main__':
+    unittest.main()
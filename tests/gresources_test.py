@@ -0,0 +1,61 @@
+import glob
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import gresources
+
+
+class ManifestTest(unittest.TestCase):
+    def test_bundles_every_asset(self):
+        assets = {
+            os.path.relpath(p, gresources.ROOT)
+            for pattern in ('ui/*.glade', 'ui/*.css', 'resources/img/*')
+            for p in glob.glob(os.path.join(gresources.ROOT, pattern))
+        }
+        self.assertEqual(assets, set(gresources.manifest_files()))
+
+    def test_listed_files_exist(self):
+        for f in gresources.manifest_files():
+            self.assertTrue(os.path.exists(gresources.file_path(f)), f)
+
+
+class StaleTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.bundle = os.path.join(self.dir.name, 'repose.gresource')
+        patcher = mock.patch.object(gresources, 'BUNDLE', self.bundle)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.dir.cleanup)
+
+    def test_missing_bundle_is_stale(self):
+        self.assertTrue(gresources.is_stale())
+
+    def test_bundle_newer_than_sources_is_fresh(self):
+        open(self.bundle, 'wb').close()
+        future = time.time() + 60
+        os.utime(self.bundle, (future, future))
+        self.assertFalse(gresources.is_stale())
+
+    def test_bundle_older_than_sources_is_stale(self):
+        open(self.bundle, 'wb').close()
+        os.utime(self.bundle, (0, 0))
+        self.assertTrue(gresources.is_stale())
+
+
+class RegisterTest(unittest.TestCase):
+    def setUp(self):
+        gresources._registered = None
+        self.addCleanup(setattr, gresources, '_registered', None)
+
+    def test_disabled_by_env(self):
+        with mock.patch.dict(os.environ, {gresources.ENV_VAR: '1'}):
+            self.assertFalse(gresources.register())
+
+    def test_falls_back_to_files_without_compiler(self):
+        with mock.patch.object(gresources, 'is_stale', return_value=True), \
+                mock.patch('shutil.which', return_value=None):
+            self.assertFalse(gresources.register())
@@ -0,0 +1,19 @@
+"""Fixtures shared by tests that don't need gtk."""
+from datetime import timedelta
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+def make_response(body: bytes, content_type: str, request_body='{"a": 1}',
+                  request_content_type: str = 'application/json') -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = 'http://foo.com/items?page=2'
+    response.headers = CaseInsensitiveDict({'Content-Type': content_type})
+    response.elapsed = timedelta(milliseconds=25)
+    response.request = requests.Request('POST', response.url, data=request_body,
+                                        headers={'Content-Type': request_content_type}).prepare()
+    response._content = body
+    return response
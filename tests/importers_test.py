@@ -0,0 +1,141 @@
+import json
+import pathlib
+import tempfile
+import threading
+import unittest
+
+from db import RequestDAO, CollectionDAO, get_connection
+from importers import Importer, ImportCancelled, detect_format, POSTMAN, INSOMNIA, HAR
+
+TEST_DB_PATH = '/tmp/repose_import_test.db'
+
+POSTMAN_EXPORT = {
+    'info': {
+        '_postman_id': 'abc',
+        'name': 'Postman collection',
+        'schema': 'https://schema.getpostman.com/json/collection/v2.1.0/collection.json',
+    },
+    'item': [
+        {'name': 'folder', 'item': [
+            {'name': 'get thing', 'request': {
+                'method': 'GET',
+                'url': {'raw': 'http://foo.com/thing?a=1', 'query': [{'key': 'a', 'value': '1'}]},
+                'header': [{'key': 'Accept', 'value': 'application/json'}],
+            }},
+        ]},
+        {'name': 'post thing', 'request': {
+            'method': 'POST',
+            'url': 'http://foo.com/thing',
+            'body': {'mode': 'raw', 'raw': '{}', 'options': {'raw': {'language': 'json'}}},
+        }},
+    ],
+}
+
+INSOMNIA_EXPORT = {
+    '_type': 'export',
+    'resources': [
+        {'_id': 'req_1', '_type': 'request', 'parentId': 'fld_1', 'name': 'nested', 'method': 'GET',
+         'url': 'http://foo.com', 'headers': [{'name': 'X-Foo', 'value': 'bar'}]},
+        {'_id': 'fld_1', '_type': 'request_group', 'parentId': 'wrk_1', 'name': 'folder'},
+        {'_id': 'req_2', '_type': 'request', 'parentId': 'wrk_1', 'name': 'top', 'method': 'POST',
+         'url': 'http://foo.com', 'body': {'mimeType': 'application/x-www-form-urlencoded',
+                                           'params': [{'name': 'a', 'value': 'b'}]}},
+        {'_id': 'wrk_1', '_type': 'workspace', 'name': 'Insomnia workspace'},
+    ],
+}
+
+HAR_EXPORT = {
+    'log': {
+        'version': '1.2',
+        'entries': [
+            {'request': {'method': 'GET', 'url': f'http://foo.com/items/{i}?page=1',
+                         'headers': [{'name': ':authority', 'value': 'foo.com'}],
+                         'queryString': [{'name': 'page', 'value': '1'}]},
+             'response': {'status': 200}}
+            for i in range(25)
+        ],
+    },
+}
+
+
+class ImporterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.db = get_connection(TEST_DB_PATH)
+        self.request_dao = RequestDAO(self.db)
+        self.collection_dao = CollectionDAO(self.db, self.request_dao)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.db.close()
+        self.tmp_dir.cleanup()
+        for suffix in ('', '-wal', '-shm'):
+            pathlib.Path(TEST_DB_PATH + suffix).unlink(missing_ok=True)
+
+    def _write(self, name: str, content: dict) -> str:
+        path = f'{self.tmp_dir.name}/{name}'
+        with open(path, 'w') as f:
+            json.dump(content, f)
+        return path
+
+    def _import(self, path: str, **kwargs):
+        importer = Importer(path, request_dao=self.request_dao, collection_dao=self.collection_dao, **kwargs)
+        return self.collection_dao.get_collection(importer.run().pk)
+
+    def test_detect_format(self):
+        self.assertEqual(POSTMAN, detect_format(self._write('p.json', POSTMAN_EXPORT)))
+        self.assertEqual(INSOMNIA, detect_format(self._write('i.json', INSOMNIA_EXPORT)))
+        self.assertEqual(HAR, detect_format(self._write('h.json', HAR_EXPORT)))
+
+    def test_import_postman(self):
+        col = self._import(self._write('p.json', POSTMAN_EXPORT))
+        self.assertEqual('Postman collection', col.name)
+        self.assertEqual(2, len(col.nodes))
+
+        folder = next(n for n in col.nodes if n.is_folder())
+        req = folder.children[0].request
+        self.assertEqual('http://foo.com/thing', req.url)
+        self.assertEqual([('a', '1', '')], [tuple(p) for p in req.params])
+
+        post = next(n for n in col.nodes if not n.is_folder()).request
+        self.assertEqual('application/json', post.content_type)
+
+    def test_import_postman_form_data_files(self):
+        export = {'info': POSTMAN_EXPORT['info'], 'item': [{'name': 'upload', 'request': {
+            'method': 'POST', 'url': 'http://foo.com/upload',
+            'body': {'mode': 'formdata', 'formdata': [
+                {'key': 'name', 'value': '@bob', 'type': 'text'},
+                {'key': 'file', 'src': '/tmp/a.txt', 'type': 'file'},
+            ]},
+        }}]}
+        req = self._import(self._write('p.json', export)).nodes[0].request
+        self.assertEqual([('name', '@bob', ''), ('file', '/tmp/a.txt', '', True)],
+                         [tuple(row) for row in req.body_form_data])
+
+    def test_import_insomnia_resolves_out_of_order_parents(self):
+        col = self._import(self._write('i.json', INSOMNIA_EXPORT))
+        self.assertEqual('Insomnia workspace', col.name)
+        self.assertEqual(2, len(col.nodes))
+
+        folder = next(n for n in col.nodes if n.is_folder())
+        self.assertEqual('nested', folder.children[0].request.name)
+
+    def test_import_har_in_batches(self):
+        progress = []
+        col = self._import(self._write('h.har', HAR_EXPORT), batch_size=10,
+                           progress=lambda *args: progress.append(args))
+        self.assertEqual(25, len(col.nodes))
+        self.assertEqual([10, 20, 25], [imported for _, _, imported in progress])
+        self.assertEqual('http://foo.com/items/0', col.nodes[0].request.url)
+        self.assertEqual([], [h for h in col.nodes[0].request.headers if h[0].startswith(':')])
+
+    def test_cancelled_import_is_removed(self):
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(ImportCancelled):
+            self._import(self._write('h.har', HAR_EXPORT), cancel=cancel)
+
+        self.assertEqual([], self.collection_dao.get_collections())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import sys
+import time
+import traceback
+import unittest
+
+from loop_watchdog import MainLoopWatchdog, _sample_stack
+
+
+def slow_handler():
+    time.sleep(0.15)
+
+
+class MainLoopWatchdogTest(unittest.TestCase):
+    def setUp(self):
+        self.watchdog = MainLoopWatchdog(threshold_ms=50, sample_ms=5)
+        self.watchdog.start(use_main_loop=False)
+
+    def tearDown(self):
+        self.watchdog.stop()
+
+    def test_records_stall_with_stack(self):
+        self.watchdog.beat()
+        slow_handler()
+        self.watchdog.beat()
+
+        self.assertEqual(1, len(self.watchdog.stalls))
+        stall = self.watchdog.stalls[0]
+        self.assertGreaterEqual(stall.duration_ms, 150)
+        self.assertEqual('test_records_stall_with_stack', stall.handler[2])
+        self.assertEqual('slow_handler', stall.hot_frame[2])
+
+    def test_ignores_short_iterations(self):
+        for _ in range(5):
+            self.watchdog.beat()
+            time.sleep(0.001)
+        self.assertEqual([], self.watchdog.stalls)
+        self.assertEqual(5, len(self.watchdog.latencies))
+
+    def test_report_aggregates_handlers(self):
+        for _ in range(2):
+            self.watchdog.beat()
+            slow_handler()
+            self.watchdog.beat()
+
+        stats = self.watchdog.handlers[self.watchdog.stalls[0].handler]
+        self.assertEqual(2, stats.count)
+        report = self.watchdog.report()
+        self.assertIn('2 stalls over 50 ms', report)
+        self.assertIn('test_report_aggregates_handlers', report)
+        self.assertIn('slow_handler', report)
+
+    def test_samples_match_extracted_stack(self):
+        frame = sys._getframe()
+        extracted, sampled = traceback.extract_stack(frame), _sample_stack(frame)
+        self.assertEqual(tuple((f.filename, f.lineno, f.name) for f in extracted), sampled)
+
+
+if __name__ == '__main__':
+    unittest.main()
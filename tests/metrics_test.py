@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+from metrics import CONTENT_TYPE, MetricsRegistry, METRICS
+from models import RequestRecord
+from runner import Runner
+from tests.helpers import make_response
+from tests.runner_test import EchoHandler
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.host = f'127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.addCleanup(self.registry.stop)
+
+    def test_downloads_count_received_bytes(self):
+        response = make_response(b'', 'application/octet-stream')
+        response.download_path, response.wire_size = '/tmp/artifact.bin', 1234
+        sample = self.registry.observe('editor', 'GET', response.url, response)
+        self.assertEqual(1234, sample.bytes)
+
+    def test_runner_records_each_send(self):
+        METRICS.reset()
+        runner = Runner(RequestRecord(url=f'{self.host}/items/{{{{id}}}}', method='GET'), concurrency=2)
+        runner.run(iter([{'id': '1'}, {'id': 'missing'}]), lambda r: None)
+        Runner(RequestRecord(url='127.0.0.1:1/', method='GET'), timeout=1).send(0, {})
+
+        text = METRICS.render()
+        self.assertIn(f'repose_requests_total{{source="runner",method="GET",host="{self.host}",status="200"}} 1',
+                      text)
+        self.assertIn(f'host="{self.host}",status="404"}} 1', text)
+        self.assertIn('repose_request_errors_total{source="runner",method="GET",host="127.0.0.1:1",'
+                      'error="ConnectionError"} 1', text)
+        self.assertIn(f'repose_request_duration_seconds_count{{source="runner",method="GET",host="{self.host}",'
+                      f'phase="wait"}} 2', text)
+
+    def test_openmetrics_histogram(self):
+        for seconds in (0.001, 0.2, 50):
+            self.registry.observe('cli', 'GET', 'http://api/x', timings={'total': seconds})
+
+        text = self.registry.render()
+        labels = 'source="cli",method="GET",host="api",phase="total"'
+        self.assertIn(f'repose_request_duration_seconds_bucket{{{labels},le="0.005"}} 1', text)
+        self.assertIn(f'repose_request_duration_seconds_bucket{{{labels},le="0.25"}} 2', text)
+        self.assertIn(f'repose_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3', text)
+        self.assertIn(f'repose_request_duration_seconds_count{{{labels}}} 3', text)
+        self.assertTrue(text.endswith('# EOF\n'))
+
+    def test_serves_metrics(self):
+        self.registry.observe('cli', 'GET', 'http://api/x', timings={'total': 0.1})
+        server = self.registry.serve()
+
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as resp:
+            self.assertEqual(CONTENT_TYPE, resp.headers['Content-Type'])
+            self.assertEqual(self.registry.render(), resp.read().decode())
+
+    def test_rolling_jsonl_log(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'metrics.jsonl')
+            self.registry.log_to(path, max_bytes=1000, backups=2)
+            for i in range(20):
+                self.registry.observe('cli', 'POST', f'http://api/{i}', error=ValueError(),
+                                      timings={'render': 0.001, 'total': 0.01})
+            self.registry.stop()
+
+            self.assertEqual({'metrics.jsonl', 'metrics.jsonl.1', 'metrics.jsonl.2'}, set(os.listdir(tmp)))
+            with open(path) as f:
+                sample = json.loads(f.readlines()[-1])
+            self.assertEqual('POST', sample['method'])
+            self.assertEqual('ValueError', sample['error'])
+            self.assertEqual(0.01, sample['timings']['total'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import response_store
+from request_model import RequestModel
+from response_store import ResponseStore
+
+
+def make_model(name: str, body: bytes) -> RequestModel:
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = CaseInsensitiveDict({'Content-Type': 'text/plain'})
+    response.elapsed = timedelta(milliseconds=5)
+    response._content = body
+
+    model = RequestModel(name=name)
+    model.response = response
+    return model
+
+
+class ResponseStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ResponseStore(budget=25_000, spill_dir=self.tmp_dir.name)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_least_recently_used_responses_are_parked(self):
+        models = [make_model(str(i), os.urandom(10_000)) for i in range(4)]
+        for model in models:
+            self.store.touch(model)
+
+        self.assertEqual([True, True, False, False], [m.peek_response() is None for m in models])
+        live, compressed, on_disk = self.store.usage()
+        self.assertLessEqual(live + compressed, self.store.budget)
+
+    def test_parked_responses_load_back_transparently(self):
+        body = b'x' * 50_000
+        first, second = make_model('first', body), make_model('second', body)
+        self.store.touch(first)
+        self.store.touch(second)
+
+        self.assertIsNone(first.peek_response())
+        self.assertEqual(body, first.response.content)
+        self.assertEqual(200, first.response.status_code)
+
+    def test_large_responses_are_moved_to_disk(self):
+        self.addCleanup(setattr, response_store, 'SPILL_THRESHOLD', response_store.SPILL_THRESHOLD)
+        response_store.SPILL_THRESHOLD = 100
+
+        first, second = make_model('first', os.urandom(30_000)), make_model('second', b'')
+        self.store.touch(first)
+        self.store.touch(second)
+
+        self.assertEqual(1, len(os.listdir(self.tmp_dir.name)))
+        self.assertEqual(30_000, len(first.response.content))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import csv
+import json
+import os
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from models import RequestRecord
+from runner import Runner, iter_dataset, parse_extractors
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps({'path': self.path, 'user': {'id': self.headers.get('x-user')}}).encode()
+        self.send_response(404 if 'missing' in self.path else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RunnerTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.record = RequestRecord(url='{{host}}/items/{{id}}', method='GET',
+                                    headers=[('x-user', '{{user}}', '')])
+        self.host = f'127.0.0.1:{self.server.server_port}'
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir.name, name)
+
+    def test_runs_each_csv_row(self):
+        with open(self.path('ids.csv'), 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(['id', 'user'])
+            w.writerows([[str(i), f'u{i}'] for i in range(20)] + [['missing', 'x']])
+
+        self.record.assertions = [('status', '2xx', '')]
+        runner = Runner(self.record, concurrency=4, variables={'host': self.host},
+                        extractors=parse_extractors(['user=$.user.id']))
+        self.assertEqual(21, runner.run_file(self.path('ids.csv'), self.path('out.jsonl')))
+
+        with open(self.path('out.jsonl')) as f:
+            results = sorted((json.loads(line) for line in f), key=lambda r: r['row'])
+        self.assertEqual([200] * 20 + [404], [r['status'] for r in results])
+        self.assertEqual('u3', results[3]['user'])
+        self.assertEqual([True] * 20 + [False], [r['passed'] for r in results])
+
+    def test_writes_csv_results_and_reports_errors(self):
+        with open(self.path('ids.jsonl'), 'w') as f:
+            f.write('{"id": 1}\n\n{"id": 2, "host": "127.0.0.1:1"}\n')
+
+        runner = Runner(self.record, concurrency=2, variables={'host': self.host, 'user': 'u'})
+        runner.run_file(self.path('ids.jsonl'), self.path('out.csv'))
+
+        with open(self.path('out.csv'), newline='') as f:
+            rows = sorted(csv.DictReader(f), key=lambda r: r['row'])
+        self.assertEqual('200', rows[0]['status'])
+        self.assertEqual('', rows[1]['status'])
+        self.assertTrue(rows[1]['error'])
+
+    def test_assertion_pool_errors_resolve_the_result(self):
+        class FailingPool:
+            def submit(self, assertions, response):
+                future = Future()
+                future.set_exception(MemoryError())
+                return future
+
+            def result(self, future, assertions):
+                return future.result()
+
+        self.record.assertions = [('status', '200', '')]
+        runner = Runner(self.record, variables={'host': self.host, 'id': '1'}, assertion_pool=FailingPool())
+        result = runner.submit(0, {}).result(timeout=5)
+        self.assertEqual('MemoryError', result.error)
+        self.assertFalse(result.passed)
+
+    def test_streams_jsonl_values_as_strings(self):
+        with open(self.path('rows.jsonl'), 'w') as f:
+            f.write('{"id": 1, "tags": ["a"]}\n')
+        self.assertEqual([{'id': '1', 'tags': '["a"]'}], list(iter_dataset(self.path('rows.jsonl'))))
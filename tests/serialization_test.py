@@ -0,0 +1,71 @@
+import json
+import unittest
+
+import serialization
+from models import RequestRecord, FolderModel
+
+
+def make_record(body_text: str = '{"a": 1}') -> RequestRecord:
+    return RequestRecord(url='http://foo.com',
+                         method='POST',
+                         name='req1',
+                         params=[('page', '1', 'The page')],
+                         headers=[('Content-Type', 'application/json', '')],
+                         content_type='application/json',
+                         body_text=body_text,
+                         body_form_urlencoded=[('ü', 'ß', '')],
+                         assertions=[('status', '200', '')])
+
+
+class SerializationTest(unittest.TestCase):
+    def assertRoundTrips(self, record: RequestRecord, codec: int = None):
+        loaded = serialization.load(serialization.dump_request(record, codec))
+        self.assertIsInstance(loaded, RequestRecord)
+        self.assertEqual(record.to_dict(), loaded.to_dict())
+
+    def test_request_round_trip_json(self):
+        self.assertRoundTrips(make_record(), serialization.CODEC_JSON)
+
+    @unittest.skipUnless(serialization.msgpack, 'msgpack is not installed')
+    def test_request_round_trip_msgpack(self):
+        self.assertRoundTrips(make_record(), serialization.CODEC_MSGPACK)
+
+    def test_empty_request_round_trip(self):
+        self.assertRoundTrips(RequestRecord())
+
+    def test_large_requests_are_compressed(self):
+        record = make_record('x' * 100_000)
+        data = serialization.dump_request(record)
+        self.assertTrue(data[3] & serialization.FLAG_ZLIB)
+        self.assertLess(len(data), 10_000)
+        self.assertRoundTrips(record)
+
+    def test_folder_round_trip(self):
+        loaded = serialization.load(serialization.dump_folder(FolderModel('dir1')))
+        self.assertIsInstance(loaded, FolderModel)
+        self.assertEqual('dir1', loaded.name)
+
+    def test_version_1_requests_load(self):
+        values = ['http://foo.com', 'GET', 'req1', [['page', '1', '']], [], '', '', [], []]
+        data = bytes((serialization.KIND_REQUEST, 1, serialization.CODEC_JSON, 0)) + json.dumps(values).encode()
+        loaded = serialization.load(data)
+        self.assertEqual([('page', '1', '')], loaded.params)
+        self.assertEqual((), loaded.assertions)
+
+    def test_version_2_requests_load(self):
+        values = ['http://foo.com', 'GET', 'req1', [], [], '', '', [], [], [['status', '200', '']]]
+        data = bytes((serialization.KIND_REQUEST, 2, serialization.CODEC_JSON, 0)) + json.dumps(values).encode()
+        loaded = serialization.load(data)
+        self.assertEqual([('status', '200', '')], loaded.assertions)
+        self.assertEqual('', loaded.body_file)
+        self.assertEqual('', loaded.body_encoding)
+
+    def test_unknown_version_is_rejected(self):
+        data = bytearray(serialization.dump_request(make_record()))
+        data[1] = serialization.VERSION + 1
+        with self.assertRaises(serialization.SerializationError):
+            serialization.load(bytes(data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import gzip
+import tempfile
+import unittest
+import zlib
+
+from bodies import MultipartBody
+from models import RequestRecord
+from templating import FILE_CONTENT_TYPE, RequestPlan, compile_template, render
+
+
+class TemplateTest(unittest.TestCase):
+    def test_substitutes_variables(self):
+        self.assertEqual('http://foo.com/v2/items',
+                         render('http://{{host}}/{{ version }}/items', {'host': 'foo.com', 'version': 'v2'}))
+
+    def test_keeps_undefined_variables(self):
+        self.assertEqual('{{host}}/x', render('{{host}}/x', {'other': '1'}))
+
+    def test_values_are_not_rendered(self):
+        self.assertEqual('{{b}}', render('{{a}}', {'a': '{{b}}', 'b': 'x'}))
+
+    def test_plans_are_cached(self):
+        self.assertIs(compile_template('{{a}}-{{b}}'), compile_template('{{a}}-{{b}}'))
+        self.assertEqual(['a', 'b'], compile_template('{{a}}-{{b}}').names)
+
+
+class RequestPlanTest(unittest.TestCase):
+    def test_renders_every_field(self):
+        record = RequestRecord(url='{{host}}/items/{{id}}', method='POST',
+                               params=[('page', '{{page}}', ''), ('', '', '')],
+                               headers=[('Authorization', 'Bearer {{token}}', '')],
+                               content_type='application/json', body_text='{"id": {{id}}}')
+        plan = RequestPlan(record)
+
+        self.assertEqual({'host', 'id', 'page', 'token'}, plan.variables())
+        self.assertEqual({
+            'method': 'POST',
+            'url': 'http://foo.com/items/7',
+            'params': [('page', '2')],
+            'headers': {'Authorization': 'Bearer abc'},
+            'data': '{"id": 7}',
+        }, plan.render({'host': 'foo.com', 'id': '7', 'page': '2', 'token': 'abc'}))
+
+    def test_renders_form_bodies(self):
+        record = RequestRecord(url='http://foo.com', method='POST',
+                               content_type='application/x-www-form-urlencoded',
+                               body_form_urlencoded=[('user', '{{user}}', ''), ('', '', '')])
+        self.assertEqual([('user', 'bob')], RequestPlan(record).render({'user': 'bob'})['data'])
+
+    def test_compresses_bodies(self):
+        record = RequestRecord(url='http://foo.com', method='POST', content_type='application/json',
+                               headers=[('Content-Type', 'application/json', '')],
+                               body_text='{"id": {{id}}}', body_encoding='gzip')
+        request = RequestPlan(record).render({'id': '7'})
+        self.assertEqual(b'{"id": 7}', gzip.decompress(request['data']))
+        self.assertEqual({'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}, request['headers'])
+
+        record = RequestRecord(url='http://foo.com', method='POST', content_type='application/x-www-form-urlencoded',
+                               body_form_urlencoded=[('a', '1 2', ''), ('', '', '')], body_encoding='deflate')
+        request = RequestPlan(record).render()
+        self.assertEqual(b'a=1+2', zlib.decompress(request['data']))
+        self.assertEqual('application/x-www-form-urlencoded', request['headers']['Content-Type'])
+
+    def test_substituted_values_are_not_uploaded_as_files(self):
+        record = RequestRecord(url='http://foo.com', method='POST', content_type='multipart/form-data',
+                               body_form_data=[('user', '{{user}}', ''), ('handle', '@bob', '', False)])
+        data = b''.join(RequestPlan(record).render({'user': '@/etc/passwd'})['data'])
+        self.assertIn(b'\r\n\r\n@/etc/passwd\r\n', data)
+        self.assertIn(b'\r\n\r\n@bob\r\n', data)
+        self.assertNotIn(b'filename', data)
+
+    def test_renders_streamed_bodies(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'abc')
+            f.flush()
+            record = RequestRecord(url='http://foo.com', method='POST', headers=[('content-type', 'x', '')],
+                                   content_type='multipart/form-data',
+                                   body_form_data=[('file', '{{path}}', '', True), ('', '', '')])
+            request = RequestPlan(record).render({'path': f.name})
+            self.assertIsInstance(request['data'], MultipartBody)
+            self.assertEqual({'Content-Type': request['data'].content_type}, request['headers'])
+            self.assertIn(b'abc', b''.join(request['data']))
+
+            record = RequestRecord(url='http://foo.com', method='PUT', content_type=FILE_CONTENT_TYPE,
+                                   body_file='{{path}}')
+            self.assertEqual(b'abc', b''.join(RequestPlan(record).render({'path': f.name})['data']))
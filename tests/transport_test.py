@@ -0,0 +1,224 @@
+import asyncio
+import gzip
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from bodies import FileBody
+from echo_server.server import serve
+from models import RequestRecord
+from runner import Runner
+from templating import RequestPlan
+from transport import AsyncioTransport, Http2Transport, ThreadTransport, httpx
+
+try:
+    from echo_server import h2_server
+except ImportError:
+    h2_server = None
+
+
+class RedirectHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(303)
+        self.send_header('Location', f'http://127.0.0.1:{self.server.echo_port}/done')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TransportTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        started = Future()
+        cls.loop.create_task(serve(port=0, started=started))
+        threading.Thread(target=cls.loop.run_forever, daemon=True).start()
+        cls.port = started.result(5)
+        cls.url = f'http://127.0.0.1:{cls.port}/'
+
+        cls.redirects = ThreadingHTTPServer(('127.0.0.1', 0), RedirectHandler)
+        cls.redirects.echo_port = cls.port
+        threading.Thread(target=cls.redirects.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.redirects.shutdown()
+        cls.redirects.server_close()
+
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), cls.loop).result(5)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+
+    def setUp(self):
+        self.transport = AsyncioTransport()
+        self.addCleanup(self.transport.close)
+
+    def send(self, transport=None, timeout=5, **request) -> requests.Response:
+        request.setdefault('method', 'GET')
+        request.setdefault('url', self.url)
+        return (transport or self.transport).send(request, timeout).result(10)
+
+    def test_matches_thread_transport(self):
+        threads = ThreadTransport(1)
+        self.addCleanup(threads.close)
+        request = dict(method='POST', params=[('q', 'a b')], headers={'Content-Type': 'text/plain', 'x-a': '1',
+                                                                        'x-response-code': '201'}, data='héllo')
+        expected, actual = self.send(threads, **request), self.send(**request)
+
+        self.assertEqual(expected.status_code, actual.status_code)
+        self.assertEqual(expected.reason, actual.reason)
+        self.assertEqual(expected.url, actual.url)
+        self.assertEqual(expected.content, actual.content)
+        self.assertEqual(expected.text, actual.text)
+        self.assertEqual(expected.headers['x-a'], actual.headers['x-a'])
+        self.assertEqual(expected.request.body, actual.request.body)
+        self.assertGreater(actual.elapsed.total_seconds(), 0)
+        self.assertEqual(('HTTP/1.1', 'HTTP/1.1'), (expected.http_version, actual.http_version))
+
+    def test_decodes_chunked_gzip_bodies(self):
+        resp = self.send(headers={'x-response-size': '100000', 'x-chunk-size': '4096', 'x-gzip': '1'})
+        self.assertEqual(100000, len(resp.content))
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+
+    def test_records_wire_size(self):
+        threads = ThreadTransport(1)
+        self.addCleanup(threads.close)
+        for transport in (threads, self.transport):
+            resp = self.send(transport, headers={'x-response-size': '100000', 'x-gzip': '1'})
+            self.assertEqual(100000, len(resp.content))
+            self.assertEqual(int(resp.headers['Content-Length']), resp.wire_size)
+            self.assertLess(resp.wire_size, 100000)
+
+    def test_sends_compressed_bodies(self):
+        record = RequestRecord(url=self.url, method='POST', body_text='hello ' * 1000,
+                               content_type='text/plain', body_encoding='gzip')
+        resp = self.send(**RequestPlan(record).render())
+        # The echo server doesn't echo Content-Encoding, so the body comes back as it was sent
+        self.assertEqual(b'hello ' * 1000, gzip.decompress(resp.content))
+        self.assertEqual('gzip', resp.request.headers['Content-Encoding'])
+
+    def test_host_header_keeps_ipv6_brackets(self):
+        prepared = requests.Request('GET', 'http://user:pw@[::1]:8080/x').prepare()
+        head, _ = AsyncioTransport._encode_head(prepared, urlsplit(prepared.url))
+        self.assertIn(b'\r\nHost: [::1]:8080\r\n', head)
+
+    def test_reuses_connections(self):
+        for _ in range(3):
+            self.send()
+        self.assertEqual(1, len(self.transport._idle[('http', '127.0.0.1', self.port)]))
+
+    def test_follows_redirects(self):
+        resp = self.send(method='POST', url=f'http://127.0.0.1:{self.redirects.server_port}/', data=b'x')
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual('GET', resp.request.method)
+        self.assertEqual(f'{self.url}done', resp.url)
+        self.assertEqual([303], [r.status_code for r in resp.history])
+
+    def test_errors(self):
+        with self.assertRaises(requests.Timeout):
+            self.send(headers={'x-sleep': '1'}, timeout=0.1)
+        with self.assertRaises(requests.ConnectionError):
+            self.send(url='http://127.0.0.1:1/')
+        with self.assertRaises(requests.ConnectionError):
+            self.send(headers={'x-fault': 'reset'})
+        with self.assertRaises(requests.exceptions.InvalidSchema):
+            self.send(url='ftp://127.0.0.1/')
+
+    def test_malformed_status_line(self):
+        server = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+
+        def respond():
+            conn, _ = server.accept()
+            with conn:
+                conn.recv(65536)
+                conn.sendall(b'HTTP/1.1 abc OK\r\nContent-Length: 0\r\n\r\n')
+
+        threading.Thread(target=respond, daemon=True).start()
+        with self.assertRaises(requests.ConnectionError):
+            self.send(url=f'http://127.0.0.1:{server.getsockname()[1]}/')
+
+    def test_streams_bodies(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(os.urandom(300_000))
+            f.flush()
+            f.seek(0)
+            data = f.read()
+            sent = []
+            resp = self.send(method='PUT', data=FileBody(f.name, sent.append, chunk_size=65536))
+            self.assertEqual(data, resp.content)
+            self.assertEqual(len(data), sum(sent))
+
+            # Without a length they are sent chunked
+            resp = self.send(method='PUT', data=(data[i:i + 1000] for i in range(0, len(data), 1000)))
+            self.assertEqual(data, resp.content)
+
+    def test_runner_keeps_many_requests_in_flight(self):
+        record = RequestRecord(url=self.url, method='GET', headers=[('x-sleep', '0.5', '')])
+        runner = Runner(record, concurrency=1000, transport=self.transport)
+        results, threads = [], threading.active_count()
+
+        start = time.perf_counter()
+        runner.run(({} for _ in range(1000)), results.append)
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertEqual([200] * 1000, [r.status for r in results])
+        self.assertLessEqual(threading.active_count(), threads + 1)
+
+
+@unittest.skipIf(httpx is None or h2_server is None, 'Needs httpx[http2]')
+class Http2TransportTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+        started = Future()
+        cls.task = cls.loop.create_task(h2_server.serve(port=0, started=started))
+        threading.Thread(target=cls.loop.run_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{started.result(5)}/'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.task.cancel)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+
+    def test_multiplexes_over_one_connection(self):
+        transport = Http2Transport(prior_knowledge=True)
+        self.addCleanup(transport.close)
+
+        start = time.perf_counter()
+        futures = [transport.send({'method': 'POST', 'url': self.url, 'data': f'body {i}',
+                                   'headers': {'x-sleep': '0.3', 'x-response-code': '201'}}, 5)
+                   for i in range(20)]
+        responses = [f.result(10) for f in futures]
+
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual([f'body {i}' for i in range(20)], [r.text for r in responses])
+        self.assertEqual({('HTTP/2', 201)}, {(r.http_version, r.status_code) for r in responses})
+        self.assertEqual(1, len({r.headers['x-connection-id'] for r in responses}))
+        self.assertEqual(20, len({r.headers['x-stream-id'] for r in responses}))
+
+
+@unittest.skipIf(httpx is not None, 'httpx is installed')
+class MissingHttpxTest(unittest.TestCase):
+    def test_explains_missing_dependency(self):
+        with self.assertRaisesRegex(RuntimeError, 'httpx'):
+            Http2Transport()
+
+
+if __name__ == '__main__':
+    unittest.main()
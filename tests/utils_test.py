@@ -0,0 +1,65 @@
+import io
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from utils import format_bulk_params, format_response_size, get_http_version, parse_bulk_params, has_long_line
+
+
+class BulkParamsTest(unittest.TestCase):
+    def test_round_trip(self):
+        rows = [('page', '1', ''), ('filter', 'a:b', '')]
+        self.assertEqual(rows, parse_bulk_params(format_bulk_params(rows)))
+
+    def test_parse_skips_blank_and_disabled_lines(self):
+        text = '\n  Accept : application/json\n// X-Debug: 1\n\nX-Empty\n'
+        self.assertEqual([('Accept', 'application/json', ''), ('X-Empty', '', '')], parse_bulk_params(text))
+
+    def test_parse_keeps_known_descriptions(self):
+        rows = parse_bulk_params('page: 2', {'page': 'The page to fetch'})
+        self.assertEqual([('page', '2', 'The page to fetch')], rows)
+
+    def test_format_skips_empty_keys(self):
+        self.assertEqual('a: 1', format_bulk_params([('a', '1', 'desc'), ('', '', '')]))
+
+
+class LongLineTest(unittest.TestCase):
+    def test_finds_long_lines(self):
+        self.assertFalse(has_long_line('a' * 9 + '\n' + 'b' * 10, 10))
+        self.assertTrue(has_long_line('a\n' + 'b' * 11 + '\nc', 10))
+
+    def test_counts_newlines_as_iterating_over_lines_does(self):
+        for text in ('a' * 10 + '\n' + 'b', 'a\n' + 'b' * 10 + '\n', 'a' * 10, 'a' * 11, 'a\n' * 20, ''):
+            expected = any(len(line) > 10 for line in io.StringIO(text))
+            self.assertEqual(expected, has_long_line(text, 10), repr(text))
+
+
+class HttpVersionTest(unittest.TestCase):
+    def test_versions(self):
+        self.assertEqual('HTTP/2', get_http_version(SimpleNamespace(http_version='HTTP/2', raw=None)))
+        self.assertEqual('HTTP/1.1', get_http_version(SimpleNamespace(raw=SimpleNamespace(version=11))))
+        self.assertEqual('', get_http_version(SimpleNamespace(raw=None)))
+
+
+
+class ResponseSizeTest(unittest.TestCase):
+    def test_shows_wire_size_of_compressed_bodies(self):
+        response = SimpleNamespace(content=b'x' * 2048, headers={'content-encoding': 'br', 'content-length': '100'},
+                                   wire_size=100)
+        self.assertEqual('2.0 KB (100.0 B br)', format_response_size(response))
+
+    def test_ignores_content_length(self):
+        # e.g. of a HEAD response, which has no body
+        response = SimpleNamespace(content=b'', headers={'content-length': '2048'}, wire_size=0)
+        self.assertEqual('0.0 B', format_response_size(response))
+        self.assertEqual('3.0 B', format_response_size(SimpleNamespace(content=b'abc', headers={})))
+
+    def test_downloaded_bodies_are_measured_on_disk(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'x' * 2048)
+            f.flush()
+            response = SimpleNamespace(content=b'', headers={}, wire_size=1024, download_path=f.name)
+            self.assertEqual('2.0 KB', format_response_size(response))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Opt-in startup tracer, enabled by setting REPOSE_TRACE_STARTUP to 1 or to the
+path of the log file to write. Records the time spent executing each imported
+module and in each named init phase.
+"""
+import importlib.abc
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+log = logging.getLogger(__name__)
+
+ENV_VAR = 'REPOSE_TRACE_STARTUP'
+
+# Number of slowest imports written to the log
+TOP_IMPORTS = 30
+
+
+class _TimingLoader(importlib.abc.Loader):
+    def __init__(self, loader, tracer: 'StartupTracer', name: str):
+        self.loader = loader
+        self.tracer = tracer
+        self.name = name
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # Keep the real loader visible to anything inspecting the module
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+
+        self.tracer._import_started()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.tracer._import_finished(self.name)
+
+    def __getattr__(self, item):
+        return getattr(self.loader, item)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, tracer: 'StartupTracer'):
+        self.tracer = tracer
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimingLoader(spec.loader, self.tracer, name)
+                return spec
+        return None
+
+
+class StartupTracer:
+    def __init__(self, log_path: str = None):
+        self.enabled = log_path is not None
+        self.log_path = log_path
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        # Module -> (total seconds including nested imports, seconds in the module itself)
+        self.imports: Dict[str, Tuple[float, float]] = {}
+        self._import_stack: List[List[float]] = []
+        self._finder = None
+
+    @classmethod
+    def from_env(cls) -> 'StartupTracer':
+        value = os.environ.get(ENV_VAR)
+        if not value:
+            return cls()
+
+        if value == '1':
+            from config import DATA_DIR
+            value = f'{DATA_DIR}/startup.log'
+
+        tracer = cls(value)
+        tracer.install()
+        return tracer
+
+    def install(self):
+        self._finder = _TimingFinder(self)
+        sys.meta_path.insert(0, self._finder)
+
+    def uninstall(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+
+    def _import_started(self):
+        # [start time, time spent in nested imports]
+        self._import_stack.append([time.perf_counter(), 0.0])
+
+    def _import_finished(self, name: str):
+        start, nested = self._import_stack.pop()
+        total = time.perf_counter() - start
+        self.imports[name] = (total, total - nested)
+        if self._import_stack:
+            self._import_stack[-1][1] += total
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def finish(self) -> bool:
+        """Stops tracing and writes the log. Returns False so it can be used as an idle callback."""
+        if not self.enabled:
+            return False
+
+        self.uninstall()
+        self.enabled = False
+        total = time.perf_counter() - self.started
+
+        lines = [f'Startup took {total * 1000:.1f} ms', '', 'Phases:']
+        lines += [f'  {duration * 1000:9.1f} ms  {name}' for name, duration in self.phases]
+        lines += ['', 'Slowest imports (total / self):']
+        slowest = sorted(self.imports.items(), key=lambda i: i[1][0], reverse=True)[:TOP_IMPORTS]
+        lines += [f'  {t * 1000:9.1f} ms {s * 1000:9.1f} ms  {name}' for name, (t, s) in slowest]
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        with open(self.log_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        log.info('Startup took %.1f ms, trace written to %s', total * 1000, self.log_path)
+        return False
@@ -0,0 +1,550 @@
+"""
+Transports send rendered requests, see RequestPlan.render, and return
+futures of the `requests.Response` they get.
+
+    threads   requests' own client, holding a pool thread per request in flight
+    asyncio   an HTTP/1.1 client on a single event loop thread, so thousands of
+              requests can be in flight without a thread each
+    http2     httpx on an event loop thread, negotiating HTTP/2 over TLS with
+              ALPN and multiplexing requests over one connection per origin
+    h2c       as http2, but also speaking HTTP/2 to plain http urls with prior
+              knowledge, e.g. to local test servers
+
+All of them keep connections alive between requests and drop cookies after
+each one. The asyncio transport follows redirects and decodes bodies as
+they arrive, with the codings content_coding supports, but doesn't support
+proxies or auth handlers, and its timeout covers the whole exchange rather
+than each read. The http2 transports need `httpx[http2]`.
+
+Responses get the protocol they came over as `http_version`, and the size
+of their body as sent, before decoding, as `wire_size`.
+
+REPOSE_TRANSPORT picks the transport the editor uses, threads by default.
+Runs pick theirs with --transport.
+"""
+import asyncio
+import logging
+import os
+import ssl
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from multiprocessing import cpu_count
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+from urllib.parse import urljoin, urlsplit
+
+from content_coding import ACCEPT_ENCODING, Decoder, DecodeError
+from utils import get_http_version
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+if TYPE_CHECKING:
+    import requests
+
+log = logging.getLogger(__name__)
+
+ENV_VAR = 'REPOSE_TRANSPORT'
+
+THREADS = 'threads'
+ASYNCIO = 'asyncio'
+HTTP2 = 'http2'
+H2C = 'h2c'
+TRANSPORTS = (THREADS, ASYNCIO, HTTP2, H2C)
+
+MAX_REDIRECTS = 30
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+# Longest status or header line accepted from a server
+MAX_LINE = 64 * 1024
+# Idle connections kept open per host by the asyncio transport
+MAX_IDLE_PER_HOST = 100
+# Bodies with a length are read in pieces of this size
+READ_SIZE = 64 * 1024
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+ConnectionKey = Tuple[str, str, int]
+
+
+class Transport(ABC):
+    name: str = None
+
+    @abstractmethod
+    def send(self, request: Dict[str, object], timeout: float = None) -> Future:
+        """Sends the request, given as keyword arguments of `requests.request`."""
+
+    def close(self):
+        pass
+
+
+class ThreadTransport(Transport):
+    name = THREADS
+
+    def __init__(self, max_workers: int = None):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or cpu_count(), thread_name_prefix='http')
+        # Sessions are kept per thread, so connections are reused between requests
+        self._sessions = threading.local()
+
+    def _get_session(self) -> 'requests.Session':
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            import requests
+            session = self._sessions.session = requests.Session()
+        return session
+
+    def _send(self, request: Dict[str, object], timeout: float) -> 'requests.Response':
+        session = self._get_session()
+        try:
+            response = session.request(timeout=timeout, **request)
+        finally:
+            session.cookies.clear()
+        response.http_version = get_http_version(response)
+        # Bytes urllib3 read off the connection for the body, as it was read in full
+        response.wire_size = response.raw.tell() if hasattr(response.raw, 'tell') else None
+        return response
+
+    def send(self, request: Dict[str, object], timeout: float = None) -> Future:
+        return self._executor.submit(self._send, request, timeout)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+async def _read_chunked(reader: asyncio.StreamReader, on_data: Callable[[bytes], None]):
+    while True:
+        line = await reader.readline()
+        try:
+            size = int(line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            raise ConnectionError(f'Invalid chunk size {line[:20]!r}')
+        if size == 0:
+            while (await reader.readline()).strip():
+                pass  # Trailers
+            return
+        on_data(await reader.readexactly(size))
+        await reader.readexactly(2)
+
+
+async def _read_length(reader: asyncio.StreamReader, length: int, on_data: Callable[[bytes], None]):
+    while length:
+        data = await reader.readexactly(min(length, READ_SIZE))
+        length -= len(data)
+        on_data(data)
+
+
+async def _read_to_eof(reader: asyncio.StreamReader, on_data: Callable[[bytes], None]):
+    while True:
+        data = await reader.read(READ_SIZE)
+        if not data:
+            return
+        on_data(data)
+
+
+async def _read_head(reader: asyncio.StreamReader) -> Tuple[str, int, str, List[Tuple[str, str]]]:
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('The server closed the connection')
+        version, _, rest = line.decode('latin-1').strip().partition(' ')
+        code, _, reason = rest.partition(' ')
+        try:
+            status = int(code)
+        except ValueError:
+            raise ConnectionError(f'Invalid status line {line[:40]!r}')
+
+        headers = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip(), value.strip()))
+
+        # Interim responses, e.g. 100 Continue, are followed by the real one
+        if not 100 <= status < 200 or status == 101:
+            return version, status, reason, headers
+
+
+async def _iter_chunks(body) -> AsyncIterator[bytes]:
+    """The chunks of a streamed body, read off the event loop as they may come from files."""
+    loop = asyncio.get_running_loop()
+    chunks = iter(body)
+    done = object()
+    while True:
+        chunk = await loop.run_in_executor(None, next, chunks, done)
+        if chunk is done:
+            return
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+class LoopTransport(Transport):
+    """Base for transports whose requests run on an event loop thread of their own, started on first use."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name=f'{self.name}-transport', daemon=True).start()
+            return self._loop
+
+    def send(self, request: Dict[str, object], timeout: float = None) -> Future:
+        import requests
+
+        try:
+            prepared = requests.Request(**request).prepare()
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        return asyncio.run_coroutine_threadsafe(self._send(prepared, timeout), self._get_loop())
+
+    @abstractmethod
+    async def _send(self, prepared: 'requests.PreparedRequest', timeout: Optional[float]) -> 'requests.Response':
+        """Sends the request on the loop thread."""
+
+    async def _close(self):
+        pass
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def stop():
+            try:
+                await self._close()
+            finally:
+                loop.stop()
+
+        asyncio.run_coroutine_threadsafe(stop(), loop)
+
+
+class AsyncioTransport(LoopTransport):
+    name = ASYNCIO
+
+    def __init__(self, max_idle_per_host: int = MAX_IDLE_PER_HOST):
+        super().__init__()
+        self.max_idle_per_host = max_idle_per_host
+        self._idle: Dict[ConnectionKey, List[Connection]] = {}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    async def _send(self, prepared: 'requests.PreparedRequest', timeout: Optional[float]) -> 'requests.Response':
+        import requests
+
+        try:
+            return await asyncio.wait_for(self._follow(prepared), timeout)
+        except asyncio.TimeoutError:
+            raise requests.Timeout(f'No response from {prepared.url} within {timeout} s', request=prepared)
+
+    async def _follow(self, prepared: 'requests.PreparedRequest') -> 'requests.Response':
+        import requests
+
+        history = []
+        while True:
+            response = await self._exchange(prepared)
+            if response.status_code not in REDIRECT_CODES or 'location' not in response.headers:
+                response.history = history
+                return response
+            if len(history) >= MAX_REDIRECTS:
+                raise requests.TooManyRedirects(f'Exceeded {MAX_REDIRECTS} redirects', response=response)
+            history.append(response)
+            prepared = self._redirect(prepared, response)
+
+    @staticmethod
+    def _redirect(prepared: 'requests.PreparedRequest', response: 'requests.Response') -> 'requests.PreparedRequest':
+        from requests.utils import requote_uri
+
+        redirected = prepared.copy()
+        redirected.url = requote_uri(urljoin(response.url, response.headers['location']))
+        status = response.status_code
+        if (status == 303 and prepared.method != 'HEAD') or (status in {301, 302} and prepared.method == 'POST'):
+            redirected.method = 'GET'
+            redirected.body = None
+            for name in ('Content-Length', 'Content-Type', 'Transfer-Encoding'):
+                redirected.headers.pop(name, None)
+        if urlsplit(redirected.url).netloc != urlsplit(prepared.url).netloc:
+            redirected.headers.pop('Authorization', None)
+        return redirected
+
+    def _get_ssl_context(self) -> ssl.SSLContext:
+        if self._ssl_context is None:
+            from requests.certs import where
+            self._ssl_context = ssl.create_default_context(cafile=where())
+        return self._ssl_context
+
+    async def _connect(self, key: ConnectionKey) -> Tuple[Connection, bool]:
+        """An idle connection to the host if there is one, otherwise a new one. Also returns whether it was idle."""
+        import requests
+
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+
+        scheme, host, port = key
+        try:
+            conn = await asyncio.open_connection(host, port, limit=MAX_LINE,
+                                                 ssl=self._get_ssl_context() if scheme == 'https' else None)
+        except ssl.SSLError as e:
+            raise requests.exceptions.SSLError(e)
+        except OSError as e:
+            raise requests.ConnectionError(e)
+        return conn, False
+
+    def _release(self, key: ConnectionKey, conn: Connection):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.max_idle_per_host:
+            idle.append(conn)
+        else:
+            conn[1].close()
+
+    @staticmethod
+    def _encode_head(prepared: 'requests.PreparedRequest', url) -> Tuple[bytes, object]:
+        """The request line and headers, and the body as bytes, a streamed body or None."""
+        from requests.utils import default_user_agent
+
+        body = prepared.body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        headers = {'Host': url.netloc.rpartition('@')[2],
+                   'User-Agent': default_user_agent(), 'Accept-Encoding': ACCEPT_ENCODING, 'Accept': '*/*'}
+        headers.update(prepared.headers)
+        if body is not None and (isinstance(body, bytes) or hasattr(body, '__len__')):
+            headers['Content-Length'] = str(len(body))
+            headers.pop('Transfer-Encoding', None)
+        elif body is not None:
+            headers['Transfer-Encoding'] = 'chunked'
+        target = (url.path or '/') + (f'?{url.query}' if url.query else '')
+
+        head = f'{prepared.method} {target} HTTP/1.1\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in headers.items())
+        return head.encode('latin-1') + b'\r\n', body
+
+    @staticmethod
+    async def _write_body(writer: asyncio.StreamWriter, body, chunked: bool):
+        async for chunk in _iter_chunks(body):
+            writer.write(f'{len(chunk):x}\r\n'.encode() + chunk + b'\r\n' if chunked else chunk)
+            await writer.drain()
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+
+    async def _exchange(self, prepared: 'requests.PreparedRequest') -> 'requests.Response':
+        import requests
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+
+        url = urlsplit(prepared.url)
+        if url.scheme not in {'http', 'https'}:
+            raise requests.exceptions.InvalidSchema(f'No connection adapters were found for {prepared.url}')
+        key = (url.scheme, url.hostname, url.port or (443 if url.scheme == 'https' else 80))
+        head, body = self._encode_head(prepared, url)
+
+        for attempt in range(2):
+            (reader, writer), reused = await self._connect(key)
+            started = time.perf_counter()
+            try:
+                if isinstance(body, bytes) or body is None:
+                    writer.write(head + (body or b''))
+                else:
+                    writer.write(head)
+                    await self._write_body(writer, body, chunked=not hasattr(body, '__len__'))
+                await writer.drain()
+                version, status, reason, header_list = await _read_head(reader)
+                break
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                # The server may have closed an idle connection just as it was reused
+                if reused and attempt == 0:
+                    continue
+                raise requests.ConnectionError(e, request=prepared)
+            except BaseException:
+                writer.close()
+                raise
+        elapsed = time.perf_counter() - started
+
+        headers = CaseInsensitiveDict()
+        for name, value in header_list:
+            headers[name] = f'{headers[name]}, {value}' if name in headers else value
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        parts, wire_size = [], 0
+        try:
+            decoder = Decoder(headers.get('content-encoding', ''))
+        except DecodeError as e:
+            writer.close()
+            raise requests.exceptions.ContentDecodingError(e, request=prepared)
+
+        def on_data(data: bytes):
+            nonlocal wire_size
+            wire_size += len(data)
+            parts.append(decoder.decompress(data))
+
+        try:
+            if prepared.method == 'HEAD' or status in {204, 304}:
+                pass
+            elif 'chunked' in headers.get('transfer-encoding', '').lower():
+                await _read_chunked(reader, on_data)
+            elif 'content-length' in headers:
+                await _read_length(reader, int(headers['content-length']), on_data)
+            else:
+                await _read_to_eof(reader, on_data)
+                keep_alive = False
+            parts.append(decoder.flush())
+        except DecodeError as e:
+            writer.close()
+            raise requests.exceptions.ContentDecodingError(e, request=prepared)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            writer.close()
+            raise requests.exceptions.ChunkedEncodingError(e, request=prepared)
+        except BaseException:
+            writer.close()
+            raise
+
+        if keep_alive:
+            self._release(key, (reader, writer))
+        else:
+            writer.close()
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = reason
+        response.headers = headers
+        response._content = b''.join(parts)
+        response.url = prepared.url
+        response.encoding = get_encoding_from_headers(headers)
+        response.elapsed = timedelta(seconds=elapsed)
+        response.request = prepared
+        response.http_version = version
+        response.wire_size = wire_size
+        return response
+
+    async def _close(self):
+        for conns in self._idle.values():
+            for _, writer in conns:
+                writer.close()
+        self._idle.clear()
+
+
+class Http2Transport(LoopTransport):
+    name = HTTP2
+
+    def __init__(self, prior_knowledge: bool = False):
+        if httpx is None:
+            raise RuntimeError('The http2 transport needs httpx, install it with `pip install httpx[http2]`')
+        super().__init__()
+        self.prior_knowledge = prior_knowledge
+        self._client: Optional['httpx.AsyncClient'] = None
+        if prior_knowledge:
+            self.name = H2C
+
+    def _get_client(self) -> 'httpx.AsyncClient':
+        if self._client is None:
+            from requests.certs import where
+            # Without HTTP/1.1, httpx speaks HTTP/2 with prior knowledge to http urls
+            self._client = httpx.AsyncClient(http1=not self.prior_knowledge, http2=True, follow_redirects=True,
+                                             max_redirects=MAX_REDIRECTS, trust_env=False,
+                                             verify=ssl.create_default_context(cafile=where()))
+        return self._client
+
+    async def _send(self, prepared: 'requests.PreparedRequest', timeout: Optional[float]) -> 'requests.Response':
+        import requests
+
+        body = prepared.body
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        headers = dict(prepared.headers)
+        if isinstance(body, bytes):
+            headers['Content-Length'] = str(len(body))
+        elif body is not None:
+            # httpx streams async iterables, sending Content-Length when the body has a length
+            body = _iter_chunks(body)
+
+        try:
+            response = await self._get_client().request(prepared.method, prepared.url, headers=headers,
+                                                        content=body, timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(e, request=prepared)
+        except httpx.TooManyRedirects as e:
+            raise requests.TooManyRedirects(e, request=prepared)
+        except httpx.UnsupportedProtocol as e:
+            raise requests.exceptions.InvalidSchema(e, request=prepared)
+        except httpx.DecodingError as e:
+            raise requests.exceptions.ContentDecodingError(e, request=prepared)
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(e, request=prepared)
+
+        converted = _from_httpx(response, prepared)
+        converted.history = [_from_httpx(r, prepared) for r in response.history]
+        return converted
+
+    async def _close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _from_httpx(response: 'httpx.Response', prepared: 'requests.PreparedRequest') -> 'requests.Response':
+    import requests
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    headers = CaseInsensitiveDict()
+    for name, value in response.headers.multi_items():
+        headers[name] = f'{headers[name]}, {value}' if name in headers else value
+
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted.reason = response.reason_phrase
+    converted.headers = headers
+    converted._content = response.content
+    converted.url = str(response.url)
+    converted.encoding = get_encoding_from_headers(headers)
+    converted.elapsed = response.elapsed
+    converted.http_version = response.http_version
+    converted.wire_size = response.num_bytes_downloaded
+    if str(response.request.url) == prepared.url:
+        converted.request = prepared
+    else:
+        # The request a redirect led to
+        converted.request = requests.Request(response.request.method, str(response.request.url),
+                                             headers=dict(response.request.headers)).prepare()
+    return converted
+
+
+def create_transport(name: str = THREADS, concurrency: int = None) -> Transport:
+    if name == ASYNCIO:
+        return AsyncioTransport()
+    if name in {HTTP2, H2C}:
+        return Http2Transport(prior_knowledge=name == H2C)
+    if name == THREADS:
+        return ThreadTransport(concurrency)
+    raise ValueError(f'Unknown transport {name}, expected one of {", ".join(TRANSPORTS)}')
+
+
+_shared: Dict[str, Transport] = {}
+_shared_lock = threading.Lock()
+
+
+def get_transport(name: str = None) -> Transport:
+    """The transport shared by the editor, REPOSE_TRANSPORT's unless named."""
+    name = name or os.environ.get(ENV_VAR) or THREADS
+    with _shared_lock:
+        if name not in _shared:
+            try:
+                _shared[name] = create_transport(name)
+            except (RuntimeError, ValueError) as e:
+                log.error('Falling back to the threads transport %s', e)
+                _shared[name] = _shared.get(THREADS) or create_transport(THREADS)
+                _shared[THREADS] = _shared[name]
+        return _shared[name]
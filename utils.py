@@ -1,16 +1,31 @@
+import os
 from datetime import timedelta
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
 
-import requests
+if TYPE_CHECKING:
+    import requests
 
 
 def parse_content_type(content_type_header: str) -> str:
     return content_type_header.split(';')[0]
 
 
-def get_content_type(response: requests.Response) -> str:
+def get_content_type(response: 'requests.Response') -> str:
     return parse_content_type(response.headers.get('content-type', ''))
 
 
+# Versions as reported by urllib3, for responses from requests itself
+HTTP_VERSIONS = {9: 'HTTP/0.9', 10: 'HTTP/1.0', 11: 'HTTP/1.1', 20: 'HTTP/2'}
+
+
+def get_http_version(response: 'requests.Response') -> str:
+    """The protocol a response came over, e.g. HTTP/2, or an empty string when unknown."""
+    version = getattr(response, 'http_version', None)
+    if version:
+        return version
+    return HTTP_VERSIONS.get(getattr(response.raw, 'version', None), '')
+
+
 language_map = {
     'text': 'text',
     'text-plain': 'text',
@@ -66,8 +81,56 @@ def timedelta_fmt(delta: timedelta) -> str:
     return str(delta)
 
 
-def format_response_size(response: requests.Response) -> str:
-    cl = response.headers.get('content-length')
-    if cl:
-        return sizeof_fmt(float(cl))
-    return sizeof_fmt(float(len(response.content)))
\ No newline at end of file
+def get_wire_size(response: 'requests.Response') -> Optional[int]:
+    """Size of the body as it was sent, before it was decoded, or None when unknown."""
+    return getattr(response, 'wire_size', None)
+
+
+def format_response_size(response: 'requests.Response') -> str:
+    """The decoded size of the body, followed by its size on the wire when it was compressed."""
+    path = getattr(response, 'download_path', None)
+    # Downloaded bodies are only on disk
+    size = os.path.getsize(path) if path and os.path.exists(path) else len(response.content or b'')
+    wire_size = get_wire_size(response)
+    encoding = response.headers.get('content-encoding', '')
+    if wire_size is None or wire_size == size or encoding.strip().lower() in {'', 'identity'}:
+        return sizeof_fmt(float(size))
+    return f'{sizeof_fmt(float(size))} ({sizeof_fmt(float(wire_size))} {encoding})'
+
+
+def format_bulk_params(rows: List[Tuple[str, str, str]]) -> str:
+    """Formats rows as `key: value` lines for bulk editing."""
+    return '\n'.join(f'{k}: {v}' for k, v, *_ in rows if k)
+
+
+def parse_bulk_params(text: str, descriptions: Dict[str, str] = None) -> List[Tuple[str, str, str]]:
+    """
+    Parses `key: value` lines back into rows, keeping the description of any
+    key found in `descriptions`. Blank lines and lines starting with // are skipped.
+    """
+    descriptions = descriptions or {}
+    rows = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        key, _, value = line.partition(':')
+        key = key.strip()
+        rows.append((key, value.strip(), descriptions.get(key, '')))
+    return rows
+
+
+def has_long_line(text: str, limit: int = 5000) -> bool:
+    """
+    Whether any line is longer than `limit` characters, counting its newline
+    as iterating over the lines of a file does. Jumps to the last newline
+    within each window of `limit` characters, so the text is never split and
+    short lines cost nothing.
+    """
+    pos, end, rfind = 0, len(text), text.rfind
+    while end - pos > limit:
+        newline = rfind('\n', pos, pos + limit)
+        if newline == -1:
+            return True
+        pos = newline + 1
+    return False
@@ -1,9 +1,10 @@
 from gi.repository import Gtk
 
+import gresources
 from models import RequestTreeNode
 
 
-@Gtk.Template.from_file('ui/ActiveRequestTab.glade')
+@gresources.template('ui/ActiveRequestTab.glade')
 class ActiveRequestTab(Gtk.Box):
     __gtype_name__ = 'ActiveRequestTab'
 
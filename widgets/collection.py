@@ -1,15 +1,38 @@
 import logging
+from itertools import islice
+from typing import Dict, Iterator, Optional
 
-from gi.repository import Gtk
+from gi.repository import Gdk, Gtk, GObject, GLib
 
-from models import CollectionModel, RequestTreeNode
+import gresources
+from db import RequestDAO, submit_write
+from models import CollectionModel, RequestTreeNode, DROP_AFTER, DROP_BEFORE, DROP_INTO
 
 log = logging.getLogger(__name__)
 
+# Top level rows added per idle callback while filling the tree
+POPULATE_CHUNK_SIZE = 500
 
-@Gtk.Template.from_file("ui/Collection.glade")
+# Stands in for the children of a folder until it is first expanded
+PLACEHOLDER_PK = ''
+
+# Rows are only dragged within their own tree, carrying the pk of their node
+DRAG_TARGETS = [Gtk.TargetEntry.new('repose/request-node', Gtk.TargetFlags.SAME_WIDGET, 0)]
+
+DROP_POSITIONS = {
+    Gtk.TreeViewDropPosition.BEFORE: DROP_BEFORE,
+    Gtk.TreeViewDropPosition.AFTER: DROP_AFTER,
+    Gtk.TreeViewDropPosition.INTO_OR_BEFORE: DROP_INTO,
+    Gtk.TreeViewDropPosition.INTO_OR_AFTER: DROP_INTO,
+}
+
+
+@gresources.template('ui/Collection.glade')
 class Collection(Gtk.Box):
     __gtype_name__ = "Collection"
+    __gsignals__ = {
+        'request_activated': (GObject.SIGNAL_RUN_FIRST, None, (object,))
+    }
 
     folder_icon = Gtk.Image().new_from_icon_name('folder', 50)
 
@@ -23,30 +46,177 @@ class Collection(Gtk.Box):
     def __init__(self, model: CollectionModel):
         super(Collection, self).__init__()
         self.model = model
+        # TreeStore iters persist for as long as their row exists
+        self.iters: Dict[str, Gtk.TreeIter] = {}
+        # Top level nodes still to be added, and the idle source adding them
+        self._pending: Optional[Iterator[RequestTreeNode]] = None
+        self._populate_source: Optional[int] = None
         self.collection_name_label.set_text(model.name)
+        self.requests_tree_view.connect('test-expand-row', self._on_test_expand_row)
+        self._init_drag_and_drop()
         self.populate_collection()
 
+    def _init_drag_and_drop(self):
+        view = self.requests_tree_view
+        view.enable_model_drag_source(Gdk.ModifierType.BUTTON1_MASK, DRAG_TARGETS, Gdk.DragAction.MOVE)
+        view.enable_model_drag_dest(DRAG_TARGETS, Gdk.DragAction.MOVE)
+        view.connect('drag-data-get', self._on_drag_data_get)
+        view.connect('drag-data-received', self._on_drag_data_received)
+
     @Gtk.Template.Callback('tree_view_row_activated')
     def _tree_view_row_activated(self, view: Gtk.TreeView, path: Gtk.TreePath, col: Gtk.TreeViewColumn):
         it = self.requests_tree_store.get_iter(path)
-        req_pk = self.requests_tree_store.get_value(it, 1)
-        log.info('')
-        # print(view, path, col)
+        node = self.model.get_node(self.requests_tree_store.get_value(it, 1))
+        if node and not node.is_folder():
+            log.info('Activated request %s', node.pk)
+            self.emit('request_activated', node)
+
+    def _on_drag_data_get(self, view: Gtk.TreeView, context: Gdk.DragContext, data: Gtk.SelectionData,
+                          info: int, time: int):
+        store, it = view.get_selection().get_selected()
+        if it is not None:
+            data.set(data.get_target(), 8, store.get_value(it, 1).encode())
+
+    def _on_drag_data_received(self, view: Gtk.TreeView, context: Gdk.DragContext, x: int, y: int,
+                               data: Gtk.SelectionData, info: int, time: int):
+        # The rows are moved by move_node, not by the tree view's own handler
+        view.stop_emission_by_name('drag-data-received')
+        node = self.model.get_node((data.get_data() or b'').decode())
+        target, where = None, DROP_AFTER
+        dest = view.get_dest_row_at_pos(x, y)
+        if dest is not None:
+            path, position = dest
+            target = self.model.get_node(self.requests_tree_store[path][1])
+            where = DROP_POSITIONS[position]
+
+        drop = self.model.drop_position(node, target, where) if node and (target or dest is None) else None
+        if drop is not None:
+            self.move_node(node, *drop)
+        context.finish(drop is not None, False, time)
 
     @Gtk.Template.Callback()
     def name_label_pressed(self, *args):
         self.collection_revealer.set_reveal_child(not self.collection_revealer.get_reveal_child())
 
     def populate_collection(self):
-        it: Gtk.TreeIter = self.requests_tree_store.get_iter_first()
-        for node in self.model.nodes:
-            self.add_request_node(it, node)
+        """
+        Fills in the top level rows in idle time chunks, with the store
+        detached from the view. Children are added when a row is expanded.
+        """
+        self.requests_tree_view.set_model(None)
+        self._pending = iter(list(self.model.nodes))
+        self._populate_source = GLib.idle_add(self._populate_chunk)
 
-    def add_request_node(self, it: Gtk.TreeIter, node: RequestTreeNode):
-        if node.is_folder():
-            parent_it = self.requests_tree_store.append(it, [node.folder.name, node.pk, None])
-        else:
-            parent_it = self.requests_tree_store.append(it, [node.request.name, node.pk, None])
+    def _populate_chunk(self) -> bool:
+        added = 0
+        for node in islice(self._pending, POPULATE_CHUNK_SIZE):
+            self._add_row(None, node)
+            added += 1
+
+        if added < POPULATE_CHUNK_SIZE:
+            self._populate_source = None
+            self._populated()
+            return False
+        return True
+
+    def _populated(self):
+        self._pending = None
+        self.requests_tree_view.set_model(self.requests_tree_store)
+        log.debug('Finished populating collection %s', self.model.name)
+
+    def _finish_populating(self):
+        """
+        Adds the remaining top level rows right away. Called before any change
+        to the tree, as the rows still to be added are those of the model as it
+        was when population started.
+        """
+        if self._pending is None:
+            return
+        if self._populate_source is not None:
+            GLib.source_remove(self._populate_source)
+            self._populate_source = None
+        for node in self._pending:
+            self._add_row(None, node)
+        self._populated()
+
+    def _on_test_expand_row(self, view: Gtk.TreeView, it: Gtk.TreeIter, path: Gtk.TreePath):
+        node = self.model.get_node(self.requests_tree_store.get_value(it, 1))
+        if node and not self._is_populated(it):
+            self._populate_children(it, node)
+        return False
+
+    def _is_populated(self, it: Gtk.TreeIter) -> bool:
+        child = self.requests_tree_store.iter_children(it)
+        return child is None or self.requests_tree_store.get_value(child, 1) != PLACEHOLDER_PK
 
+    def _populate_children(self, it: Gtk.TreeIter, node: RequestTreeNode):
+        placeholder = self.requests_tree_store.iter_children(it)
         for child in node.children:
-            self.add_request_node(parent_it, child)
+            self._add_row(it, child)
+        self.requests_tree_store.remove(placeholder)
+
+    def add_request_node(self, it: Optional[Gtk.TreeIter], node: RequestTreeNode, position: int = -1):
+        self._finish_populating()
+        self._add_row(it, node, position)
+
+    def _add_row(self, it: Optional[Gtk.TreeIter], node: RequestTreeNode, position: int = -1):
+        node_it = self.requests_tree_store.insert(it, position, [node.name, node.pk, None])
+        self.iters[node.pk] = node_it
+
+        if node.children:
+            self.requests_tree_store.append(node_it, ['', PLACEHOLDER_PK, None])
+
+    def get_iter(self, pk: str) -> Optional[Gtk.TreeIter]:
+        return self.iters.get(pk)
+
+    def select_node(self, node: RequestTreeNode):
+        it = self.iters.get(node.pk)
+        if it is not None:
+            self.requests_tree_view.get_selection().select_iter(it)
+
+    def update_request_node(self, node: RequestTreeNode):
+        self._finish_populating()
+        it = self.iters.get(node.pk)
+        if it is not None:  # Children of folders that were never expanded have no row yet
+            self.requests_tree_store.set_value(it, 0, node.name)
+
+    def move_node(self, node: RequestTreeNode, parent: Optional[RequestTreeNode] = None, position: int = -1):
+        """
+        Moves a node within this collection, updating the model, the db and
+        only the affected rows of the tree store.
+        """
+        self._finish_populating()
+        old_parent = node.parent
+        moved = self.model.move_node(node, parent, position)
+        siblings = self.model.siblings(node)
+        index = self.model.index_of(node)
+
+        it = self.iters.get(node.pk)
+        parent_it = self.iters.get(parent.pk) if parent else None
+        if it and old_parent is parent:
+            following = siblings[index + 1] if index + 1 < len(siblings) else None
+            self.requests_tree_store.move_before(it, self.iters[following.pk] if following else None)
+        else:
+            if it:
+                self._forget_iters(node)
+                self.requests_tree_store.remove(it)
+
+            if parent is None or (parent_it and self._is_populated(parent_it)):
+                self._add_row(parent_it, node, index)
+            elif parent_it and not self.requests_tree_store.iter_has_child(parent_it):
+                self.requests_tree_store.append(parent_it, ['', PLACEHOLDER_PK, None])
+
+        submit_write(lambda: RequestDAO().move_request(node, moved)) \
+            .add_done_callback(self._handle_node_moved)
+
+    def _forget_iters(self, node: RequestTreeNode):
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            self.iters.pop(n.pk, None)
+            stack.extend(n.children)
+
+    @staticmethod
+    def _handle_node_moved(future):
+        if future.exception():
+            log.error('Failed to save moved request %s', future.exception())
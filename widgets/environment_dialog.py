@@ -0,0 +1,87 @@
+import logging
+from concurrent.futures import Future
+from typing import Optional
+
+from gi.repository import Gtk
+
+import gresources
+from db import EnvironmentDAO, submit_write
+from models import EnvironmentModel
+from widgets.param_table import ParamTable
+
+log = logging.getLogger(__name__)
+
+
+@gresources.template('ui/EnvironmentDialog.glade')
+class EnvironmentDialog(Gtk.Window):
+    """Edits the environments held by the main window."""
+    __gtype_name__ = 'EnvironmentDialog'
+
+    environment_box: Gtk.Box = Gtk.Template.Child()
+    environment_combo: Gtk.ComboBoxText = Gtk.Template.Child()
+    environment_name_entry: Gtk.Entry = Gtk.Template.Child()
+
+    def __init__(self, main_window):
+        super(EnvironmentDialog, self).__init__()
+        self.main_window = main_window
+        self.environment: Optional[EnvironmentModel] = None
+        self.set_transient_for(main_window)
+
+        self.variable_table = ParamTable()
+        self.environment_box.pack_start(self.variable_table, True, True, 0)
+
+        self._fill_combo(main_window.active_environment)
+
+    def _fill_combo(self, selected: Optional[EnvironmentModel]):
+        self.environment_combo.remove_all()
+        for env in self.main_window.environments.values():
+            self.environment_combo.append(env.pk, env.name)
+
+        if selected:
+            self.environment_combo.set_active_id(selected.pk)
+        elif self.main_window.environments:
+            self.environment_combo.set_active(0)
+        else:
+            self._edit(EnvironmentModel('New environment'))
+
+    def _edit(self, env: EnvironmentModel):
+        self.environment = env
+        self.environment_name_entry.set_text(env.name)
+        self.variable_table.set_values(env.variables)
+
+    @Gtk.Template.Callback('on_environment_changed')
+    def _on_environment_changed(self, combo: Gtk.ComboBoxText):
+        env = self.main_window.environments.get(combo.get_active_id())
+        if env:
+            self._edit(env)
+
+    @Gtk.Template.Callback('on_new_clicked')
+    def _on_new_clicked(self, btn: Gtk.Button):
+        self.environment_combo.set_active(-1)
+        self._edit(EnvironmentModel('New environment'))
+
+    @Gtk.Template.Callback('on_delete_clicked')
+    def _on_delete_clicked(self, btn: Gtk.Button):
+        env = self.environment
+        if env.pk not in self.main_window.environments:
+            self._on_new_clicked(btn)
+            return
+
+        submit_write(lambda: EnvironmentDAO().delete_environment(env.pk)) \
+            .add_done_callback(lambda f: self._handle_saved(f, None))
+        self.main_window.remove_environment(env)
+
+    @Gtk.Template.Callback('on_save_clicked')
+    def _on_save_clicked(self, btn: Gtk.Button):
+        env = self.environment
+        env.name = self.environment_name_entry.get_text().strip() or env.name
+        env.variables = self.variable_table.get_values()
+
+        submit_write(lambda: EnvironmentDAO().save_environment(env)) \
+            .add_done_callback(lambda f: self._handle_saved(f, env))
+        self.main_window.add_environment(env)
+
+    def _handle_saved(self, future: Future, env: Optional[EnvironmentModel]):
+        if future.exception():
+            log.error('Failed to save environments %s', future.exception())
+        self._fill_combo(env)
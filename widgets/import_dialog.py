@@ -0,0 +1,69 @@
+import logging
+import threading
+from concurrent.futures import Future
+
+from gi.repository import Gtk, GLib
+
+import gresources
+from db import submit_write
+from importers import Importer, ImportCancelled
+from models import CollectionModel
+from utils import sizeof_fmt
+
+log = logging.getLogger(__name__)
+
+
+@gresources.template('ui/ImportDialog.glade')
+class ImportDialog(Gtk.Window):
+    __gtype_name__ = 'ImportDialog'
+
+    import_file_label: Gtk.Label = Gtk.Template.Child()
+    import_progress_bar: Gtk.ProgressBar = Gtk.Template.Child()
+    import_cancel_button: Gtk.Button = Gtk.Template.Child()
+
+    def __init__(self, main_window, path: str):
+        super(ImportDialog, self).__init__()
+        self.main_window = main_window
+        self.path = path
+        self.cancel = threading.Event()
+
+        self.set_transient_for(main_window)
+        self.import_file_label.set_text(f'Importing {path}')
+
+    def start(self):
+        self.show_all()
+        submit_write(self._run_import).add_done_callback(self._on_import_finished)
+
+    def _run_import(self) -> CollectionModel:
+        # Built on the writer thread, as that's where its DAOs get their connection,
+        # and so a file of unknown format is reported like any other failure
+        importer = Importer(self.path, progress=self._on_progress, cancel=self.cancel)
+        return importer.run()
+
+    def _on_progress(self, read: int, total: int, imported: int):
+        # Called from the db writer thread
+        GLib.idle_add(self._update_progress, read, total, imported)
+
+    def _update_progress(self, read: int, total: int, imported: int):
+        self.import_progress_bar.set_fraction(read / total if total else 1.0)
+        self.import_progress_bar.set_text(
+            f'{imported} requests, {sizeof_fmt(read)} of {sizeof_fmt(total)}')
+        return False
+
+    @Gtk.Template.Callback('on_cancel_clicked')
+    def _on_cancel_clicked(self, btn: Gtk.Button):
+        log.info('Cancelling import of %s', self.path)
+        self.cancel.set()
+        self.import_cancel_button.set_sensitive(False)
+
+    def _on_import_finished(self, future: Future):
+        self.destroy()
+
+        ex = future.exception()
+        if isinstance(ex, ImportCancelled):
+            return
+        if ex:
+            log.error('Failed to import %s: %s', self.path, ex)
+            return
+
+        self.main_window.load_collection(future.result().pk)
@@ -0,0 +1,18 @@
+from gi.repository import Gtk
+
+import gresources
+
+
+@gresources.template('ui/LoadingWindow.glade')
+class LoadingWindow(Gtk.Window):
+    __gtype_name__ = 'LoadingWindow'
+
+    loading_spinner: Gtk.Spinner = Gtk.Template.Child()
+    loading_label: Gtk.Label = Gtk.Template.Child()
+
+    def __init__(self):
+        super(LoadingWindow, self).__init__()
+        gresources.set_icon(self)
+
+    def set_status(self, text: str):
+        self.loading_label.set_text(text)
@@ -1,24 +1,34 @@
-from typing import List
+from concurrent.futures import Future
+from typing import Dict, List, Optional
 import logging
 
 from gi.repository import Gtk, GLib
 
-from db import CollectionDAO, DB_EXECUTOR
-from models import MainModel, RequestTreeNode, RequestModel, CollectionModel
+import gresources
+from db import CollectionDAO, EnvironmentDAO, submit_read
+from models import MainModel, RequestTreeNode, CollectionModel, EnvironmentModel
+from request_model import RequestModel
+from response_store import RESPONSE_STORE
+from utils import sizeof_fmt
 from widgets.active_request_tab import ActiveRequestTab
 from widgets.request_editor import RequestEditor
 from widgets.collection import Collection
+from widgets.environment_dialog import EnvironmentDialog
+from widgets.import_dialog import ImportDialog
 
 log = logging.getLogger(__name__)
 
 
-@Gtk.Template.from_file('ui/MainWindow.glade')
+@gresources.template('ui/MainWindow.glade')
 class MainWindow(Gtk.Window):
     __gtype_name__ = "MainWindow"
 
     header_bar: Gtk.HeaderBar = Gtk.Template.Child()
     request_pane: Gtk.Paned = Gtk.Template.Child()
     new_request_button: Gtk.Button = Gtk.Template.Child()
+    import_button: Gtk.Button = Gtk.Template.Child()
+    environment_combo: Gtk.ComboBoxText = Gtk.Template.Child()
+    response_memory_label: Gtk.Label = Gtk.Template.Child()
     request_list: Gtk.ListBox = Gtk.Template.Child()
     active_requests_notebook_box: Gtk.Box = Gtk.Template.Child()
     active_requests_notebook: Gtk.Notebook = Gtk.Template.Child()
@@ -27,7 +37,7 @@ class MainWindow(Gtk.Window):
         super(MainWindow, self).__init__()
         self.model = MainModel()
         self.connect('destroy', Gtk.main_quit)
-        self.set_icon_from_file('resources/img/nightcap-round-grey-100x100.png')
+        gresources.set_icon(self)
 
         # self.request_list = RequestList(self)
         # self.request_list.set_size_request(200, -1)
@@ -49,10 +59,18 @@ class MainWindow(Gtk.Window):
         # self.request_pane.pack1(self.request_list, True, False)
         # self.request_pane.pack2(self.active_requests_notebook_box, True, False)
 
+        self.tabs: Dict[str, ActiveRequestTab] = {}
+        # Collection widgets by the pk of their collection
+        self.collections: Dict[str, Collection] = {}
+        self.environments: Dict[str, EnvironmentModel] = {}
+        self.active_environment: Optional[EnvironmentModel] = None
+        RESPONSE_STORE.listeners.append(lambda: GLib.idle_add(self._update_response_memory_label))
+        self._update_response_memory_label()
         self.active_requests_notebook.connect('switch-page', self._on_requests_notebook_switch_page)
         self._add_blank_request()
 
         self.show_all()
+        self.load_environments()
         self.load_collections()
 
     def _on_requests_notebook_switch_page(self, notebook: Gtk.Notebook, page: Gtk.Widget, page_num: int):
@@ -60,8 +78,18 @@ class MainWindow(Gtk.Window):
         log.debug('Switching active request from %d to %d', current_page, page_num)
         page = self.active_requests_notebook.get_nth_page(page_num)
         tab: ActiveRequestTab = self.active_requests_notebook.get_tab_label(page)
+        # Responses of inactive tabs may be parked, loading this one back if needed
+        RESPONSE_STORE.touch(tab.request_node.request)
         self.request_editor.set_request(tab.request_node)
 
+    def _update_response_memory_label(self):
+        live, compressed, on_disk = RESPONSE_STORE.usage()
+        self.response_memory_label.set_text(f'Responses: {sizeof_fmt(live + compressed)}')
+        self.response_memory_label.set_tooltip_text(
+            f'{sizeof_fmt(live)} in memory, {sizeof_fmt(compressed)} compressed, '
+            f'{sizeof_fmt(on_disk)} on disk, of a {sizeof_fmt(RESPONSE_STORE.budget)} budget')
+        return False
+
     def _get_active_requests(self) -> List[RequestTreeNode]:
         reqs = []
         for page_num in range(self.active_requests_notebook.get_n_pages()):
@@ -80,15 +108,24 @@ class MainWindow(Gtk.Window):
         return self._get_current_active_tab().request_node
 
     def _add_blank_request(self):
-        new_node = RequestTreeNode(request=RequestModel(name='New Request'))
-        page = Gtk.DrawingArea()
-        new_tab = ActiveRequestTab(self, page, new_node)
-        page_num = self.active_requests_notebook.append_page(page, new_tab)
-        self.active_requests_notebook.show_all()
-        self.active_requests_notebook.set_current_page(page_num)
+        self.open_request(RequestTreeNode(request=RequestModel(name='New Request')))
+
+    def open_request(self, node: RequestTreeNode):
+        """Switches to the tab for the request, opening one if needed."""
+        tab = self.tabs.get(node.pk)
+        if not tab:
+            page = Gtk.DrawingArea()
+            tab = self.tabs[node.pk] = ActiveRequestTab(self, page, node)
+            self.active_requests_notebook.append_page(page, tab)
+            self.active_requests_notebook.show_all()
+
+        self.active_requests_notebook.set_current_page(self.active_requests_notebook.page_num(tab.page))
 
     def close_tab(self, tab: ActiveRequestTab):
         self.active_requests_notebook.remove(tab.page)
+        del self.tabs[tab.request_node.pk]
+        RESPONSE_STORE.forget(tab.request_node.request)
+        tab.request_node.release_request()
         if not self.active_requests_notebook.get_n_pages():
             self._add_blank_request()
 
@@ -96,28 +133,103 @@ class MainWindow(Gtk.Window):
         log.info('New request clicked')
         self._add_blank_request()
 
-    def _do_load_collections(self):
+    @Gtk.Template.Callback('on_import_clicked')
+    def _on_import_clicked(self, btn: Gtk.Button):
+        dialog = Gtk.FileChooserNative.new('Import Postman, Insomnia or HAR file', self,
+                                           Gtk.FileChooserAction.OPEN, None, None)
+        if dialog.run() == Gtk.ResponseType.ACCEPT:
+            ImportDialog(self, dialog.get_filename()).start()
+        dialog.destroy()
+
+    def load_environments(self):
+        submit_read(lambda: EnvironmentDAO().get_environments()) \
+            .add_done_callback(self._handle_environments_loaded)
+
+    def _handle_environments_loaded(self, future: Future):
+        if future.exception():
+            log.error('Failed to load environments %s', future.exception())
+            return
+
+        for env in future.result():
+            self.environments[env.pk] = env
+        self._fill_environment_combo()
+
+    def _fill_environment_combo(self):
+        active = self.active_environment
+        self.environment_combo.remove_all()
+        self.environment_combo.append('', 'No environment')
+        for env in sorted(self.environments.values(), key=lambda e: e.name):
+            self.environment_combo.append(env.pk, env.name)
+        self.environment_combo.set_active_id(active.pk if active else '')
+
+    def add_environment(self, env: EnvironmentModel):
+        self.environments[env.pk] = env
+        self._fill_environment_combo()
+
+    def remove_environment(self, env: EnvironmentModel):
+        self.environments.pop(env.pk, None)
+        if self.active_environment is env:
+            self.active_environment = None
+        self._fill_environment_combo()
+
+    def get_variables(self) -> Dict[str, str]:
+        return self.active_environment.as_dict() if self.active_environment else {}
+
+    @Gtk.Template.Callback('on_environment_changed')
+    def _on_environment_changed(self, combo: Gtk.ComboBoxText):
+        self.active_environment = self.environments.get(combo.get_active_id())
+
+    @Gtk.Template.Callback('on_environments_clicked')
+    def _on_environments_clicked(self, btn: Gtk.Button):
+        EnvironmentDialog(self).show_all()
+
+    def _handle_collections_loaded(self, future: Future):
         # TODO: Handle error
-        try:
-            cols = CollectionDAO().get_collections()
-            GLib.idle_add(self._handle_collections_loaded, cols)
-        except Exception as e:
-            log.error('Failed to load collections %s', e)
+        if future.exception():
+            log.error('Failed to load collections %s', future.exception())
+            return
 
-    def _handle_collections_loaded(self, collections: List[CollectionModel]):
         log.info('Successfully loaded collections from disk.')
-        for col in collections:
-            self.request_list.add(Collection(col))
+        for col in future.result():
+            self._add_collection(col)
 
     def load_collections(self):
         log.info('Loading collections from disk.')
-        DB_EXECUTOR.submit(self._do_load_collections)
+        submit_read(lambda: CollectionDAO().get_collections()) \
+            .add_done_callback(self._handle_collections_loaded)
+
+    def _handle_collection_loaded(self, future: Future):
+        if future.exception():
+            log.error('Failed to load collection %s', future.exception())
+            return
+
+        self._add_collection(future.result())
+        self.request_list.show_all()
+
+    def _add_collection(self, model: CollectionModel):
+        collection = self.collections[model.pk] = Collection(model)
+        collection.connect('request_activated', lambda _, node: self.open_request(node))
+        self.request_list.add(collection)
+
+    def load_collection(self, pk: str):
+        submit_read(lambda: CollectionDAO().get_collection(pk)) \
+            .add_done_callback(self._handle_collection_loaded)
 
     def update_active_request(self, node: RequestTreeNode):
         current_req = self.request_editor.get_request()
         self.model.requests[current_req.pk] = current_req
         self.request_editor.set_request(node)
 
-        if current_req.collection_pk:
-            self.request_list.update_request(current_req)
-            self.request_list.set_active_request(node)
+        self.update_request_node(current_req)
+        collection = self.collections.get(node.collection_pk)
+        if collection:
+            collection.select_node(node)
+
+    def update_request_node(self, node: RequestTreeNode):
+        """Shows a renamed request in its tab and in the tree of its collection."""
+        tab = self.tabs.get(node.pk)
+        if tab:
+            tab.request_name_label.set_text(node.name)
+        collection = self.collections.get(node.collection_pk)
+        if collection:
+            collection.update_request_node(node)
@@ -1,15 +1,23 @@
-from typing import List, Tuple
+from typing import Dict, List, Tuple, Optional
 
 from gi.repository import Gtk, GObject
 
+import gresources
+from utils import format_bulk_params, parse_bulk_params
 
-@Gtk.Template.from_file('ui/ParamTable.glade')
-class ParamTable(Gtk.TreeView):
+
+@gresources.template('ui/ParamTable.glade')
+class ParamTable(Gtk.Box):
     __gtype_name__ = 'ParamTable'
     __gsignals__ = {
         'changed': (GObject.SIGNAL_RUN_FIRST, None, ())
     }
 
+    param_stack: Gtk.Stack = Gtk.Template.Child()
+    tree_view: Gtk.TreeView = Gtk.Template.Child()
+    bulk_text_view: Gtk.TextView = Gtk.Template.Child()
+    bulk_edit_toggle: Gtk.ToggleButton = Gtk.Template.Child()
+
     key_column: Gtk.TreeViewColumn = Gtk.Template.Child()
     key_column_renderer: Gtk.CellRendererText = Gtk.Template.Child()
     value_column: Gtk.TreeViewColumn = Gtk.Template.Child()
@@ -17,48 +25,101 @@ class ParamTable(Gtk.TreeView):
     description_column: Gtk.TreeViewColumn = Gtk.Template.Child()
     description_column_renderer: Gtk.CellRendererText = Gtk.Template.Child()
 
-    def __init__(self):
+    def __init__(self, files: bool = False):
+        """With `files`, rows get a File column marking values that are paths of files to upload."""
         super(ParamTable, self).__init__()
-        self.store = Gtk.ListStore(str, str, str)  # (key, value, description)
-        self.set_model(self.store)
+        self.files = files
+        self.store = Gtk.ListStore(str, str, str, bool, int)  # (key, value, description, file, row id)
+        # Lower cased key -> row id -> row, for every row with the key.
+        # ListStore iters stay valid while their row exists.
+        self.key_index: Dict[str, Dict[int, Gtk.TreeIter]] = {}
+        self._next_row_id = 0
+        self.bulk_text_buffer: Gtk.TextBuffer = self.bulk_text_view.get_buffer()
+        self.tree_view.set_model(self.store)
+        if files:
+            self._init_file_column()
         self.add_row()
 
+    def _init_file_column(self):
+        renderer = Gtk.CellRendererToggle()
+        renderer.connect('toggled', self._on_file_toggled)
+        column = Gtk.TreeViewColumn('File', renderer, active=3)
+        self.tree_view.insert_column(column, 1)
+
+    def _row(self, row: Tuple) -> Tuple[str, str, str, bool, int]:
+        key, value, description = row[:3]
+        self._next_row_id += 1
+        return key, value, description, len(row) > 3 and bool(row[3]), self._next_row_id
+
+    def _index_row(self, it: Gtk.TreeIter):
+        key, row_id = self.store.get(it, 0, 4)
+        if key:
+            self.key_index.setdefault(key.lower(), {})[row_id] = it
+
+    def _unindex_row(self, it: Gtk.TreeIter):
+        key, row_id = self.store.get(it, 0, 4)
+        rows = self.key_index.get(key.lower())
+        if rows is not None:
+            rows.pop(row_id, None)
+            if not rows:
+                del self.key_index[key.lower()]
+
+    def _find_row(self, key: str) -> Optional[Gtk.TreeIter]:
+        rows = self.key_index.get(key.lower())
+        if not rows:
+            return None
+        if len(rows) == 1:
+            return next(iter(rows.values()))
+        # The first of the rows sharing a key takes precedence
+        return min(rows.values(), key=lambda it: self.store.get_path(it).get_indices()[0])
+
     def add_row(self, row: Tuple[str, str, str] = None):
-        self.store.append(row or ('', '', ''))
+        self._index_row(self.store.append(self._row(row or ('', '', ''))))
         if row:
             self.emit("changed")
 
     def prepend_row(self, row: Tuple[str, str, str] = None):
-        self.store.prepend(row or ('', '', ''))
+        it = self.store.prepend(self._row(row or ('', '', '')))
         if row:
+            self._index_row(it)
             self.emit("changed")
 
+    def _load_bulk_text(self):
+        # Rows are edited by key in the table, so while bulk editing it's brought up to date first
+        if self.is_bulk_editing():
+            self._set_table_values(self._get_bulk_values())
+
+    def _save_bulk_text(self):
+        if self.is_bulk_editing():
+            self.bulk_text_buffer.set_text(format_bulk_params(self._get_table_values()), -1)
+
     def prepend_or_update_row_by_key(self, row: Tuple[str, str, str]):
         key, val, desc = row
-        for store_row in self.store:
-            if store_row[0].lower() == key.lower():
-                store_row[1] = val
-                store_row[2] = desc
-                self.emit("changed")
-                return
-        self.prepend_row(row)
+        self._load_bulk_text()
+        it = self._find_row(key)
+        if it is None:
+            self.prepend_row(row)
+        else:
+            self.store.set(it, [1, 2], [val, desc])
+            self.emit("changed")
+        self._save_bulk_text()
 
     def delete_row_by_key(self, key: str):
-        lk = key.lower()
-        idx = None
-        for i, row in enumerate(self.store):
-            if row[0].lower() == lk:
-                idx = i
-                break
-
-        if idx is not None:
-            self.store.remove(self.store[idx].iter)
+        self._load_bulk_text()
+        it = self._find_row(key)
+        if it is not None:
+            self._unindex_row(it)
+            self.store.remove(it)
 
         self.emit("changed")
+        self._save_bulk_text()
 
     @Gtk.Template.Callback('on_key_column_renderer_edited')
     def _on_key_column_edited(self, widget: Gtk.Widget, path: Gtk.TreePath, text: str):
-        self.store[path][0] = text
+        it = self.store.get_iter(path)
+        self._unindex_row(it)
+        self.store[it][0] = text
+        self._index_row(it)
 
         if text and len(self.store) and len(self.store[-1][0]):
             self.add_row()
@@ -75,10 +136,55 @@ class ParamTable(Gtk.TreeView):
         self.store[path][2] = text
         self.emit("changed")
 
-    def get_values(self) -> List[Tuple[str, str, str]]:
+    def _on_file_toggled(self, renderer: Gtk.CellRendererToggle, path: str):
+        self.store[path][3] = not self.store[path][3]
+        self.emit("changed")
+
+    @Gtk.Template.Callback('on_bulk_edit_toggled')
+    def _on_bulk_edit_toggled(self, btn: Gtk.ToggleButton):
+        if btn.get_active():
+            self.bulk_text_buffer.set_text(format_bulk_params(self._get_table_values()), -1)
+            self.param_stack.set_visible_child_name('bulk')
+        else:
+            self._set_table_values(self._get_bulk_values())
+            self.param_stack.set_visible_child_name('table')
+
+    @Gtk.Template.Callback('on_bulk_text_changed')
+    def _on_bulk_text_changed(self, buf: Gtk.TextBuffer):
+        if self.is_bulk_editing():
+            self.emit("changed")
+
+    def is_bulk_editing(self) -> bool:
+        return self.bulk_edit_toggle.get_active()
+
+    def _get_table_values(self) -> List[Tuple]:
+        if self.files:
+            return [(row[0], row[1], row[2], row[3]) for row in self.store if row[0]]
         return [(row[0], row[1], row[2]) for row in self.store if row[0]]
 
-    def set_values(self, rows: List[Tuple[str, str, str]]):
+    def _get_bulk_values(self) -> List[Tuple]:
+        start, end = self.bulk_text_buffer.get_bounds()
+        descriptions = {row[0]: row[2] for row in self.store if row[2]}
+        rows = parse_bulk_params(self.bulk_text_buffer.get_text(start, end, True), descriptions)
+        if self.files:
+            # Bulk text has no file column, keys that were files stay files
+            files = {row[0] for row in self.store if row[3]}
+            rows = [(k, v, d, k in files) for k, v, d in rows]
+        return rows
+
+    def get_values(self) -> List[Tuple]:
+        return self._get_bulk_values() if self.is_bulk_editing() else self._get_table_values()
+
+    def _set_table_values(self, rows: List[Tuple[str, str, str]]):
+        # Detach the store while loading, so the view doesn't update per row
+        self.tree_view.set_model(None)
         self.store.clear()
-        for row in rows or [('', '', '')]:
-            self.store.append(row)
+        self.key_index.clear()
+        for row in rows:
+            self._index_row(self.store.append(self._row(row)))
+        self.store.append(self._row(('', '', '')))
+        self.tree_view.set_model(self.store)
+
+    def set_values(self, rows: List[Tuple[str, str, str]]):
+        self.bulk_edit_toggle.set_active(False)
+        self._set_table_values([row for row in rows or [] if row[0]])
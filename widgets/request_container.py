@@ -1,22 +1,28 @@
 import logging
-from typing import Optional
+import os
+from typing import Optional, Set
 
 from gi.repository import Gtk, GtkSource
 
-from models import RequestModel
+import gresources
+from request_model import RequestModel
+from templating import FILE_CONTENT_TYPE
 from widgets.param_table import ParamTable
 from utils import language_map, content_type_map, content_type_map_reverse
 
 log = logging.getLogger(__name__)
 
 
-@Gtk.Template.from_file('ui/RequestContainer.glade')
+@gresources.template('ui/RequestContainer.glade')
 class RequestContainer(Gtk.Overlay):
     __gtype_name__ = 'RequestContainer'
 
     request_notebook: Gtk.Notebook = Gtk.Template.Child()
     body_notebook: Gtk.Notebook = Gtk.Template.Child()
     body_text: GtkSource.View = Gtk.Template.Child()
+    body_file_button: Gtk.Button = Gtk.Template.Child()
+    body_file_label: Gtk.Label = Gtk.Template.Child()
+    body_encoding_combo: Gtk.ComboBoxText = Gtk.Template.Child()
 
     content_type_popover: Gtk.Popover = Gtk.Template.Child()
     content_type_popover_tree_view: Gtk.TreeView = Gtk.Template.Child()
@@ -26,6 +32,7 @@ class RequestContainer(Gtk.Overlay):
         super(RequestContainer, self).__init__()
 
         self.request_model: Optional[RequestModel] = None
+        self._dirty_fields: Set[str] = set()
         self.lang_manager = GtkSource.LanguageManager()
         self.body_notebook.connect('switch-page',
                                    self._on_body_notebook_page_switched)
@@ -36,6 +43,9 @@ class RequestContainer(Gtk.Overlay):
         self._init_content_type_popover()
         self._init_body_form_data_table()
         self._init_body_form_urlencoded_table()
+        self._init_body_file()
+        self.body_encoding_combo.connect('changed', self._on_body_encoding_changed)
+        self._init_assertion_table()
 
         self.request_notebook.set_current_page(0)
 
@@ -43,17 +53,17 @@ class RequestContainer(Gtk.Overlay):
         self.param_table = ParamTable()
         self.request_notebook.insert_page(self.param_table,
                                           Gtk.Label(label='Params'), 0)
-        self.param_table.connect('changed', self._on_param_table_changed)
+        self.param_table.connect('changed', self._on_field_changed, 'params')
 
     def _init_header_table(self):
         self.header_table = ParamTable()
         self.request_notebook.insert_page(self.header_table,
                                           Gtk.Label(label='Headers'), 1)
-        self.header_table.connect('changed', self._on_header_table_changed)
+        self.header_table.connect('changed', self._on_field_changed, 'headers')
 
     def _init_body_text(self):
         self.body_text_buffer = self.body_text.get_buffer()
-        self.body_text_buffer.connect('changed', self._on_body_text_changed)
+        self.body_text_buffer.connect('changed', self._on_field_changed, 'body_text')
 
         style_manager = GtkSource.StyleSchemeManager()
         scheme: GtkSource.StyleScheme = style_manager.get_scheme('kate')
@@ -68,45 +78,81 @@ class RequestContainer(Gtk.Overlay):
                                                     self._on_popover_row_activated)
 
     def _init_body_form_data_table(self):
-        self.body_form_data_table = ParamTable()
+        self.body_form_data_table = ParamTable(files=True)
         self.body_notebook.insert_page(self.body_form_data_table,
                                        Gtk.Label('Form Data'), 2)
-        self.body_form_data_table.connect('changed',
-                                          self._on_body_form_data_table_changed)
+        self.body_form_data_table.connect('changed', self._on_field_changed,
+                                          'body_form_data')
 
     def _init_body_form_urlencoded_table(self):
         self.body_form_urlencoded_table = ParamTable()
         self.body_notebook.insert_page(self.body_form_urlencoded_table,
                                        Gtk.Label('Form Url-Encoded'), 3)
-        self.body_form_urlencoded_table.connect('changed',
-                                                self._on_body_form_urlencoded_table_changed)
-
-    def _on_param_table_changed(self, widget):
-        params = self.param_table.get_values()
-        log.debug('Change request params to %s', params)
-        self.request_model.params = params
-
-    def _on_header_table_changed(self, widget):
-        headers = self.header_table.get_values()
-        log.debug('Change request headers to %s', headers)
-        self.request_model.headers = headers
-
-    def _on_body_text_changed(self, widget):
+        self.body_form_urlencoded_table.connect('changed', self._on_field_changed,
+                                                'body_form_urlencoded')
+
+    def _init_body_file(self):
+        self.body_file_button.connect('clicked', self._on_body_file_button_clicked)
+
+    def _on_body_file_button_clicked(self, button: Gtk.Button):
+        dialog = Gtk.FileChooserDialog(title='Choose File', parent=self.get_toplevel(),
+                                       action=Gtk.FileChooserAction.OPEN)
+        dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_OPEN, Gtk.ResponseType.OK)
+        if self.request_model.body_file:
+            dialog.set_filename(os.path.expanduser(self.request_model.body_file))
+        if dialog.run() == Gtk.ResponseType.OK:
+            self.request_model.body_file = dialog.get_filename()
+            self.request_model.saved = False
+            self._set_body_file_label(self.request_model.body_file)
+        dialog.destroy()
+
+    def _set_body_file_label(self, path: str):
+        self.body_file_label.set_text(path or 'No file chosen.')
+        self.body_file_label.set_tooltip_text(path or None)
+
+    def _on_body_encoding_changed(self, combo: Gtk.ComboBoxText):
+        encoding = combo.get_active_id() or ''
+        if self.request_model and self.request_model.body_encoding != encoding:
+            self.request_model.body_encoding = encoding
+            self.request_model.saved = False
+
+    def _init_assertion_table(self):
+        # Rows of check, expected value and description, see assertions.py
+        self.assertion_table = ParamTable()
+        self.assertion_table.set_tooltip_text('Checks: status, header <name>, jsonpath <expr>, '
+                                              'xpath <expr>, body, latency and script')
+        self.request_notebook.append_page(self.assertion_table, Gtk.Label(label='Tests'))
+        self.assertion_table.connect('changed', self._on_field_changed, 'assertions')
+
+    def _on_field_changed(self, widget, field: str):
+        # Only flag the field, it is read from the widget once in sync_to_model
+        self._dirty_fields.add(field)
+        self.request_model.saved = False
+
+    def _get_body_text(self) -> str:
         start, end = self.body_text_buffer.get_bounds()
-        body_text = self.body_text_buffer.get_text(start, end, True)
-        log.debug('Change request body raw text to %s', body_text)
-        self.request_model.body_text = body_text
-
-    def _on_body_form_data_table_changed(self, widget):
-        body_form_data = self.body_form_data_table.get_values()
-        log.debug('Change request body form data to %s', body_form_data)
-        self.request_model.body_form_data = body_form_data
+        return self.body_text_buffer.get_text(start, end, True)
+
+    def sync_to_model(self):
+        """
+        Copies the fields edited since the last sync from the widgets into the
+        request model. Called before the request is sent, saved or switched.
+        """
+        if not self.request_model:
+            return
 
-    def _on_body_form_urlencoded_table_changed(self, widget):
-        body_form_urlencoded = self.body_form_urlencoded_table.get_values()
-        log.debug('Change request body form urlencoded to %s',
-                  body_form_urlencoded)
-        self.request_model.body_form_urlencoded = body_form_urlencoded
+        readers = {
+            'params': self.param_table.get_values,
+            'headers': self.header_table.get_values,
+            'body_text': self._get_body_text,
+            'body_form_data': self.body_form_data_table.get_values,
+            'body_form_urlencoded': self.body_form_urlencoded_table.get_values,
+            'assertions': self.assertion_table.get_values,
+        }
+        for field in self._dirty_fields:
+            log.debug('Syncing request %s', field)
+            setattr(self.request_model, field, readers[field]())
+        self._dirty_fields.clear()
 
     def _on_body_notebook_page_switched(self, notebook: Gtk.Notebook,
                                         page: Gtk.Widget, page_num: int):
@@ -115,6 +161,7 @@ class RequestContainer(Gtk.Overlay):
             1: self._get_active_content_type,
             2: lambda: 'multipart/form-data',
             3: lambda: 'application/x-www-form-urlencoded',
+            4: lambda: FILE_CONTENT_TYPE,
         }.get(page_num)
 
         content_type = ct_func() if ct_func else ''
@@ -159,12 +206,19 @@ class RequestContainer(Gtk.Overlay):
 
     def set_request_model(self, request_model: RequestModel):
         self.request_model = request_model
+        saved = request_model.saved
         self.param_table.set_values(request_model.params)
         self.header_table.set_values(request_model.headers)
         self.body_text_buffer.set_text(request_model.body_text, -1)
         self.body_form_data_table.set_values(request_model.body_form_data)
         self.body_form_urlencoded_table.set_values(
             request_model.body_form_urlencoded)
+        self.assertion_table.set_values(request_model.assertions)
+        self._set_body_file_label(request_model.body_file)
+        self.body_encoding_combo.set_active_id(request_model.body_encoding)
+        # The widgets now mirror the model
+        self._dirty_fields.clear()
+        request_model.saved = saved
 
         self._update_body_notebook_page(request_model.content_type)
 
@@ -176,4 +230,6 @@ class RequestContainer(Gtk.Overlay):
             body_notebook_page = 2
         elif content_type == 'application/x-www-form-urlencoded':
             body_notebook_page = 3
+        elif content_type == FILE_CONTENT_TYPE:
+            body_notebook_page = 4
         self.body_notebook.set_current_page(body_notebook_page)
@@ -1,18 +1,24 @@
 import logging
-from typing import List, Tuple, Dict, Optional
+import time
+from urllib.parse import unquote, urlsplit
+from typing import List, Tuple, Dict, Optional, TYPE_CHECKING
 
-import requests
 from gi.repository import Gtk, GLib
 
-from models import RequestTreeNode, RequestModel
-from pool import TPE
+import gresources
+from db import HistoryDAO, submit_write
+from models import RequestTreeNode
+from request_model import RequestModel
 from widgets.request_container import RequestContainer
 from widgets.response_container import ResponseContainer
 
+if TYPE_CHECKING:
+    import requests
+
 log = logging.getLogger(__name__)
 
 
-@Gtk.Template.from_file('ui/RequestEditor.glade')
+@gresources.template('ui/RequestEditor.glade')
 class RequestEditor(Gtk.Box):
     __gtype_name__ = 'RequestEditor'
 
@@ -21,6 +27,7 @@ class RequestEditor(Gtk.Box):
     request_name_entry: Gtk.Entry = Gtk.Template.Child()
     url_entry: Gtk.Entry = Gtk.Template.Child()
     send_button: Gtk.Button = Gtk.Template.Child()
+    download_button: Gtk.Button = Gtk.Template.Child()
     save_button: Gtk.Button = Gtk.Template.Child()
     request_response_box: Gtk.Paned = Gtk.Template.Child()
 
@@ -30,7 +37,7 @@ class RequestEditor(Gtk.Box):
         self.main_window = main_window
         self.request_model: Optional[RequestModel] = None
         self.active_request: Optional[RequestTreeNode] = None
-        self.last_response: Optional[requests.Response] = None
+        self.last_response: Optional['requests.Response'] = None
 
         self.request_container = RequestContainer(self)
         self.request_response_box.pack1(self.request_container, True, False)
@@ -43,15 +50,22 @@ class RequestEditor(Gtk.Box):
 
     @Gtk.Template.Callback('on_request_name_changed')
     def _on_request_name_changed(self, entry: Gtk.Entry):
-        self.active_request = self.get_request()
+        node, name = self.active_request, entry.get_text()
+        # Also fires when set_request fills in the entry
+        if node is None or node.request.name == name:
+            return
 
-        if self.active_request.collection_pk:
-            self.main_window.request_list.update_request(self.active_request)
+        node.request.name = name
+        self.main_window.update_request_node(node)
 
     def get_request(self) -> RequestTreeNode:
         return self.active_request
 
+    def sync_to_model(self):
+        self.request_container.sync_to_model()
+
     def set_request(self, node: RequestTreeNode):
+        self.sync_to_model()
         self.active_request = node
         self.request_model = node.request
         self.url_entry.set_text(self.request_model.url)
@@ -66,15 +80,69 @@ class RequestEditor(Gtk.Box):
     @Gtk.Template.Callback('on_save_pressed')
     def _on_save_pressed(self, btn):
         log.info('Save pressed')
+        self.sync_to_model()
 
     @Gtk.Template.Callback('on_send_pressed')
     def _on_send_pressed(self, btn):
+        self.sync_to_model()
         self.response_container.set_response_spinner_active(True)
 
-        TPE.submit(self.request_model.do_request)
+        node, sent_at, previous = self.active_request, time.time(), self.request_model.response
+        self.request_model.send(self.main_window.get_variables()) \
+            .add_done_callback(lambda _: self._record_history(node, sent_at, previous))
         log.info('Creating request to %s - %s', self.request_model.method, self.request_model.url)
 
+    @Gtk.Template.Callback('on_download_pressed')
+    def _on_download_pressed(self, btn):
+        if self.request_model.active_download:
+            self.request_model.cancel_download()
+            return
+
+        self.sync_to_model()
+        dialog = Gtk.FileChooserDialog(title='Save Response Body', parent=self.get_toplevel(),
+                                       action=Gtk.FileChooserAction.SAVE)
+        dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
+        dialog.set_current_name(self._suggest_file_name())
+        connections = Gtk.SpinButton.new_with_range(1, 16, 1)
+        connections.set_tooltip_text('Ranges downloaded in parallel, when the server supports them')
+        extra = Gtk.Box(spacing=6)
+        extra.pack_start(Gtk.Label(label='Connections'), False, False, 0)
+        extra.pack_start(connections, False, False, 0)
+        extra.show_all()
+        dialog.set_extra_widget(extra)
+        try:
+            if dialog.run() != Gtk.ResponseType.OK:
+                return
+            path, count = dialog.get_filename(), connections.get_value_as_int()
+        finally:
+            dialog.destroy()
+
+        self.response_container.set_response_spinner_active(True)
+        node, sent_at, previous = self.active_request, time.time(), self.request_model.response
+        self.request_model.download(path, self.main_window.get_variables(), count) \
+            .add_done_callback(lambda _: self._record_history(node, sent_at, previous))
+        log.info('Downloading %s - %s to %s', self.request_model.method, self.request_model.url, path)
+
+    def _suggest_file_name(self) -> str:
+        name = urlsplit(self.request_model.url).path.rstrip('/').rpartition('/')[2]
+        return unquote(name) or 'response'
+
+    def _record_history(self, node: RequestTreeNode, sent_at: float, previous: Optional['requests.Response']):
+        response = node.request.response
+        if response is None or response is previous:
+            return  # The request failed
+
+        submit_write(lambda: HistoryDAO().save_response(node.pk, sent_at, response)) \
+            .add_done_callback(self._handle_history_saved)
+
+    @staticmethod
+    def _handle_history_saved(future):
+        if future.exception():
+            log.error('Failed to save request history %s', future.exception())
+
     def do_request(self, method: str, url: str, params: List[Tuple[str, str]], headers: Dict[str, str], data=None):
+        import requests
+
         try:
             if type(data) is str:
                 data = data.encode('utf-8')
@@ -86,7 +154,7 @@ class RequestEditor(Gtk.Box):
             log.error('Error occurred while sending request %s', e)
             GLib.idle_add(self.response_container.handle_request_finished_exceptionally, e)
 
-    def handle_request_finished(self, response: requests.Response):
+    def handle_request_finished(self, response: 'requests.Response'):
         log.info('Got %s response from %s', response.status_code, self.url_entry.get_text())
         self.last_response = response
         self.response_container.handle_request_finished(response)
@@ -3,13 +3,14 @@ from typing import List
 
 from gi.repository import Gtk
 
+import gresources
 from models import CollectionModel, RequestTreeNode
 from widgets.collection import Collection
 
 log = logging.getLogger(__name__)
 
 
-@Gtk.Template.from_file('ui/RequestList.glade')
+@gresources.template('ui/RequestList.glade')
 class RequestList(Gtk.ListBox):
     __gtype_name__ = "RequestList"
 
@@ -1,21 +1,22 @@
-import json
 import logging
-from io import StringIO
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
-import jsonpath_rw
-import requests
-from gi.repository import Gtk, GtkSource, WebKit2, GObject
-from lxml import etree, html
+from gi.repository import Gtk, GtkSource, GObject
 
-from models import RequestModel
+import filters
+import gresources
+from request_model import RequestModel
+from response_store import RESPONSE_STORE
 from utils import get_content_type, timedelta_fmt, format_response_size, \
-    get_language_for_mime_type
+    get_language_for_mime_type, has_long_line, get_http_version
+
+if TYPE_CHECKING:
+    import requests
 
 log = logging.getLogger(__name__)
 
 
-@Gtk.Template.from_file('ui/ResponseContainer.glade')
+@gresources.template('ui/ResponseContainer.glade')
 class ResponseContainer(Gtk.Overlay):
     __gtype_name__ = 'ResponseContainer'
 
@@ -27,6 +28,9 @@ class ResponseContainer(Gtk.Overlay):
     response_status_label: Gtk.Label = Gtk.Template.Child()
     response_time_label: Gtk.Label = Gtk.Template.Child()
     response_size_label: Gtk.Label = Gtk.Template.Child()
+    response_protocol_label: Gtk.Label = Gtk.Template.Child()
+    response_tests_label: Gtk.Label = Gtk.Template.Child()
+    response_transfer_label: Gtk.Label = Gtk.Template.Child()
 
     response_filter_search_entry: Gtk.SearchEntry = Gtk.Template.Child()
     response_filter_search_bar: Gtk.SearchBar = Gtk.Template.Child()
@@ -39,19 +43,37 @@ class ResponseContainer(Gtk.Overlay):
         super(ResponseContainer, self).__init__()
 
         self.request_model: Optional[RequestModel] = None
-        self.response: Optional[requests.Response] = None
+        self.response: Optional['requests.Response'] = None
         self.lang_manager = GtkSource.LanguageManager()
         self.handler_id = None
+        self.progress_handler_ids = []
 
         style_manager = GtkSource.StyleSchemeManager()
         # scheme: GtkSource.StyleScheme = mgr.get_scheme('classic')
         scheme: GtkSource.StyleScheme = style_manager.get_scheme('kate')
         self.response_text_pretty.get_buffer().set_style_scheme(scheme)
 
-        # TODO: Lazy load the web view
-        self.response_webview: WebKit2.WebView = WebKit2.WebView() \
-            .new_with_context(WebKit2.WebContext().new_ephemeral())
-        self.response_webview_scroll_window.add(self.response_webview)
+        # Created on the first html response, as loading webkit is slow
+        self.response_webview = None
+
+    def _get_response_webview(self):
+        """Creates the web view on first use, returns None if webkit is unavailable."""
+        if self.response_webview is None:
+            try:
+                import gi
+                gi.require_version('WebKit2', '4.0')
+                from gi.repository import WebKit2
+            except (ImportError, ValueError) as e:
+                log.warning('WebKit is unavailable, html responses will not be rendered: %s', e)
+                self.response_webview = False
+                return None
+
+            self.response_webview = WebKit2.WebView() \
+                .new_with_context(WebKit2.WebContext().new_ephemeral())
+            self.response_webview_scroll_window.add(self.response_webview)
+            self.response_webview.show()
+
+        return self.response_webview or None
 
     @Gtk.Template.Callback('on_response_filter_changed')
     def _on_response_filter_changed(self, entry: Gtk.SearchEntry):
@@ -60,60 +82,30 @@ class ResponseContainer(Gtk.Overlay):
             self._set_response_text()
 
         ct = get_content_type(self.response)
+        if ct not in filters.FILTERABLE_TYPES:
+            log.warning('Got unexpected content type %s when filtering response.', ct)
+            return
+
         try:
-            if ct == 'application/json':
-                path_expr = jsonpath_rw.parse(filter_text)
-                j = self.response.json()
-                match_text = json.dumps(
-                    [match.value for match in path_expr.find(j)],
-                    indent=4) or 'No matches found'
-                self.response_text_pretty.get_buffer().set_text(match_text)
-            elif ct in {'text/xml', 'application/xml'}:
-                root = etree.fromstring(self.response.text)
-                matches = root.xpath(filter_text)
-                matches_root = etree.Element('matches')
-                for m in matches:
-                    matches_root.append(m)
-
-                matches_html = etree.tostring(matches_root, encoding='unicode',
-                                              pretty_print=True)
-                self.response_text_pretty.get_buffer().set_text(matches_html)
-            elif ct == 'text/html':
-                root = html.fromstring(self.response.text)
-                matches = root.xpath(filter_text)
-                matches_root = etree.Element('matches')
-                for m in matches:
-                    matches_root.append(m)
-
-                matches_html = etree.tostring(matches_root, encoding='unicode',
-                                              pretty_print=True)
-                self.response_text_pretty.get_buffer().set_text(matches_html)
-            else:
-                log.warning(
-                    'Got unexpected content type %s when filtering response.',
-                    ct)
-        except Exception as e:
-            log.debug('Failed to filter response json %s', e)
+            self.response_text_pretty.get_buffer().set_text(
+                filters.filter_text(ct, self.response.text, filter_text))
+        except filters.FilterError as e:
+            log.debug('Failed to filter response %s', e)
 
     def _get_formatted_response_text(self):
         if not self.response:
             return ""
+        path = getattr(self.response, 'download_path', None)
+        if path:
+            return f'Saved to {path}'
 
         ct = get_content_type(self.response)
         try:
-            txt = GObject.markup_escape_text(self.response.text)
-            if ct == 'application/json':
-                j = self.response.json()
-                txt = json.dumps(j, indent=2)
-            elif ct in {'text/xml', 'application/xml'}:
-                root = etree.fromstring(txt)
-                txt = etree.tostring(root, encoding='unicode',
-                                     pretty_print=True)
-            elif ct == 'text/html':  # TODO: Add css path filters
-                root = html.fromstring(txt)
-                txt = etree.tostring(root, encoding='unicode',
-                                     pretty_print=True)
-            elif not txt:
+            if ct in filters.FILTERABLE_TYPES:
+                txt = filters.pretty_text(ct, self.response.text)
+            else:
+                txt = GObject.markup_escape_text(self.response.text)
+            if not txt:
                 txt = 'Empty Response'
         except Exception as e:
             log.warning('Failed to parse %s response: %s', ct, e)
@@ -158,6 +150,38 @@ class ResponseContainer(Gtk.Overlay):
         size = format_response_size(self.response) if self.response else "-"
         self.response_size_label.set_text(f'Size: {size}')
 
+    def _set_protocol_label(self):
+        version = get_http_version(self.response) if self.response else ''
+        self.response_protocol_label.set_visible(bool(version))
+        self.response_protocol_label.set_text(version)
+
+    def _set_transfer_label(self, request_model: RequestModel = None):
+        download = self.request_model.active_download if self.request_model else None
+        if download:
+            self.response_transfer_label.set_visible(True)
+            self.response_transfer_label.set_text(f'Download: {download.progress.describe()}')
+            return
+
+        progress = self.request_model.upload_progress if self.request_model else None
+        active = progress is not None and not progress.finished
+        self.response_transfer_label.set_visible(active)
+        if active:
+            self.response_transfer_label.set_text(f'Upload: {progress.describe()}')
+
+    def _set_tests_label(self):
+        results = self.request_model.assertion_results if self.response and self.request_model else None
+        self.response_tests_label.set_visible(bool(results))
+        if not results:
+            return
+
+        failed = [r for r in results if not r.passed]
+        markup = f'{len(results) - len(failed)}/{len(results)} passed'
+        if failed:
+            markup = f'<span foreground="red">{markup}</span>'
+        self.response_tests_label.set_markup(f'Tests: {markup}')
+        self.response_tests_label.set_tooltip_text('\n'.join(
+            f'{"✓" if r.passed else "✗"} {r.check} {r.expected} {r.message}'.rstrip() for r in results))
+
     @Gtk.Template.Callback('populate_response_text_context_menu')
     def _populate_response_text_context_menu(self, view: Gtk.TextView,
                                              popup: Gtk.Widget):
@@ -172,8 +196,7 @@ class ResponseContainer(Gtk.Overlay):
         menu.append(word_wrap_toggle)
 
         ct = get_content_type(self.response)
-        if self.response and ct in {'application/json', 'text/html',
-                                    'text/xml', 'application/xml'}:
+        if self.response and ct in filters.FILTERABLE_TYPES:
             show_filter_toggle: Gtk.MenuItem = Gtk.MenuItem().new_with_label(
                 'Show response filter')
             show_filter_toggle.connect('activate',
@@ -202,11 +225,14 @@ class ResponseContainer(Gtk.Overlay):
                 or self.response.request.method != 'GET'
                 or get_content_type(self.response) != 'text/html'
         ):
-            self.response_webview.load_html("")
+            if self.response_webview:
+                self.response_webview.load_html("")
             return
 
-        # TODO: Enable running of javascript
-        self.response_webview.load_html(self.response.text)
+        webview = self._get_response_webview()
+        if webview:
+            # TODO: Enable running of javascript
+            webview.load_html(self.response.text)
 
     def _word_wrap_toggle_clicked(self, btn):
         current = self.response_text_pretty.get_wrap_mode()
@@ -214,6 +240,7 @@ class ResponseContainer(Gtk.Overlay):
         self.response_text_pretty.set_wrap_mode(new)
 
     def handle_request_finished(self, request_model: RequestModel):
+        RESPONSE_STORE.touch(request_model)
         self.response = request_model.response
         try:
             self.fill_response_info()
@@ -224,6 +251,9 @@ class ResponseContainer(Gtk.Overlay):
         self._set_status_label()
         self._set_time_label()
         self._set_size_label()
+        self._set_protocol_label()
+        self._set_tests_label()
+        self._set_transfer_label()
         self._set_headers()
         self._set_response_text_pretty()
         self._set_response_text_raw()
@@ -240,7 +270,7 @@ class ResponseContainer(Gtk.Overlay):
             lang_id = 'xml'  # Full HTML highlighting is very slow; it freezes the UI.
 
         # Disable highlighting for files with really long lines
-        if any((True for line in StringIO(txt) if len(line) > 5000)):
+        if has_long_line(txt, 5000):
             lang_id = 'text'
 
         lang = self.lang_manager.get_language(lang_id)
@@ -257,6 +287,8 @@ class ResponseContainer(Gtk.Overlay):
     def set_request_model(self, request_model: RequestModel):
         if self.handler_id:
             self.request_model.disconnect(self.handler_id)
+            for handler_id in self.progress_handler_ids:
+                self.request_model.disconnect(handler_id)
 
         self.request_model = request_model
         self.response = request_model.response
@@ -265,3 +297,5 @@ class ResponseContainer(Gtk.Overlay):
             "request_finished",
             self.handle_request_finished
         )
+        self.progress_handler_ids = [self.request_model.connect(signal, self._set_transfer_label)
+                                     for signal in ('upload_progress', 'download_progress')]